@@ -3,7 +3,7 @@
 Main entry point for GEMS Exchange MCP Server
 """
 
-from server import mcp
+from server import main
 
 if __name__ == "__main__":
-    mcp.run(transport="stdio")
\ No newline at end of file
+    main()
@@ -0,0 +1,223 @@
+"""
+Tiled raster aggregation: bbox splitting and merging of partial results
+
+Large areas are split into tiles whose edges fall on the object's pixel
+boundaries, so every pixel belongs to exactly one tile. Statistics, value
+counts and histograms built from value counts then merge exactly. Quantiles,
+and histograms of continuous layers, are built from each tile's quantile
+function and are approximate: the rank error is at most 1/QUANTILE_RESOLUTION.
+"""
+import math
+from bisect import bisect_right
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import grid
+
+# Quantile probabilities requested per tile are 0, 1/N, ..., 1
+QUANTILE_RESOLUTION = 100
+
+# Inner tile edges are pulled this fraction of a pixel away from the shared boundary
+EDGE_INSET = 0.01
+
+
+def parse_bbox(bbox: str) -> Tuple[float, float, float, float]:
+    """Parse 'minx,miny,maxx,maxy' into floats."""
+    try:
+        minx, miny, maxx, maxy = (float(v) for v in bbox.split(","))
+    except ValueError:
+        raise ValueError(f"Invalid bbox '{bbox}', expected 'minx,miny,maxx,maxy'")
+    if minx >= maxx or miny >= maxy:
+        raise ValueError(f"Invalid bbox '{bbox}', min must be below max")
+    return minx, miny, maxx, maxy
+
+
+def split_bbox(bbox: str, details: Dict[str, Any], max_pixels: int) -> List[str]:
+    """
+    Split a lon/lat bbox into tiles of at most max_pixels grid cells.
+
+    details is the object's grid metadata (ul_x, ul_y, scale, srid). Tile edges are
+    placed on pixel boundaries and inset slightly, so a pixel is never clipped by
+    two neighbouring tiles.
+    """
+    grid.require_numpy()
+    minx, miny, maxx, maxy = parse_bbox(bbox)
+    scale, srid = details["scale"], details["srid"]
+    x, y = grid.project([minx, maxx], [miny, maxy], srid)
+    col0, col1 = math.floor((x[0] - details["ul_x"]) / scale), math.ceil((x[1] - details["ul_x"]) / scale)
+    row0, row1 = math.floor((details["ul_y"] - y[1]) / scale), math.ceil((details["ul_y"] - y[0]) / scale)
+    width, height = max(1, col1 - col0), max(1, row1 - row0)
+    tiles = max(1, math.ceil(width * height / max(1, max_pixels)))
+    # Prefer square tiles: split the longer side more often
+    ncols = max(1, min(width, tiles, round(math.sqrt(tiles * width / height))))
+    nrows = max(1, min(height, math.ceil(tiles / ncols)))
+    col_edges = _edges(col0, width, ncols)
+    row_edges = _edges(row0, height, nrows)
+
+    inset = EDGE_INSET * scale
+    xs = [details["ul_x"] + c * scale for c in col_edges]
+    ys = [details["ul_y"] - r * scale for r in row_edges]
+    lons_lo, _ = grid.unproject([v + inset for v in xs[:-1]], [0.0] * (len(xs) - 1), srid)
+    lons_hi, _ = grid.unproject([v - inset for v in xs[1:]], [0.0] * (len(xs) - 1), srid)
+    _, lats_hi = grid.unproject([0.0] * (len(ys) - 1), [v - inset for v in ys[:-1]], srid)
+    _, lats_lo = grid.unproject([0.0] * (len(ys) - 1), [v + inset for v in ys[1:]], srid)
+
+    result = []
+    for i in range(nrows):
+        for j in range(ncols):
+            # Outer edges keep the caller's bbox
+            lo_x = minx if j == 0 else float(lons_lo[j])
+            hi_x = maxx if j == ncols - 1 else float(lons_hi[j])
+            hi_y = maxy if i == 0 else float(lats_hi[i])
+            lo_y = miny if i == nrows - 1 else float(lats_lo[i])
+            result.append(f"{lo_x:.8f},{lo_y:.8f},{hi_x:.8f},{hi_y:.8f}")
+    return result
+
+
+def _edges(start: int, length: int, parts: int) -> List[int]:
+    return [start + (length * k) // parts for k in range(parts + 1)]
+
+
+def merge_stats(parts: Sequence[Optional[Dict[str, Any]]]) -> Optional[Dict[str, Any]]:
+    """Combine per-tile count/sum/mean/stddev/min/max (population stddev)."""
+    parts = [p for p in parts if p and p.get("count")]
+    if not parts:
+        return None
+    count = sum(p["count"] for p in parts)
+    total = sum(p["sum"] if p.get("sum") is not None else p["mean"] * p["count"] for p in parts)
+    mean = total / count
+    # Pooled sum of squared deviations
+    m2 = sum(p["count"] * ((p.get("stddev") or 0.0) ** 2 + (p["mean"] - mean) ** 2) for p in parts)
+    return {
+        "count": count,
+        "sum": total,
+        "mean": mean,
+        "stddev": math.sqrt(max(0.0, m2 / count)),
+        "min": min(p["min"] for p in parts),
+        "max": max(p["max"] for p in parts),
+    }
+
+
+def merge_value_counts(parts: Sequence[Optional[List[Dict[str, Any]]]]) -> List[Dict[str, Any]]:
+    """Sum value counts across tiles."""
+    counts: Dict[float, int] = {}
+    for part in parts:
+        for item in part or []:
+            counts[item["value"]] = counts.get(item["value"], 0) + item["count"]
+    return [{"value": value, "count": counts[value]} for value in sorted(counts)]
+
+
+def histogram_from_counts(value_counts: List[Dict[str, Any]], nbin: int) -> List[Dict[str, Any]]:
+    """Bin value counts into nbin equal-width bins between the minimum and maximum value."""
+    if not value_counts:
+        return []
+    lo, hi = value_counts[0]["value"], value_counts[-1]["value"]
+    nbin = max(1, nbin) if hi > lo else 1
+    width = (hi - lo) / nbin
+    bins = [0] * nbin
+    for item in value_counts:
+        index = min(int((item["value"] - lo) / width), nbin - 1) if width else 0
+        bins[index] += item["count"]
+    total = sum(bins)
+    return [
+        {
+            "min": lo + k * width,
+            "max": hi if k == nbin - 1 else lo + (k + 1) * width,
+            "count": count,
+            "percent": 100.0 * count / total,
+        }
+        for k, count in enumerate(bins)
+    ]
+
+
+def quantile_probabilities() -> List[float]:
+    """Probabilities requested from each tile for quantile merging."""
+    return [k / QUANTILE_RESOLUTION for k in range(QUANTILE_RESOLUTION + 1)]
+
+
+def merge_quantiles(
+    parts: Sequence[Tuple[int, Optional[List[Dict[str, Any]]]]],
+    probabilities: Sequence[float]
+) -> List[Dict[str, Any]]:
+    """
+    Approximate quantiles of the union of tiles.
+
+    Each part is (pixel count, quantiles at quantile_probabilities()). The tile CDFs
+    are interpolated linearly between known quantiles, weighted by pixel count, and
+    the combined CDF is inverted by bisection.
+    """
+    curves = _curves(parts)
+    if not curves:
+        return []
+    total = sum(count for count, _, _ in curves)
+    lo = min(values[0] for _, _, values in curves)
+    hi = max(values[-1] for _, _, values in curves)
+
+    def cdf(v: float) -> float:
+        return sum(count * _curve_cdf(probs, values, v) for count, probs, values in curves) / total
+
+    result = []
+    for p in probabilities:
+        a, b = lo, hi
+        for _ in range(64):
+            mid = (a + b) / 2
+            if cdf(mid) >= p:
+                b = mid
+            else:
+                a = mid
+            if b - a <= 1e-12 * max(1.0, abs(b)):
+                break
+        result.append({"quantile": p, "value": b})
+    return result
+
+
+def histogram_from_quantiles(
+    parts: Sequence[Tuple[int, Optional[List[Dict[str, Any]]]]],
+    nbin: int
+) -> List[Dict[str, Any]]:
+    """
+    Approximate an nbin equal-width histogram of the union of tiles.
+
+    Parts are as for merge_quantiles. Bin edges span the smallest and largest
+    tile values, and each bin holds the pixels the combined CDF puts in it.
+    """
+    curves = _curves(parts)
+    if not curves:
+        return []
+    total = sum(count for count, _, _ in curves)
+    lo = min(values[0] for _, _, values in curves)
+    hi = max(values[-1] for _, _, values in curves)
+    nbin = max(1, nbin) if hi > lo else 1
+    width = (hi - lo) / nbin
+    below = 0
+    bins = []
+    for k in range(nbin):
+        upper = hi if k == nbin - 1 else lo + (k + 1) * width
+        cumulative = round(sum(count * _curve_cdf(probs, values, upper) for count, probs, values in curves))
+        bins.append({
+            "min": lo + k * width,
+            "max": upper,
+            "count": cumulative - below,
+            "percent": 100.0 * (cumulative - below) / total,
+        })
+        below = cumulative
+    return bins
+
+
+def _curves(parts: Sequence[Tuple[int, Optional[List[Dict[str, Any]]]]]) -> List[Tuple[int, List[float], List[float]]]:
+    """(pixel count, probabilities, values) for each tile with a usable quantile function."""
+    curves = []
+    for count, quantiles in parts:
+        if count and quantiles:
+            points = sorted((q["quantile"], q["value"]) for q in quantiles)
+            curves.append((count, [p for p, _ in points], [v for _, v in points]))
+    return curves
+
+
+def _curve_cdf(probs: List[float], values: List[float], v: float) -> float:
+    if v < values[0]:
+        return 0.0
+    if v >= values[-1]:
+        return 1.0
+    k = bisect_right(values, v)
+    p0, p1, v0, v1 = probs[k - 1], probs[k], values[k - 1], values[k]
+    return p0 + (p1 - p0) * (v - v0) / (v1 - v0)
@@ -0,0 +1,284 @@
+"""
+Offline stand-in for the GEMS Exchange APIs
+
+Routes and response shapes come from the OpenAPI specs bundled in
+exchange_docs.txt. Each documented 200 response is generated once per payload
+size from its schema (arrays get `items` elements) and served from memory, so
+the mock adds almost no CPU time of its own. Latency, jitter and failures are
+injected per request. Raster routes return an opaque binary body.
+
+    upstream = MockUpstream.from_docs(latency=0.02, items=50)
+    client = httpx.AsyncClient(base_url="https://mock", transport=upstream.transport())
+"""
+import asyncio
+import json
+import random
+import re
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple, Union
+
+import httpx
+
+DOCS_PATH = Path(__file__).resolve().parent.parent / "exchange_docs.txt"
+
+# Values for fields whose generated value must be coherent for the server to use it
+# (EASE-Grid 2.0 level-5 grid details, catchment ids, coordinates)
+FIELD_VALUES: Dict[str, Any] = {
+    "srid": 6933,
+    "scale": 1000.89502334956,
+    "ul_x": -17367530.4451615,
+    "ul_y": 7314540.83097007,
+    "width": 34704,
+    "height": 14616,
+    "grid_id": 5,
+    "lat": 44.97,
+    "lon": -93.26,
+    "latitude": 44.97,
+    "longitude": -93.26,
+    "down_cat": 0,
+    "quantile": 0.5,
+}
+
+
+@dataclass
+class Route:
+    """One documented operation of an Exchange API."""
+    method: str
+    template: str
+    pattern: "re.Pattern[str]"
+    query: Tuple[str, ...]
+    schema: Optional[Dict[str, Any]]
+    components: Dict[str, Any]
+    binary: bool
+    # Position in the spec, so fallbacks prefer the first documented variant
+    order: int
+    # Encoded bodies by payload size
+    bodies: Dict[int, bytes] = field(default_factory=dict)
+
+    @property
+    def specificity(self) -> Tuple[int, int, int]:
+        # Literal segments beat templated ones; more matched query names beat fewer
+        return (-self.template.count("{"), len(re.sub(r"\{[^}]*\}", "", self.template)), len(self.query))
+
+
+def load_specs(path: Union[str, Path] = DOCS_PATH) -> List[Dict[str, Any]]:
+    """Read every OpenAPI document in a file of concatenated (pretty or single-line) JSON."""
+    text = Path(path).read_text()
+    decoder = json.JSONDecoder()
+    specs = []
+    pos = 0
+    while pos < len(text):
+        if text[pos].isspace():
+            pos += 1
+            continue
+        if text[pos] == "{":
+            spec, pos = decoder.raw_decode(text, pos)
+            if isinstance(spec, dict) and "paths" in spec:
+                specs.append(spec)
+            continue
+        # Skip non-JSON lines such as spec URLs
+        newline = text.find("\n", pos)
+        pos = len(text) if newline < 0 else newline + 1
+    return specs
+
+
+def build_routes(specs: List[Dict[str, Any]]) -> List[Route]:
+    """Turn the specs' server prefixes and path templates into matchable routes."""
+    routes = []
+    for spec in specs:
+        prefix = (spec.get("servers") or [{"url": ""}])[0]["url"].rstrip("/")
+        components = (spec.get("components") or {}).get("schemas") or {}
+        for template, operations in spec["paths"].items():
+            path_part, _, query_part = template.partition("?")
+            query = tuple(re.findall(r"([^&=]+)=\{[^}]*\}", query_part))
+            full = prefix + path_part
+            regex = "".join(
+                "[^/]+" if piece.startswith("{") else re.escape(piece)
+                for piece in re.split(r"(\{[^}]*\})", full)
+            )
+            for method, operation in operations.items():
+                if not isinstance(operation, dict) or "responses" not in operation:
+                    continue
+                response = operation["responses"].get("200") or {}
+                content = response.get("content") or {}
+                schema = (content.get("application/json") or {}).get("schema")
+                routes.append(Route(
+                    method=method.upper(),
+                    template=full + (f"?{query_part}" if query_part else ""),
+                    pattern=re.compile(f"^{regex}$"),
+                    query=query,
+                    schema=schema,
+                    components=components,
+                    binary=path_part.endswith("/raster") or "application/json" not in content,
+                    order=len(routes),
+                ))
+    routes.sort(key=lambda r: r.specificity, reverse=True)
+    return routes
+
+
+class SchemaSampler:
+    """Generate a JSON value that satisfies an OpenAPI schema."""
+
+    def __init__(self, components: Dict[str, Any], items: int, seed: int = 0):
+        self.components = components
+        self.items = items
+        self.rng = random.Random(seed)
+
+    def sample(self, schema: Optional[Dict[str, Any]], name: str = "", arrays: int = 0, refs: Tuple[str, ...] = ()) -> Any:
+        if not schema:
+            return {"value": round(self.rng.uniform(0, 100), 3)}
+        if "$ref" in schema:
+            ref = schema["$ref"].rsplit("/", 1)[-1]
+            if refs.count(ref) >= 2:
+                return None
+            return self.sample(self.components.get(ref), name, arrays, refs + (ref,))
+        if name in FIELD_VALUES:
+            return FIELD_VALUES[name]
+        if "example" in schema and not isinstance(schema["example"], (dict, list)):
+            return schema["example"]
+        for key in ("anyOf", "oneOf"):
+            if key in schema:
+                branches = [b for b in schema[key] if b.get("type") != "null"] or schema[key]
+                return self.sample(branches[0], name, arrays, refs)
+        if "allOf" in schema:
+            merged: Dict[str, Any] = {}
+            for branch in schema["allOf"]:
+                value = self.sample(branch, name, arrays, refs)
+                if isinstance(value, dict):
+                    merged.update(value)
+            return merged
+        if "enum" in schema:
+            return schema["enum"][0]
+
+        kind = schema.get("type")
+        if kind == "array" or "items" in schema:
+            # Only the outermost arrays scale with the payload size
+            count = self.items if arrays == 0 else min(self.items, 3)
+            return [self.sample(schema.get("items"), name, arrays + 1, refs) for _ in range(count)]
+        if kind == "object" or "properties" in schema:
+            properties = schema.get("properties") or {}
+            if properties:
+                return {key: self.sample(value, key, arrays, refs) for key, value in properties.items()}
+            if isinstance(schema.get("example"), dict):
+                # Free-form objects such as GeoJSON envelopes
+                return schema["example"]
+            extra = schema.get("additionalProperties")
+            if isinstance(extra, dict):
+                return {f"key{i}": self.sample(extra, "", arrays, refs) for i in range(min(self.items, 3))}
+            return {}
+        if kind == "integer":
+            return self.rng.randint(1, 1000)
+        if kind == "number":
+            return round(self.rng.uniform(0, 100), 3)
+        if kind == "boolean":
+            return True
+        if kind == "string":
+            fmt = schema.get("format")
+            if fmt == "date":
+                return "2024-06-01"
+            if fmt == "date-time":
+                return "2024-06-01T12:00:00"
+            return f"{name or 'value'}-{self.rng.randint(1, 1000)}"
+        return None
+
+
+class MockUpstream:
+    """httpx transport handler that serves spec-shaped responses with injected latency and errors."""
+
+    def __init__(
+        self,
+        routes: List[Route],
+        latency: float = 0.0,
+        jitter: float = 0.0,
+        items: int = 10,
+        raster_bytes: int = 256 * 1024,
+        error_rate: float = 0.0,
+        error_status: Union[int, str] = 503,
+        seed: int = 0
+    ):
+        self.routes = routes
+        self.latency = latency
+        self.jitter = jitter
+        self.items = items
+        self.raster_bytes = raster_bytes
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.seed = seed
+        self.rng = random.Random(seed)
+        self.requests = 0
+        self.errors = 0
+        self.unmatched = 0
+        self.bytes_sent = 0
+
+    @classmethod
+    def from_docs(cls, path: Union[str, Path] = DOCS_PATH, **options: Any) -> "MockUpstream":
+        """Create a mock serving every route documented in exchange_docs.txt."""
+        return cls(build_routes(load_specs(path)), **options)
+
+    def transport(self) -> httpx.MockTransport:
+        return httpx.MockTransport(self.handle)
+
+    def match(self, method: str, path: str, params: Dict[str, str]) -> Optional[Route]:
+        """Find the most specific documented route for a request."""
+        candidates = [r for r in self.routes if r.pattern.match(path)]
+        if not candidates:
+            # Undocumented sub-resources (e.g. /forecast) fall back to their nearest documented child
+            candidates = sorted(
+                (r for r in self.routes if r.template.startswith(path + "/")), key=lambda r: r.order
+            )
+            if candidates:
+                self.unmatched += 1
+        for route in candidates:
+            if route.method == method and set(route.query) <= set(params):
+                return route
+        same_method = [r for r in candidates if r.method == method]
+        return (same_method or candidates or [None])[0]
+
+    def body(self, route: Route) -> bytes:
+        body = route.bodies.get(self.items)
+        if body is None:
+            if route.binary:
+                # Opaque raster bytes with a TIFF header
+                body = b"II*\x00" + random.Random(self.seed).randbytes(max(0, self.raster_bytes - 4))
+            else:
+                sampler = SchemaSampler(route.components, self.items, self.seed)
+                body = json.dumps(sampler.sample(route.schema)).encode()
+            route.bodies[self.items] = body
+        return body
+
+    async def handle(self, request: httpx.Request) -> httpx.Response:
+        self.requests += 1
+        delay = self.latency + (self.rng.uniform(-self.jitter, self.jitter) if self.jitter else 0.0)
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+        if self.error_rate and self.rng.random() < self.error_rate:
+            self.errors += 1
+            if self.error_status == "timeout":
+                raise httpx.ReadTimeout("Injected timeout", request=request)
+            if self.error_status == "transport":
+                raise httpx.ConnectError("Injected connection failure", request=request)
+            return httpx.Response(int(self.error_status), json={"detail": "Injected failure"})
+
+        route = self.match(request.method, request.url.path, dict(request.url.params))
+        if route is None:
+            self.errors += 1
+            return httpx.Response(404, json={"detail": "Not Found"})
+        body = self.body(route)
+        self.bytes_sent += len(body)
+        content_type = "image/tiff" if route.binary else "application/json"
+        return httpx.Response(200, content=body, headers={"content-type": content_type})
+
+    def set_items(self, items: int) -> None:
+        """Change the payload size; bodies for each size are generated once."""
+        self.items = items
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "routes": len(self.routes),
+            "requests": self.requests,
+            "injected_or_unknown_errors": self.errors,
+            "undocumented_fallbacks": self.unmatched,
+            "bytes_sent": self.bytes_sent,
+        }
@@ -0,0 +1,437 @@
+#!/usr/bin/env python3
+"""
+Offline benchmarks for the GEMS Exchange MCP tools
+
+Every tool registered in server.py is called through FastMCP (argument
+validation and result serialization included) against the mock upstream in
+mock_upstream.py. For each tool the suite measures:
+
+- serial latency (p50/p99/mean) and throughput
+- latency and throughput with N concurrent sessions
+- peak memory allocated per call (tracemalloc)
+- upstream bytes and JSON decode time with large payloads
+
+Results are written as JSON. With --compare, a previous result file is used as
+the baseline and the run exits with status 1 when a tool regresses by more than
+--threshold.
+
+    python benchmarks/run.py --output results.json
+    python benchmarks/run.py --compare results.json --threshold 0.25
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+
+from mock_upstream import MockUpstream  # noqa: E402
+
+SITE = (44.97, -93.26)
+BBOX = "-93.5,44.8,-93.0,45.1"
+POLYGON = {
+    "type": "Polygon",
+    "coordinates": [[[-93.5, 44.8], [-93.0, 44.8], [-93.0, 45.1], [-93.5, 45.1], [-93.5, 44.8]]],
+}
+SITES = [[44.97 + i * 0.05, -93.26 - i * 0.05] for i in range(10)]
+RASTER = {"api_type": "soil", "dataset_name": "soil_organic_carbon", "object_id": 4}
+# Inside the example envelope the mock returns for every object
+ENVELOPE_SITES = [[47.8 + i * 0.02, -92.5 - i * 0.05] for i in range(10)]
+
+# Arguments used for each tool
+FIXTURES: Dict[str, Dict[str, Any]] = {
+    "weather_current": {"latitude": SITE[0], "longitude": SITE[1]},
+    "weather_current_batch": {"points": SITES, "stations": ["KMSP", "KRDU"]},
+    "weather_alerts": {"latitude": SITE[0], "longitude": SITE[1]},
+    "weather_forecast": {"latitude": SITE[0], "longitude": SITE[1], "days": 7},
+    "weather_historical": {"latitude": SITE[0], "longitude": SITE[1], "start_date": "2024-06-01", "end_date": "2024-06-07"},
+    "weather_history_series": {
+        "latitude": SITE[0], "longitude": SITE[1], "start_date": "2024-01-01", "end_date": "2024-03-31",
+    },
+    "watchlist_add": {"name": "benchmark-site", "latitude": SITE[0], "longitude": SITE[1]},
+    "watchlist_list": {},
+    "watchlist_remove": {"name": "benchmark-site"},
+    "plant_variety_search": {"variety_name": "MN-Washburn", "pedigree_depth": 5},
+    "coefficient_parentage": {"variety_names": ["MN-Washburn", "Linkert", "Shelly", "Lang-MN"], "max_depth": 10},
+    "climate_datasets": {},
+    "grid_info": {"grid_id": 5},
+    "soil_datasets": {},
+    "landcover_datasets": {},
+    "elevation_datasets": {},
+    "crop_datasets": {},
+    "hydro_datasets": {},
+    "market_datasets": {},
+    "biotic_risk_datasets": {},
+    "catalog_search": {"query": "soil organic carbon 100m", "limit": 10},
+    "dataset_layers": {"api_type": "soil", "dataset_name": "soil_organic_carbon"},
+    "spatial_data_search": {"api_type": "soil", "dataset_name": "soil_organic_carbon", "bbox": BBOX, "limit": 100},
+    "spatial_point_data": {**RASTER, "latitude": SITE[0], "longitude": SITE[1]},
+    "spatial_point_sample": {**RASTER, "points": SITES},
+    "spatial_point_lookup": {"api_type": "soil", "dataset_name": "soil_organic_carbon", "points": ENVELOPE_SITES},
+    "spatial_point_table": {
+        "sites": SITES,
+        "layers": [
+            {"api_type": "soil", "dataset": "soil_organic_carbon", "object_id": 4},
+            {"api_type": "elevation", "dataset": "dem", "object_id": 1},
+        ],
+    },
+    "spatial_raster": {**RASTER, "bbox": BBOX},
+    "spatial_stats": {**RASTER, "bbox": BBOX},
+    "spatial_histogram": {**RASTER, "bbox": BBOX, "nbin": 10},
+    "spatial_quantiles": {**RASTER, "geometry": POLYGON, "quantiles": [0.1, 0.5, 0.9]},
+    "spatial_value_counts": {**RASTER, "bbox": BBOX, "tiled": True},
+    "hydro_catchment_at_point": {"latitude": 46.7, "longitude": -92.1},
+    "hydro_catchment": {"catchment_id": "1001"},
+    "hydro_lake_catchment": {"lake_id": "69037600"},
+    "hydro_catchment_network": {"catchment_id": "1001", "direction": "upstream"},
+    "hydro_catchment_geometry": {"catchment_id": "1001"},
+    "cache_stats": {},
+    "upstream_status": {},
+    "server_metrics": {"format": "openmetrics"},
+}
+
+
+def configure_environment(args: argparse.Namespace, scratch: str) -> None:
+    """Settings that must be in place before server.py (and config.py) are imported."""
+    os.environ.setdefault("GEMS_EXCHANGE_API_KEY", "benchmark")
+    os.environ["GEMS_RATE_LIMIT"] = "0"
+    os.environ["GEMS_RATE_LIMITS"] = ""
+    os.environ["GEMS_RASTER_DIR"] = os.path.join(scratch, "rasters")
+    os.environ["GEMS_CACHE_DIR"] = ""
+    os.environ["GEMS_METRICS_FILE"] = ""
+    os.environ["GEMS_WATCHLIST_FILE"] = os.path.join(scratch, "watchlist.json")
+    # The catalog loads on the first catalog_search instead of competing with the measured calls
+    os.environ["GEMS_CATALOG_PRELOAD"] = "false"
+    os.environ.setdefault("GEMS_RETRY_BASE_DELAY", "0.01")
+    os.environ.setdefault("GEMS_RETRY_MAX_DELAY", "0.05")
+    if not args.warm_cache:
+        # Every call goes upstream
+        for route_class in ("GRID", "CATALOG", "OBJECT", "PEDIGREE", "HISTORY", "FORECAST", "CURRENT", "ALERTS", "DEFAULT"):
+            os.environ[f"GEMS_CACHE_TTL_{route_class}"] = "0"
+        os.environ["GEMS_HISTORY_DAY_TTL"] = "0"
+
+
+def percentile(samples: List[float], q: float) -> Optional[float]:
+    if not samples:
+        return None
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, max(0, round(q * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def latency_summary(samples: List[float]) -> Dict[str, Any]:
+    def ms(value: Optional[float]) -> Optional[float]:
+        return None if value is None else round(value * 1000, 3)
+    return {
+        "count": len(samples),
+        "mean_ms": ms(statistics.fmean(samples)) if samples else None,
+        "p50_ms": ms(percentile(samples, 0.5)),
+        "p99_ms": ms(percentile(samples, 0.99)),
+    }
+
+
+class Bench:
+    """Runs the benchmark phases against the server's registered tools."""
+
+    def __init__(self, server: Any, upstream: MockUpstream, args: argparse.Namespace):
+        self.server = server
+        self.upstream = upstream
+        self.args = args
+        self.metrics = server.metrics
+
+    async def call(self, name: str) -> Tuple[float, int]:
+        """Call a tool once. Returns (seconds, serialized result bytes)."""
+        start = time.perf_counter()
+        result = await self.server.mcp.call_tool(name, FIXTURES[name])
+        elapsed = time.perf_counter() - start
+        blocks = result[0] if isinstance(result, tuple) else result
+        size = sum(len(getattr(block, "text", "") or "") for block in blocks) if isinstance(blocks, list) else 0
+        return elapsed, size
+
+    def counters(self, name: str) -> Dict[str, float]:
+        """Running totals used to attribute errors, upstream bytes and decode/encode time to a phase."""
+        return {
+            "errors": sum(n for (tool, _), n in self.metrics.tool_errors.items() if tool == name),
+            "upstream_requests": sum(h.count for h in self.metrics.upstream_latency.values()),
+            "response_bytes": sum(h.sum for h in self.metrics.response_bytes.values()),
+            "decode_seconds": sum(h.sum for h in self.metrics.decode_latency.values()),
+            "decodes": sum(h.count for h in self.metrics.decode_latency.values()),
+            "encode_seconds": sum(h.sum for h in self.metrics.encode_latency.values()),
+            "passthrough": sum(self.metrics.passthrough.values()),
+        }
+
+    def delta(self, before: Dict[str, float], name: str) -> Dict[str, float]:
+        after = self.counters(name)
+        return {key: after[key] - before[key] for key in before}
+
+    async def serial(self, name: str) -> Dict[str, Any]:
+        before = self.counters(name)
+        samples = []
+        size = 0
+        start = time.perf_counter()
+        for _ in range(self.args.iterations):
+            elapsed, size = await self.call(name)
+            samples.append(elapsed)
+        wall = time.perf_counter() - start
+        delta = self.delta(before, name)
+        return {
+            **latency_summary(samples),
+            "throughput_per_s": round(len(samples) / wall, 2),
+            "errors": int(delta["errors"]),
+            "upstream_requests_per_call": round(delta["upstream_requests"] / len(samples), 2),
+            "result_bytes": size,
+        }
+
+    async def concurrent(self, name: str, sessions: int) -> Dict[str, Any]:
+        before = self.counters(name)
+        samples: List[float] = []
+
+        async def session() -> None:
+            for _ in range(self.args.calls_per_session):
+                elapsed, _ = await self.call(name)
+                samples.append(elapsed)
+
+        start = time.perf_counter()
+        await asyncio.gather(*(session() for _ in range(sessions)))
+        wall = time.perf_counter() - start
+        return {
+            **latency_summary(samples),
+            "throughput_per_s": round(len(samples) / wall, 2),
+            "errors": int(self.delta(before, name)["errors"]),
+        }
+
+    async def memory(self, name: str) -> Dict[str, Any]:
+        peaks = []
+        tracemalloc.start()
+        try:
+            for _ in range(self.args.memory_calls):
+                tracemalloc.reset_peak()
+                baseline, _ = tracemalloc.get_traced_memory()
+                await self.call(name)
+                _, peak = tracemalloc.get_traced_memory()
+                peaks.append(peak - baseline)
+        finally:
+            tracemalloc.stop()
+        return {"peak_bytes_per_call": int(statistics.median(peaks))}
+
+    async def large_payload(self, name: str) -> Dict[str, Any]:
+        self.upstream.set_items(self.args.large_items)
+        try:
+            before = self.counters(name)
+            samples = []
+            size = 0
+            for _ in range(self.args.large_calls):
+                elapsed, size = await self.call(name)
+                samples.append(elapsed)
+            delta = self.delta(before, name)
+        finally:
+            self.upstream.set_items(self.args.items)
+        calls = len(samples)
+        return {
+            "items": self.args.large_items,
+            **latency_summary(samples),
+            "upstream_bytes_per_call": int(delta["response_bytes"] / calls),
+            "json_decode_ms_per_call": round(delta["decode_seconds"] * 1000 / calls, 3),
+            "json_decodes_per_call": round(delta["decodes"] / calls, 2),
+            "json_encode_ms_per_call": round(delta["encode_seconds"] * 1000 / calls, 3),
+            "passthrough_per_call": round(delta["passthrough"] / calls, 2),
+            "result_bytes": size,
+        }
+
+    async def tool(self, name: str) -> Dict[str, Any]:
+        # One untimed call loads lazily built state (grids, graphs, raster files)
+        await self.call(name)
+        result = {"serial": await self.serial(name)}
+        result["concurrent"] = {str(n): await self.concurrent(name, n) for n in self.args.sessions}
+        result["memory"] = await self.memory(name)
+        result["large_payload"] = await self.large_payload(name)
+        return result
+
+
+async def run(args: argparse.Namespace) -> Dict[str, Any]:
+    scratch = tempfile.mkdtemp(prefix="gems-bench-")
+    configure_environment(args, scratch)
+    import httpx
+    import logging
+    logging.getLogger("httpx").setLevel(logging.WARNING)
+
+    import_start = time.perf_counter()
+    import server
+    import_seconds = time.perf_counter() - import_start
+
+    upstream = MockUpstream.from_docs(
+        latency=args.latency_ms / 1000,
+        jitter=args.jitter_ms / 1000,
+        items=args.items,
+        raster_bytes=args.raster_kb * 1024,
+        error_rate=args.error_rate,
+        error_status=int(args.error_status) if args.error_status.isdigit() else args.error_status,
+        seed=args.seed,
+    )
+    server.client = httpx.AsyncClient(
+        base_url="https://exchange.mock", transport=upstream.transport(), headers=server.Config.get_headers()
+    )
+
+    registered = [t.name for t in await server.mcp.list_tools()]
+    missing = [name for name in registered if name not in FIXTURES]
+    selected = [name for name in registered if name in FIXTURES and (not args.tools or name in args.tools)]
+    bench = Bench(server, upstream, args)
+
+    tools = {}
+    for name in selected:
+        print(f"  {name} ...", file=sys.stderr, flush=True)
+        tools[name] = await bench.tool(name)
+    await server.client.aclose()
+
+    return {
+        "meta": {
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+            "commit": _git_commit(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "server_import_ms": round(import_seconds * 1000, 1),
+            "settings": {
+                key: value for key, value in vars(args).items() if key not in ("output", "compare", "tools")
+            },
+            "untested_tools": missing,
+            "upstream": upstream.stats(),
+        },
+        "tools": tools,
+    }
+
+
+def _git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+# (phase path, metric, True when higher is better)
+COMPARED = [
+    (("serial",), "p50_ms", False),
+    (("serial",), "p99_ms", False),
+    (("serial",), "throughput_per_s", True),
+    (("memory",), "peak_bytes_per_call", False),
+    (("large_payload",), "p50_ms", False),
+    (("large_payload",), "json_decode_ms_per_call", False),
+    (("large_payload",), "json_encode_ms_per_call", False),
+]
+
+
+def compare(current: Dict[str, Any], baseline: Dict[str, Any], threshold: float) -> List[Dict[str, Any]]:
+    """List metrics that got worse than the baseline by more than threshold (a fraction)."""
+    checks = list(COMPARED)
+    for sessions in current["meta"]["settings"]["sessions"]:
+        checks.append((("concurrent", str(sessions)), "p99_ms", False))
+        checks.append((("concurrent", str(sessions)), "throughput_per_s", True))
+
+    regressions = []
+    for name, result in current["tools"].items():
+        base = baseline.get("tools", {}).get(name)
+        if base is None:
+            continue
+        for phase, metric, higher_is_better in checks:
+            new, old = _lookup(result, phase, metric), _lookup(base, phase, metric)
+            if not new or not old:
+                continue
+            change = (old - new) / old if higher_is_better else (new - old) / old
+            if change > threshold:
+                regressions.append({
+                    "tool": name,
+                    "metric": ".".join(phase + (metric,)),
+                    "baseline": old,
+                    "current": new,
+                    "change": round(change, 3),
+                })
+    return regressions
+
+
+def _lookup(result: Dict[str, Any], phase: Tuple[str, ...], metric: str) -> Optional[float]:
+    for key in phase:
+        result = result.get(key) or {}
+    return result.get(metric)
+
+
+def print_summary(results: Dict[str, Any]) -> None:
+    sessions = results["meta"]["settings"]["sessions"]
+    top = str(max(sessions))
+    print(f"{'tool':32} {'p50 ms':>9} {'p99 ms':>9} {'calls/s':>9} {f'p99@{top}':>9} {f'calls/s@{top}':>13} {'peak KiB':>9} {'decode ms':>10} {'errors':>6}")
+    for name, result in results["tools"].items():
+        serial, busy, large = result["serial"], result["concurrent"][top], result["large_payload"]
+        print(
+            f"{name:32} {serial['p50_ms']:>9} {serial['p99_ms']:>9} {serial['throughput_per_s']:>9} "
+            f"{busy['p99_ms']:>9} {busy['throughput_per_s']:>13} {result['memory']['peak_bytes_per_call'] // 1024:>9} "
+            f"{large['json_decode_ms_per_call']:>10} {serial['errors'] + busy['errors']:>6}"
+        )
+    if results["meta"]["untested_tools"]:
+        print(f"No fixture for: {', '.join(results['meta']['untested_tools'])}")
+
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Benchmark the GEMS Exchange MCP tools against a mock upstream.")
+    parser.add_argument("--tools", nargs="*", help="Only benchmark these tools")
+    parser.add_argument("--iterations", type=int, default=30, help="Serial calls per tool")
+    parser.add_argument("--sessions", type=int, nargs="+", default=[1, 8, 32], help="Concurrent session counts")
+    parser.add_argument("--calls-per-session", type=int, default=5, help="Calls made by each concurrent session")
+    parser.add_argument("--memory-calls", type=int, default=3, help="Calls traced for peak memory")
+    parser.add_argument("--latency-ms", type=float, default=20.0, help="Mock upstream latency")
+    parser.add_argument("--jitter-ms", type=float, default=5.0, help="Uniform +/- jitter on the latency")
+    parser.add_argument("--items", type=int, default=10, help="Elements in each generated response array")
+    parser.add_argument("--large-items", type=int, default=2000, help="Array elements in the large-payload phase")
+    parser.add_argument("--large-calls", type=int, default=3, help="Calls in the large-payload phase")
+    parser.add_argument("--raster-kb", type=int, default=256, help="Size of mock raster bodies")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Fraction of upstream requests that fail")
+    parser.add_argument("--error-status", default="503", help="HTTP status for injected failures, or 'timeout'/'transport'")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--warm-cache", action="store_true", help="Keep the configured cache TTLs (default: every call goes upstream)")
+    parser.add_argument("--output", help="Write the JSON results to this file ('-' for stdout)")
+    parser.add_argument("--compare", help="Baseline JSON results to check for regressions")
+    parser.add_argument("--threshold", type=float, default=0.25, help="Allowed fractional regression (default 0.25)")
+    return parser.parse_args(argv)
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    args = parse_args(argv)
+    results = asyncio.run(run(args))
+    if args.output == "-":
+        json.dump(results, sys.stdout, indent=2)
+        print()
+    else:
+        print_summary(results)
+        if args.output:
+            Path(args.output).write_text(json.dumps(results, indent=2) + "\n")
+
+    if args.compare:
+        baseline = json.loads(Path(args.compare).read_text())
+        changed = [
+            key for key, value in results["meta"]["settings"].items()
+            if baseline.get("meta", {}).get("settings", {}).get(key, value) != value
+        ]
+        if changed:
+            print(f"Warning: baseline was run with different settings: {', '.join(changed)}", file=sys.stderr)
+        regressions = compare(results, baseline, args.threshold)
+        for r in regressions:
+            print(
+                f"REGRESSION {r['tool']} {r['metric']}: {r['baseline']} -> {r['current']} (+{r['change']:.0%})",
+                file=sys.stderr
+            )
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
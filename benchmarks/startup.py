@@ -0,0 +1,147 @@
+#!/usr/bin/env python3
+"""
+Startup-time benchmark for the stdio MCP server
+
+Spawns the server the way an MCP host does and times, from process start, the
+initialize response and the tools/list response. Each run is a fresh process.
+Every run also starts a bare FastMCP server without tools, the floor that
+importing the MCP SDK and the interpreter itself cost. Results are printed and
+optionally written as JSON. The run exits with status 1 when the median time to
+tools/list exceeds the floor's by more than --budget-ms.
+
+    python benchmarks/startup.py --runs 10 --budget-ms 200
+    python benchmarks/startup.py --command "python warm.py attach"
+"""
+import argparse
+import json
+import os
+import platform
+import shlex
+import statistics
+import subprocess
+import sys
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+ROOT = Path(__file__).resolve().parent.parent
+
+INITIALIZE = {
+    "jsonrpc": "2.0",
+    "id": 1,
+    "method": "initialize",
+    "params": {
+        "protocolVersion": "2025-03-26",
+        "capabilities": {},
+        "clientInfo": {"name": "startup-benchmark", "version": "1.0"},
+    },
+}
+INITIALIZED = {"jsonrpc": "2.0", "method": "notifications/initialized"}
+LIST_TOOLS = {"jsonrpc": "2.0", "id": 2, "method": "tools/list", "params": {}}
+
+# The startup floor: an MCP server with no tools
+BARE_SERVER = "from mcp.server.fastmcp import FastMCP; FastMCP('startup-floor').run()"
+
+
+def read_response(process: subprocess.Popen, request_id: int) -> Dict[str, Any]:
+    """Read stdout lines until the JSON-RPC response with request_id arrives."""
+    while True:
+        line = process.stdout.readline()
+        if not line:
+            raise RuntimeError(f"Server exited before answering request {request_id}")
+        message = json.loads(line)
+        if message.get("id") == request_id:
+            return message
+
+
+def send(process: subprocess.Popen, message: Dict[str, Any]) -> None:
+    process.stdin.write(json.dumps(message) + "\n")
+    process.stdin.flush()
+
+
+def measure(command: List[str], env: Dict[str, str]) -> Dict[str, Any]:
+    """Start one server process and time its handshake."""
+    start = time.perf_counter()
+    process = subprocess.Popen(
+        command, cwd=ROOT, env=env, text=True,
+        stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL
+    )
+    try:
+        send(process, INITIALIZE)
+        read_response(process, 1)
+        initialized = time.perf_counter() - start
+        send(process, INITIALIZED)
+        send(process, LIST_TOOLS)
+        tools = read_response(process, 2)["result"]["tools"]
+        listed = time.perf_counter() - start
+    finally:
+        process.stdin.close()
+        try:
+            process.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            process.kill()
+            process.wait()
+    return {"initialize_ms": initialized * 1000, "tools_list_ms": listed * 1000, "tools": len(tools)}
+
+
+def summarize(values: List[float]) -> Dict[str, float]:
+    return {
+        "p50": round(statistics.median(values), 1),
+        "min": round(min(values), 1),
+        "max": round(max(values), 1),
+    }
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Measure MCP server startup time.")
+    parser.add_argument("--runs", type=int, default=10, help="Server processes to start")
+    parser.add_argument("--command", default=f"{shlex.quote(sys.executable)} server.py", help="Command that starts the server")
+    parser.add_argument(
+        "--budget-ms", type=float, default=200.0,
+        help="Fail when the median time to tools/list exceeds a bare FastMCP server's by more than this"
+    )
+    parser.add_argument("--output", help="Write the JSON results to this file")
+    args = parser.parse_args(argv)
+
+    env = {**os.environ, "GEMS_EXCHANGE_API_KEY": os.environ.get("GEMS_EXCHANGE_API_KEY") or "benchmark"}
+    command = shlex.split(args.command)
+    bare = [sys.executable, "-c", BARE_SERVER]
+    # Discard one run of each so the OS file cache is warm for all measured runs
+    measure(command, env)
+    measure(bare, env)
+    runs, floor = [], []
+    # Alternate the two, so load changes during the benchmark affect both alike
+    for _ in range(args.runs):
+        runs.append(measure(command, env))
+        floor.append(measure(bare, env))
+
+    results = {
+        "meta": {
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "command": args.command,
+            "runs": args.runs,
+            "tools": runs[0]["tools"],
+        },
+        "initialize_ms": summarize([r["initialize_ms"] for r in runs]),
+        "tools_list_ms": summarize([r["tools_list_ms"] for r in runs]),
+        "floor_tools_list_ms": summarize([r["tools_list_ms"] for r in floor]),
+    }
+    overhead = round(results["tools_list_ms"]["p50"] - results["floor_tools_list_ms"]["p50"], 1)
+    results["overhead_ms"] = overhead
+    print(
+        f"initialize p50 {results['initialize_ms']['p50']} ms, "
+        f"tools/list p50 {results['tools_list_ms']['p50']} ms ({results['meta']['tools']} tools, {args.runs} runs), "
+        f"{overhead} ms over a bare FastMCP server ({results['floor_tools_list_ms']['p50']} ms)"
+    )
+    if args.output:
+        Path(args.output).write_text(json.dumps(results, indent=2) + "\n")
+    if overhead > args.budget_ms:
+        print(f"Startup budget exceeded: {overhead} ms > {args.budget_ms} ms over the floor", file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,302 @@
+"""
+Tiered response cache for GEMS Exchange API calls
+
+Decoded responses are kept in a bounded in-memory LRU, together with their raw
+bodies when JSON passthrough is on. When a cache directory
+is configured, the raw response bodies are also written to a SQLite store so
+they survive server restarts and are shared by HTTP worker processes.
+"""
+import asyncio
+import json
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Dict, NamedTuple, Optional, Tuple
+
+import jsoncodec
+from config import Config
+
+
+# Route classes are matched in order; the first pattern that matches wins.
+ROUTE_CLASSES: Tuple[Tuple["re.Pattern[str]", str], ...] = (
+    (re.compile(r"^/weather/v2/alerts"), "alerts"),
+    (re.compile(r"^/weather/v2/current"), "current"),
+    (re.compile(r"^/weather/v2/forecast"), "forecast"),
+    (re.compile(r"^/weather/v2/history"), "history"),
+    (re.compile(r"^/pedtools/"), "pedigree"),
+    (re.compile(r"^/[\w-]+/v2/grid(/|$)"), "grid"),
+    (re.compile(r"^/[\w-]+/v2/(datasets$|[\w-]+/layer(/|$))"), "catalog"),
+    (re.compile(r"^/[\w-]+/v2/[\w-]+/object/"), "object"),
+    (re.compile(r"^/hydro/v2/(catchment|lake-mn)/"), "object"),
+)
+
+# Expired memory entries are swept once every PURGE_INTERVAL writes
+PURGE_INTERVAL = 256
+
+
+def route_class(path: str) -> str:
+    """Classify an API path for TTL selection."""
+    for pattern, name in ROUTE_CLASSES:
+        if pattern.search(path):
+            return name
+    return "default"
+
+
+def _kept(body: bytes) -> Optional[bytes]:
+    """The raw body to keep in memory alongside its decoded value, if any."""
+    return body if Config.JSON_PASSTHROUGH else None
+
+
+def request_key(
+    method: str,
+    path: str,
+    params: Optional[Dict[str, Any]] = None,
+    body: Any = None
+) -> str:
+    """Build a normalized cache key from method, path, query and body."""
+    query = "&".join(f"{k}={params[k]}" for k in sorted(params)) if params else ""
+    payload = json.dumps(body, sort_keys=True, separators=(",", ":")) if body is not None else ""
+    return f"{method.upper()} {path}?{query}#{payload}"
+
+
+class CacheEntry(NamedTuple):
+    """A cached response value."""
+    value: Any
+    size: int
+    expires_at: float
+    # Raw JSON body, kept for result passthrough when GEMS_JSON_PASSTHROUGH is on
+    body: Optional[bytes] = None
+
+
+class MemoryLRU:
+    """In-memory LRU bounded by entry count and total body size."""
+
+    def __init__(self, max_entries: int, max_bytes: int, stale_grace: float = 0.0):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.stale_grace = stale_grace
+        self.total_bytes = 0
+        self.evictions = 0
+        self._entries: "OrderedDict[str, CacheEntry]" = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, key: str, now: float, allow_stale: bool = False) -> Optional[CacheEntry]:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        if entry.expires_at + self.stale_grace <= now:
+            self._remove(key)
+            return None
+        if entry.expires_at <= now and not allow_stale:
+            return None
+        self._entries.move_to_end(key)
+        return entry
+
+    def set(self, key: str, entry: CacheEntry) -> None:
+        if entry.size > self.max_bytes:
+            return
+        if key in self._entries:
+            self._remove(key)
+        self._entries[key] = entry
+        self.total_bytes += entry.size
+        while len(self._entries) > self.max_entries or self.total_bytes > self.max_bytes:
+            oldest = next(iter(self._entries))
+            self._remove(oldest)
+            self.evictions += 1
+
+    def purge_expired(self, now: float) -> int:
+        expired = [k for k, e in self._entries.items() if e.expires_at + self.stale_grace <= now]
+        for key in expired:
+            self._remove(key)
+        return len(expired)
+
+    def clear(self) -> None:
+        self._entries.clear()
+        self.total_bytes = 0
+
+    def _remove(self, key: str) -> None:
+        entry = self._entries.pop(key)
+        self.total_bytes -= entry.size
+
+
+class DiskStore:
+    """SQLite-backed store of raw response bodies."""
+
+    def __init__(self, directory: str, max_bytes: int, stale_grace: float = 0.0):
+        path = Path(directory).expanduser()
+        path.mkdir(parents=True, exist_ok=True)
+        self.path = path / "responses.sqlite3"
+        self.max_bytes = max_bytes
+        self.stale_grace = stale_grace
+        self.evictions = 0
+        self._lock = threading.Lock()
+        # Worker processes share the file; WAL lets readers proceed while another process writes
+        self._conn = sqlite3.connect(str(self.path), check_same_thread=False, isolation_level=None, timeout=30)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS responses ("
+            "key TEXT PRIMARY KEY, body BLOB NOT NULL, size INTEGER NOT NULL, "
+            "stored_at REAL NOT NULL, expires_at REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS responses_stored_at ON responses(stored_at)")
+
+    def get(self, key: str, now: float, allow_stale: bool = False) -> Optional[Tuple[bytes, float]]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT body, expires_at FROM responses WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                return None
+            if row[1] + self.stale_grace <= now:
+                self._conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+                return None
+            if row[1] <= now and not allow_stale:
+                return None
+            return row[0], row[1]
+
+    def set(self, key: str, body: bytes, expires_at: float, now: float) -> None:
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO responses (key, body, size, stored_at, expires_at) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (key, body, len(body), now, expires_at)
+            )
+            self._evict(now)
+
+    def total_bytes(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+
+    def clear(self) -> None:
+        with self._lock:
+            self._conn.execute("DELETE FROM responses")
+
+    def _evict(self, now: float) -> None:
+        self._conn.execute("DELETE FROM responses WHERE expires_at <= ?", (now - self.stale_grace,))
+        total = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        # Drop the oldest bodies until the store fits again
+        freed = 0
+        doomed = []
+        for key, size in self._conn.execute("SELECT key, size FROM responses ORDER BY stored_at"):
+            doomed.append((key,))
+            freed += size
+            if total - freed <= self.max_bytes:
+                break
+        self._conn.executemany("DELETE FROM responses WHERE key = ?", doomed)
+        self.evictions += len(doomed)
+
+
+class ResponseCache:
+    """
+    Two-tier cache of decoded upstream responses with hit/miss counters.
+
+    Expired entries are kept for stale_grace seconds so they can still be served,
+    via get(..., allow_stale=True), while an upstream service is down.
+    """
+
+    def __init__(
+        self,
+        max_entries: int,
+        max_bytes: int,
+        directory: Optional[str] = None,
+        disk_max_bytes: int = 0,
+        stale_grace: float = 0.0
+    ):
+        self.memory = MemoryLRU(max_entries, max_bytes, stale_grace)
+        self.disk = DiskStore(directory, disk_max_bytes, stale_grace) if directory else None
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self._writes = 0
+
+    @classmethod
+    def from_config(cls) -> "ResponseCache":
+        """Create a cache using the settings in Config."""
+        return cls(
+            Config.CACHE_MAX_ENTRIES,
+            Config.CACHE_MAX_BYTES,
+            Config.CACHE_DIR or None,
+            Config.CACHE_DISK_MAX_BYTES,
+            Config.CACHE_STALE_TTL if Config.SERVE_STALE else 0.0
+        )
+
+    async def get(self, key: str, allow_stale: bool = False) -> Optional[CacheEntry]:
+        """
+        Look up a key in memory, then on disk. Returns None on a miss.
+
+        Stale lookups (allow_stale=True) also return expired entries still within
+        the grace period and do not count towards hits or misses.
+        """
+        now = time.time()
+        entry = self.memory.get(key, now, allow_stale)
+        if entry is not None:
+            if not allow_stale:
+                self.hits += 1
+            return entry
+        if self.disk is not None:
+            row = await asyncio.to_thread(self.disk.get, key, now, allow_stale)
+            if row is not None:
+                body, expires_at = row
+                entry = CacheEntry(await jsoncodec.decode(body), len(body), expires_at, _kept(body))
+                self.memory.set(key, entry)
+                if not allow_stale:
+                    self.hits += 1
+                    self.disk_hits += 1
+                return entry
+        if not allow_stale:
+            self.misses += 1
+        return None
+
+    async def set(self, key: str, value: Any, body: bytes, ttl: float) -> None:
+        """Store a decoded value and its raw body for ttl seconds."""
+        now = time.time()
+        expires_at = now + ttl
+        self._writes += 1
+        if self._writes % PURGE_INTERVAL == 0:
+            self.memory.purge_expired(now)
+        self.memory.set(key, CacheEntry(value, len(body), expires_at, _kept(body)))
+        if self.disk is not None:
+            await asyncio.to_thread(self.disk.set, key, body, expires_at, now)
+
+    async def clear(self) -> None:
+        """Remove every entry from both tiers."""
+        self.memory.clear()
+        if self.disk is not None:
+            await asyncio.to_thread(self.disk.clear)
+
+    def stats(self) -> Dict[str, Any]:
+        """Get hit/miss counters and tier sizes."""
+        lookups = self.hits + self.misses
+        stats = {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            "memory": {
+                "entries": len(self.memory),
+                "bytes": self.memory.total_bytes,
+                "max_entries": self.memory.max_entries,
+                "max_bytes": self.memory.max_bytes,
+                "evictions": self.memory.evictions,
+            },
+        }
+        if self.disk is not None:
+            stats["disk"] = {
+                "path": str(self.disk.path),
+                "hits": self.disk_hits,
+                "bytes": self.disk.total_bytes(),
+                "max_bytes": self.disk.max_bytes,
+                "evictions": self.disk.evictions,
+            }
+        return stats
+
+
+# Shared cache used by all endpoint modules
+response_cache = ResponseCache.from_config()
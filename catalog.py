@@ -0,0 +1,348 @@
+"""
+In-memory catalog of datasets and layers across the GEMS APIs
+
+Every API's /datasets listing and each dataset's /{keyname}/layer listing are
+loaded concurrently and normalized into one record per layer (or per dataset,
+when it lists no layers). Records also carry the grid levels, time coverage and
+object count seen in the dataset's object/search results, which the listings
+themselves do not include.
+
+A Catalog is an immutable snapshot: the records, an inverted keyword index
+(token -> {record: weight}) and attribute indexes for the API and grid level.
+Searches are answered from memory. The CatalogStore swaps in a new snapshot on
+every refresh, so searches never wait for or see a half-built catalog.
+"""
+import asyncio
+import bisect
+import heapq
+import logging
+import math
+import re
+import time
+from collections import defaultdict
+from typing import Any, Awaitable, Callable, Dict, Iterable, List, Optional, Set, Tuple
+
+from config import Config
+from envelopes import parse_time
+
+logger = logging.getLogger(__name__)
+
+# Nominal resolution of each GEMS grid level, indexed as search keywords
+GRID_RESOLUTIONS = {0: "36km", 1: "9km", 3: "1km", 4: "100m", 5: "10m", 6: "1m"}
+
+# Weight of a keyword by the field it appears in
+_FIELD_WEIGHTS = (
+    ("layer", 4),
+    ("dataset_name", 3),
+    ("dataset", 3),
+    ("api_type", 2),
+    ("resolutions", 2),
+    ("units", 1),
+    ("description", 1),
+    ("dataset_description", 1),
+)
+
+_TOKEN = re.compile(r"[a-z0-9]+")
+# "100 m" and "1 km" are indexed and searched as one token
+_DISTANCE = re.compile(r"\b(\d+(?:\.\d+)?)\s*(km|m)\b")
+
+
+def tokenize(text: str) -> List[str]:
+    """Lowercase keyword tokens, with plurals folded (layers -> layer)."""
+    text = _DISTANCE.sub(r"\1\2", text.lower())
+    tokens = []
+    for token in _TOKEN.findall(text):
+        if len(token) > 3 and token.endswith("s") and not token.endswith("ss"):
+            token = token[:-1]
+        tokens.append(token)
+    return tokens
+
+
+def _timestamp(value: Optional[str], default: float) -> Optional[float]:
+    if not value:
+        return default
+    try:
+        return parse_time(value).timestamp()
+    except ValueError:
+        return None
+
+
+def _merge_ranges(ranges: Iterable[Tuple[float, float]]) -> List[Tuple[float, float]]:
+    merged: List[Tuple[float, float]] = []
+    for begin, end in sorted(ranges):
+        if merged and begin <= merged[-1][1]:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], end))
+        else:
+            merged.append((begin, end))
+    return merged
+
+
+def build_records(
+    api_type: str,
+    dataset: Dict[str, Any],
+    layers: Optional[List[Dict[str, Any]]],
+    objects: Optional[List[Dict[str, Any]]],
+    objects_complete: bool = True
+) -> List[Dict[str, Any]]:
+    """
+    Normalize one dataset, its layers and its objects into catalog records.
+
+    layers or objects is None when its listing could not be loaded; the records
+    then carry no layer fields or no grid and time facets.
+    """
+    by_layer: Dict[Any, List[Dict[str, Any]]] = defaultdict(list)
+    for obj in objects or []:
+        by_layer[obj.get("layer_id")].append(obj)
+
+    base = {
+        "api_type": api_type,
+        "dataset": dataset.get("keyname"),
+        "dataset_name": dataset.get("name"),
+        "dataset_id": dataset.get("id"),
+        "dataset_description": dataset.get("description"),
+    }
+    records = []
+    for layer in layers or [None]:
+        record = dict(base)
+        if layer is not None:
+            record.update({
+                "layer_id": layer.get("id"),
+                "layer": layer.get("name"),
+                "units": layer.get("units"),
+                "description": layer.get("description"),
+                "discrete": layer.get("discrete"),
+            })
+            layer_objects = by_layer.get(layer.get("id"), [])
+        else:
+            layer_objects = objects or []
+        if objects is not None:
+            grid_levels = sorted({o["grid_id"] for o in layer_objects if o.get("grid_id") is not None})
+            begins = [r.get("begin") for o in layer_objects for r in o.get("t_ranges") or [] if r.get("begin")]
+            ends = [r.get("end") for o in layer_objects for r in o.get("t_ranges") or [] if r.get("end")]
+            record.update({
+                "grid_levels": grid_levels,
+                "resolutions": [GRID_RESOLUTIONS[g] for g in grid_levels if g in GRID_RESOLUTIONS],
+                "time_begin": min(begins, default=None),
+                "time_end": max(ends, default=None),
+                "objects": len(layer_objects),
+                "objects_complete": objects_complete,
+                "_ranges": _merge_ranges(
+                    (begin, end)
+                    for o in layer_objects
+                    for r in o.get("t_ranges") or []
+                    for begin, end in [(_timestamp(r.get("begin"), -math.inf), _timestamp(r.get("end"), math.inf))]
+                    if begin is not None and end is not None
+                ),
+            })
+        records.append(record)
+    return records
+
+
+class Catalog:
+    """A searchable snapshot of catalog records."""
+
+    def __init__(self, records: List[Dict[str, Any]], updated_at: Optional[float] = None):
+        self.updated_at = time.time() if updated_at is None else updated_at
+        # Record order is the tie-break order of search results
+        records = sorted(records, key=lambda r: (r["api_type"], r["dataset"] or "", r.get("layer_id") or 0))
+        # Merged time ranges are kept apart so results can be returned as stored
+        self.ranges: List[Optional[List[Tuple[float, float]]]] = [record.pop("_ranges", None) for record in records]
+        self._range_ends = [[e for _, e in ranges] if ranges else None for ranges in self.ranges]
+        self.records = records
+        self.postings: Dict[str, Dict[int, int]] = defaultdict(dict)
+        self.by_api: Dict[str, Set[int]] = defaultdict(set)
+        self.by_grid: Dict[int, Set[int]] = defaultdict(set)
+        for i, record in enumerate(records):
+            for field, weight in _FIELD_WEIGHTS:
+                value = record.get(field)
+                if not value:
+                    continue
+                text = " ".join(map(str, value)) if isinstance(value, list) else str(value)
+                for token in tokenize(text.replace("_", " ").replace("-", " ")):
+                    postings = self.postings[token]
+                    postings[i] = max(postings.get(i, 0), weight)
+            self.by_api[record["api_type"]].add(i)
+            for level in record.get("grid_levels") or []:
+                self.by_grid[level].add(i)
+        self.postings = dict(self.postings)
+        self.vocabulary = sorted(self.postings)
+
+    def _matches(self, token: str) -> Dict[int, int]:
+        """Records containing token, or a word it is a prefix of."""
+        exact = self.postings.get(token)
+        if exact is not None or len(token) < 3:
+            return exact or {}
+        merged: Dict[int, int] = {}
+        k = bisect.bisect_left(self.vocabulary, token)
+        while k < len(self.vocabulary) and self.vocabulary[k].startswith(token):
+            word = self.vocabulary[k]
+            k += 1
+            for i, weight in self.postings[word].items():
+                merged[i] = max(merged.get(i, 0), weight - 1)
+        return merged
+
+    def _covers(self, i: int, start: float, end: float) -> bool:
+        ranges = self.ranges[i]
+        if not ranges:
+            # Unknown or timeless coverage matches any time
+            return True
+        # Merged ranges are disjoint and sorted, so the first one ending after start decides
+        k = bisect.bisect_left(self._range_ends[i], start)
+        return k < len(ranges) and ranges[k][0] <= end
+
+    def search(
+        self,
+        query: str = "",
+        api_type: Optional[str] = None,
+        grid_level: Optional[int] = None,
+        start: Optional[str] = None,
+        end: Optional[str] = None,
+        discrete: Optional[bool] = None,
+        limit: int = 20
+    ) -> Dict[str, Any]:
+        """
+        Find records matching every keyword of query and the attribute filters.
+
+        When no record has all the keywords, records matching the most of them
+        are returned instead, with match="partial". Time filters keep records
+        whose coverage overlaps [start, end]; layers without time ranges match.
+        """
+        tokens = list(dict.fromkeys(tokenize(query)))
+        candidates: Optional[Set[int]] = None
+        if api_type is not None:
+            candidates = set(self.by_api.get(api_type, ()))
+        if grid_level is not None:
+            levels = self.by_grid.get(grid_level, set())
+            candidates = set(levels) if candidates is None else candidates & levels
+        if start or end:
+            lower = _timestamp(start, -math.inf)
+            upper = _timestamp(end, math.inf)
+            if lower is None or upper is None:
+                raise ValueError("start and end must be ISO 8601 dates or times")
+            pool = range(len(self.records)) if candidates is None else candidates
+            candidates = {i for i in pool if self._covers(i, lower, upper)}
+        if discrete is not None:
+            pool = range(len(self.records)) if candidates is None else candidates
+            candidates = {i for i in pool if self.records[i].get("discrete") is discrete}
+
+        scores: Dict[int, int] = {}
+        hits: Dict[int, int] = {}
+        for token in tokens:
+            for i, weight in self._matches(token).items():
+                if candidates is None or i in candidates:
+                    scores[i] = scores.get(i, 0) + weight
+                    hits[i] = hits.get(i, 0) + 1
+        limit = max(0, limit)
+        if tokens:
+            full = [i for i, n in hits.items() if n == len(tokens)]
+            match = "all" if full or not hits else "partial"
+            chosen = full or list(hits)
+            top = heapq.nsmallest(limit, chosen, key=lambda i: (-hits[i], -scores[i], i))
+            data = [{**self.records[i], "score": scores[i]} for i in top]
+        else:
+            match = "all"
+            chosen = range(len(self.records)) if candidates is None else candidates
+            data = [self.records[i] for i in heapq.nsmallest(limit, chosen)]
+        return {"match": match, "total": len(chosen), "data": data}
+
+
+CatalogLoad = Callable[[], Awaitable[Tuple[List[Dict[str, Any]], Set[str]]]]
+
+
+class CatalogStore:
+    """The current catalog snapshot, loaded on first use and refreshed in the background."""
+
+    def __init__(self, max_age: float = 24 * 3600):
+        self.max_age = max_age
+        self.catalog: Optional[Catalog] = None
+        self._pending: Optional["asyncio.Task[Catalog]"] = None
+        self.builds = 0
+        self.refresh_failures = 0
+        self.load_seconds = 0.0
+        self.failed_apis: Set[str] = set()
+        self.searches = 0
+
+    @classmethod
+    def from_config(cls) -> "CatalogStore":
+        """Create a store using the settings in Config."""
+        return cls(Config.CATALOG_REFRESH)
+
+    async def get(self, load: CatalogLoad) -> Catalog:
+        """
+        Get the catalog. The first call waits for load(); a catalog older than
+        max_age is served while load() rebuilds it in the background.
+        """
+        if self.catalog is None:
+            return await asyncio.shield(self._start(load))
+        if time.time() - self.catalog.updated_at >= self.max_age and self._pending is None:
+            self._start(load)
+        return self.catalog
+
+    def _start(self, load: CatalogLoad) -> "asyncio.Task[Catalog]":
+        if self._pending is None:
+            self._pending = asyncio.create_task(self._build(load))
+        return self._pending
+
+    async def _build(self, load: CatalogLoad) -> Catalog:
+        started = time.perf_counter()
+        previous = self.catalog
+        try:
+            try:
+                records, failed = await load()
+            except Exception:
+                self.refresh_failures += 1
+                if previous is None:
+                    raise
+                logger.info("Could not refresh the dataset catalog", exc_info=True)
+                return previous
+            if previous is not None and failed:
+                # An API that could not be listed keeps its records from the last load
+                records.extend(
+                    {**record, "_ranges": ranges}
+                    for record, ranges in zip(previous.records, previous.ranges)
+                    if record["api_type"] in failed
+                )
+            self.catalog = Catalog(records)
+            self.failed_apis = failed
+            self.builds += 1
+            self.load_seconds = time.perf_counter() - started
+            return self.catalog
+        finally:
+            self._pending = None
+
+    async def refresh(self, load: CatalogLoad) -> Catalog:
+        """Reload the catalog now, sharing a load already in progress."""
+        return await asyncio.shield(self._start(load))
+
+    async def run(self, load: CatalogLoad, interval: float) -> None:
+        """Load the catalog now and then every interval seconds."""
+        while True:
+            try:
+                await self.refresh(load)
+            except Exception as e:
+                logger.info("Could not load the dataset catalog: %s", e)
+            await asyncio.sleep(interval)
+
+    def search(self, catalog: Catalog, **filters: Any) -> Dict[str, Any]:
+        """Search a snapshot, counting the search."""
+        self.searches += 1
+        return catalog.search(**filters)
+
+    def stats(self) -> Dict[str, Any]:
+        """Get catalog size and load counters."""
+        catalog = self.catalog
+        return {
+            "records": len(catalog.records) if catalog else 0,
+            "keywords": len(catalog.postings) if catalog else 0,
+            "age_seconds": round(time.time() - catalog.updated_at, 1) if catalog else None,
+            "loading": self._pending is not None,
+            "builds": self.builds,
+            "refresh_failures": self.refresh_failures,
+            "failed_apis": sorted(self.failed_apis),
+            "load_seconds": round(self.load_seconds, 3),
+            "searches": self.searches,
+        }
+
+
+# Shared catalog
+catalog_store = CatalogStore.from_config()
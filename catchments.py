@@ -0,0 +1,155 @@
+"""
+Local graph of Minnesota DNR level-9 catchments
+
+Catchment records from the hydro API carry their downstream neighbour
+(down_cat), which gives the edges of the drainage network. Once the full
+upstream or downstream set of a catchment has been fetched, every catchment in
+that set has its own set inside it, so later traversals from any of them are
+answered as local graph walks. Geometries are kept in a separate LRU and only
+loaded when asked for.
+"""
+from collections import OrderedDict, deque
+from typing import Any, Dict, List, Optional, Set
+
+from config import Config
+
+UPSTREAM = "upstream"
+DOWNSTREAM = "downstream"
+DIRECTIONS = (UPSTREAM, DOWNSTREAM)
+
+# down_cat values that mean "no downstream catchment"
+_TERMINAL = frozenset({"", "0", "-1", "none", "null"})
+
+
+def _catchment_id(value: Any) -> Optional[str]:
+    if value is None:
+        return None
+    text = str(value).strip()
+    if text.endswith(".0"):
+        text = text[:-2]
+    return None if text.lower() in _TERMINAL else text
+
+
+class CatchmentGraph:
+    """Catchment records with downstream/upstream adjacency and cached traversals."""
+
+    def __init__(self, max_geometries: int):
+        self.records: Dict[str, Dict[str, Any]] = {}
+        self.down: Dict[str, Optional[str]] = {}
+        self.up: Dict[str, Set[str]] = {}
+        # Catchments whose complete upstream/downstream set is known locally
+        self.complete: Dict[str, Set[str]] = {UPSTREAM: set(), DOWNSTREAM: set()}
+        self.max_geometries = max_geometries
+        self.local_walks = 0
+        self.fetched_walks = 0
+        self.geometry_hits = 0
+        self.geometry_misses = 0
+        self._geometries: "OrderedDict[str, Any]" = OrderedDict()
+
+    def add(self, records: Any) -> List[str]:
+        """Add level-9 catchment records. Returns their ids."""
+        ids = []
+        for record in records if isinstance(records, list) else [records]:
+            if not isinstance(record, dict) or "down_cat" not in record:
+                continue
+            node = _catchment_id(record.get("id"))
+            if node is None:
+                continue
+            self.records[node] = record
+            down = _catchment_id(record.get("down_cat"))
+            if down == node:
+                down = None
+            self.down[node] = down
+            if down is not None:
+                self.up.setdefault(down, set()).add(node)
+            ids.append(node)
+        return ids
+
+    def add_network(self, start: str, direction: str, records: Any) -> None:
+        """Add a complete upstream/downstream set fetched for start."""
+        members = self.add(records)
+        self.fetched_walks += 1
+        if direction == UPSTREAM:
+            # Everything upstream of a member is also upstream of start
+            self.complete[UPSTREAM].update(members)
+            self.complete[UPSTREAM].add(start)
+        else:
+            # Each member's downstream path is a suffix of start's; start itself
+            # needs its own record to know where the path begins
+            self.complete[DOWNSTREAM].update(members)
+            if start in self.records:
+                self.complete[DOWNSTREAM].add(start)
+
+    def walk(self, start: str, direction: str) -> Optional[List[Dict[str, Any]]]:
+        """Get the records upstream or downstream of start, or None if not known locally."""
+        start = _catchment_id(start) or start
+        if direction == DOWNSTREAM:
+            # Any chain of known records that reaches an outlet is complete; a fetched
+            # path may also end at a catchment the API has no record for
+            if start not in self.down:
+                return None
+            path = []
+            node = self.down[start]
+            seen = {start}
+            while node is not None and node not in seen:
+                if node not in self.records:
+                    if start in self.complete[DOWNSTREAM]:
+                        break
+                    return None
+                path.append(self.records[node])
+                seen.add(node)
+                node = self.down.get(node)
+            self.local_walks += 1
+            return path
+
+        if start not in self.complete[UPSTREAM]:
+            return None
+        # Breadth-first, nearest catchments first
+        result = []
+        seen = {start}
+        queue = deque(sorted(self.up.get(start, ())))
+        seen.update(queue)
+        while queue:
+            node = queue.popleft()
+            if node not in self.records:
+                return None
+            result.append(self.records[node])
+            for upstream in sorted(self.up.get(node, ())):
+                if upstream not in seen:
+                    seen.add(upstream)
+                    queue.append(upstream)
+        self.local_walks += 1
+        return result
+
+    def get_geometry(self, catchment_id: str) -> Optional[Any]:
+        geometry = self._geometries.get(catchment_id)
+        if geometry is None:
+            self.geometry_misses += 1
+            return None
+        self._geometries.move_to_end(catchment_id)
+        self.geometry_hits += 1
+        return geometry
+
+    def set_geometry(self, catchment_id: str, geometry: Any) -> None:
+        self._geometries[catchment_id] = geometry
+        self._geometries.move_to_end(catchment_id)
+        while len(self._geometries) > self.max_geometries:
+            self._geometries.popitem(last=False)
+
+    def stats(self) -> Dict[str, Any]:
+        """Get graph size, traversal and geometry cache counters."""
+        return {
+            "catchments": len(self.records),
+            "complete_upstream": len(self.complete[UPSTREAM]),
+            "complete_downstream": len(self.complete[DOWNSTREAM]),
+            "local_walks": self.local_walks,
+            "fetched_walks": self.fetched_walks,
+            "geometries": len(self._geometries),
+            "max_geometries": self.max_geometries,
+            "geometry_hits": self.geometry_hits,
+            "geometry_misses": self.geometry_misses,
+        }
+
+
+# Shared catchment graph used by the hydro endpoints
+catchment_graph = CatchmentGraph(Config.CATCHMENT_MAX_GEOMETRIES)
@@ -3,7 +3,8 @@ Configuration management for GEMS Exchange MCP Server
 """
 import os
 from pathlib import Path
-from typing import Optional
+from typing import Dict, Optional, Tuple
+import httpx
 from dotenv import load_dotenv
 
 # Load environment variables from project root
@@ -19,22 +20,212 @@ class Config:
     
     # API settings
     BASE_URL: str = "https://exchange-1.gems.msi.umn.edu"
-    TIMEOUT: float = 30.0
+    TIMEOUT: float = float(os.getenv("GEMS_TIMEOUT", "30.0"))
+
+    # HTTP client settings
+    CONNECT_TIMEOUT: float = float(os.getenv("GEMS_CONNECT_TIMEOUT", "10.0"))
+    READ_TIMEOUT: float = float(os.getenv("GEMS_READ_TIMEOUT", str(TIMEOUT)))
+    WRITE_TIMEOUT: float = float(os.getenv("GEMS_WRITE_TIMEOUT", str(TIMEOUT)))
+    POOL_TIMEOUT: float = float(os.getenv("GEMS_POOL_TIMEOUT", "10.0"))
+    MAX_CONNECTIONS: int = int(os.getenv("GEMS_MAX_CONNECTIONS", "64"))
+    MAX_KEEPALIVE_CONNECTIONS: int = int(os.getenv("GEMS_MAX_KEEPALIVE_CONNECTIONS", "32"))
+    KEEPALIVE_EXPIRY: float = float(os.getenv("GEMS_KEEPALIVE_EXPIRY", "60.0"))
+    HTTP2: bool = os.getenv("GEMS_HTTP2", "true").lower() in ("1", "true", "yes")
+    WARM_CONNECTIONS: int = int(os.getenv("GEMS_WARM_CONNECTIONS", "2"))
     
     # Server settings
     SERVER_NAME: str = "gems-exchange"
     SERVER_VERSION: str = "1.0.0"
+
+    # Transport: stdio, streamable-http or sse. HTTP workers are processes sharing one port.
+    TRANSPORT: str = os.getenv("GEMS_TRANSPORT", "stdio")
+    HTTP_HOST: str = os.getenv("GEMS_HTTP_HOST", "127.0.0.1")
+    HTTP_PORT: int = int(os.getenv("GEMS_HTTP_PORT", "8000"))
+    WORKERS: int = int(os.getenv("GEMS_WORKERS", "1"))
+    # Stateless HTTP makes every request its own MCP session, so any worker can answer it
+    HTTP_STATELESS: bool = os.getenv("GEMS_HTTP_STATELESS", "true" if WORKERS > 1 else "false").lower() in ("1", "true", "yes")
+    # Plain JSON replies instead of SSE streams, which are cut off as soon as shutdown starts
+    HTTP_JSON_RESPONSE: bool = os.getenv(
+        "GEMS_HTTP_JSON_RESPONSE", "true" if HTTP_STATELESS else "false"
+    ).lower() in ("1", "true", "yes")
+    DRAIN_TIMEOUT: float = float(os.getenv("GEMS_DRAIN_TIMEOUT", "30"))
+    # Rate-limit buckets and the background-task lock shared by worker processes ("" keeps them per process)
+    SHARED_STATE_DIR: str = os.getenv(
+        "GEMS_SHARED_STATE_DIR", str(Path.home() / ".cache" / "gems-exchange") if WORKERS > 1 else ""
+    )
+
+    # Response cache settings
+    CACHE_MAX_ENTRIES: int = int(os.getenv("GEMS_CACHE_MAX_ENTRIES", "2048"))
+    CACHE_MAX_BYTES: int = int(os.getenv("GEMS_CACHE_MAX_BYTES", str(64 * 1024 * 1024)))
+    # Several workers share the disk tier by default
+    CACHE_DIR: str = os.getenv(
+        "GEMS_CACHE_DIR", str(Path.home() / ".cache" / "gems-exchange" / "responses") if WORKERS > 1 else ""
+    )
+    CACHE_DISK_MAX_BYTES: int = int(os.getenv("GEMS_CACHE_DISK_MAX_BYTES", str(512 * 1024 * 1024)))
+    SERVE_STALE: bool = os.getenv("GEMS_SERVE_STALE", "true").lower() in ("1", "true", "yes")
+    CACHE_STALE_TTL: float = float(os.getenv("GEMS_CACHE_STALE_TTL", str(24 * 3600)))
+
+    # Rate limits as "requests_per_second[:burst]"; 0 disables a limit
+    RATE_LIMIT: str = os.getenv("GEMS_RATE_LIMIT", "20:40")
+    # Per-service limits, e.g. "/weather/v2=5:10,/soil/v2=10"
+    RATE_LIMITS: str = os.getenv("GEMS_RATE_LIMITS", "")
+
+    # Retry and circuit breaker settings
+    RETRY_MAX_ATTEMPTS: int = int(os.getenv("GEMS_RETRY_MAX_ATTEMPTS", "3"))
+    RETRY_BASE_DELAY: float = float(os.getenv("GEMS_RETRY_BASE_DELAY", "0.25"))
+    RETRY_MAX_DELAY: float = float(os.getenv("GEMS_RETRY_MAX_DELAY", "8.0"))
+    RETRY_AFTER_MAX: float = float(os.getenv("GEMS_RETRY_AFTER_MAX", "30.0"))
+    BREAKER_FAILURE_THRESHOLD: int = int(os.getenv("GEMS_BREAKER_FAILURE_THRESHOLD", "5"))
+    BREAKER_RESET_TIMEOUT: float = float(os.getenv("GEMS_BREAKER_RESET_TIMEOUT", "30.0"))
+
+    # Raster download store settings
+    RASTER_DIR: str = os.getenv("GEMS_RASTER_DIR", str(Path.home() / ".cache" / "gems-exchange" / "rasters"))
+    RASTER_DIR_MAX_BYTES: int = int(os.getenv("GEMS_RASTER_DIR_MAX_BYTES", str(2 * 1024 * 1024 * 1024)))
+
+    # Local point sampling settings
+    SAMPLING_MAX_TILES: int = int(os.getenv("GEMS_SAMPLING_MAX_TILES", "32"))
+    SAMPLING_MAX_TILE_PIXELS: int = int(os.getenv("GEMS_SAMPLING_MAX_TILE_PIXELS", str(16 * 1024 * 1024)))
+    SAMPLING_MIN_TILE_POINTS: int = int(os.getenv("GEMS_SAMPLING_MIN_TILE_POINTS", "16"))
+    POINT_CONCURRENCY: int = int(os.getenv("GEMS_POINT_CONCURRENCY", "8"))
+    POINT_CONCURRENCY_PER_SERVICE: int = int(os.getenv("GEMS_POINT_CONCURRENCY_PER_SERVICE", "4"))
+
+    # Grid cell snapping of point and weather queries; the weather grid is a GEMS grid id (-1 disables)
+    SNAP_POINTS: bool = os.getenv("GEMS_SNAP_POINTS", "true").lower() in ("1", "true", "yes")
+    SNAP_MAX_GRIDS: int = int(os.getenv("GEMS_SNAP_MAX_GRIDS", "4096"))
+    WEATHER_SNAP_GRID: int = int(os.getenv("GEMS_WEATHER_SNAP_GRID", "3"))
+
+    # Batch weather settings
+    WEATHER_BATCH_SIZE: int = int(os.getenv("GEMS_WEATHER_BATCH_SIZE", "50"))
+    WEATHER_BATCH_CONCURRENCY: int = int(os.getenv("GEMS_WEATHER_BATCH_CONCURRENCY", "4"))
+    # Farthest an observation's station may be from a point it is matched to by location
+    WEATHER_MATCH_KM: float = float(os.getenv("GEMS_WEATHER_MATCH_KM", "50"))
+
+    # Watched locations: prefetch intervals in seconds per product, and jitter as a fraction of the interval
+    WATCHLIST_FILE: str = os.getenv("GEMS_WATCHLIST_FILE", str(Path.home() / ".cache" / "gems-exchange" / "watchlist.json"))
+    WATCH_INTERVALS: Dict[str, float] = {
+        "current": float(os.getenv("GEMS_WATCH_INTERVAL_CURRENT", "600")),
+        "alerts": float(os.getenv("GEMS_WATCH_INTERVAL_ALERTS", "120")),
+        "forecast": float(os.getenv("GEMS_WATCH_INTERVAL_FORECAST", "3600")),
+    }
+    WATCH_JITTER: float = float(os.getenv("GEMS_WATCH_JITTER", "0.1"))
+    WATCH_CONCURRENCY: int = int(os.getenv("GEMS_WATCH_CONCURRENCY", "4"))
+    WATCH_MAX_LOCATIONS: int = int(os.getenv("GEMS_WATCH_MAX_LOCATIONS", "500"))
+
+    # Metrics export settings
+    METRICS_FILE: str = os.getenv("GEMS_METRICS_FILE", "")
+    METRICS_INTERVAL: float = float(os.getenv("GEMS_METRICS_INTERVAL", "15"))
+
+    # JSON settings: backend is auto, orjson, msgspec or json
+    JSON_BACKEND: str = os.getenv("GEMS_JSON_BACKEND", "auto")
+    JSON_THREAD_BYTES: int = int(os.getenv("GEMS_JSON_THREAD_BYTES", str(1024 * 1024)))
+    JSON_PASSTHROUGH: bool = os.getenv("GEMS_JSON_PASSTHROUGH", "true").lower() in ("1", "true", "yes")
+    STRUCTURED_OUTPUT: bool = os.getenv("GEMS_STRUCTURED_OUTPUT", "false").lower() in ("1", "true", "yes")
+
+    # Coefficient-of-parentage pair store settings
+    COP_MAX_PAIRS: int = int(os.getenv("GEMS_COP_MAX_PAIRS", "200000"))
+    COP_DISK_MAX_PAIRS: int = int(os.getenv("GEMS_COP_DISK_MAX_PAIRS", "5000000"))
+
+    # Hydro catchment settings
+    CATCHMENT_MAX_GEOMETRIES: int = int(os.getenv("GEMS_CATCHMENT_MAX_GEOMETRIES", "5000"))
+
+    # Tiled aggregation (stats/histogram/quantiles/valuecount) settings
+    AGGREGATE_TILE_PIXELS: int = int(os.getenv("GEMS_AGGREGATE_TILE_PIXELS", str(4 * 1024 * 1024)))
+    AGGREGATE_CONCURRENCY: int = int(os.getenv("GEMS_AGGREGATE_CONCURRENCY", "4"))
+
+    # Historical weather range settings
+    HISTORY_CONCURRENCY: int = int(os.getenv("GEMS_HISTORY_CONCURRENCY", "4"))
+    HISTORY_DAY_TTL: float = float(os.getenv("GEMS_HISTORY_DAY_TTL", str(30 * 24 * 3600)))
+    HISTORY_MAX_BYTES: int = int(os.getenv("GEMS_HISTORY_MAX_BYTES", str(64 * 1024 * 1024)))
+    HISTORY_DISK_MAX_BYTES: int = int(os.getenv("GEMS_HISTORY_DISK_MAX_BYTES", str(512 * 1024 * 1024)))
+
+    # Object envelope index settings
+    ENVELOPE_MAX_OBJECTS: int = int(os.getenv("GEMS_ENVELOPE_MAX_OBJECTS", "10000"))
+    ENVELOPE_MAX_INDEXES: int = int(os.getenv("GEMS_ENVELOPE_MAX_INDEXES", "64"))
+    ENVELOPE_INDEX_TTL: float = float(os.getenv("GEMS_ENVELOPE_INDEX_TTL", str(6 * 3600)))
+    ENVELOPE_CONCURRENCY: int = int(os.getenv("GEMS_ENVELOPE_CONCURRENCY", "8"))
+
+    # Dataset catalog settings; the catalog is reloaded every CATALOG_REFRESH seconds
+    CATALOG_PRELOAD: bool = os.getenv("GEMS_CATALOG_PRELOAD", "false").lower() in ("1", "true", "yes")
+    CATALOG_REFRESH: float = float(os.getenv("GEMS_CATALOG_REFRESH", str(6 * 3600)))
+    CATALOG_CONCURRENCY: int = int(os.getenv("GEMS_CATALOG_CONCURRENCY", "8"))
+    CATALOG_MAX_OBJECTS: int = int(os.getenv("GEMS_CATALOG_MAX_OBJECTS", "2000"))
+
+    # Pages of object/search results fetched ahead of the consumer
+    SEARCH_PAGE_CONCURRENCY: int = int(os.getenv("GEMS_SEARCH_PAGE_CONCURRENCY", "4"))
+
+    # Time-to-live in seconds for each route class (0 disables caching)
+    CACHE_TTLS: Dict[str, float] = {
+        "grid": float(os.getenv("GEMS_CACHE_TTL_GRID", str(7 * 24 * 3600))),
+        "catalog": float(os.getenv("GEMS_CACHE_TTL_CATALOG", str(24 * 3600))),
+        "object": float(os.getenv("GEMS_CACHE_TTL_OBJECT", str(24 * 3600))),
+        "pedigree": float(os.getenv("GEMS_CACHE_TTL_PEDIGREE", str(24 * 3600))),
+        "history": float(os.getenv("GEMS_CACHE_TTL_HISTORY", str(6 * 3600))),
+        "forecast": float(os.getenv("GEMS_CACHE_TTL_FORECAST", str(30 * 60))),
+        "current": float(os.getenv("GEMS_CACHE_TTL_CURRENT", str(5 * 60))),
+        "alerts": float(os.getenv("GEMS_CACHE_TTL_ALERTS", "30")),
+        "default": float(os.getenv("GEMS_CACHE_TTL_DEFAULT", "60")),
+    }
     
     @classmethod
     def validate(cls) -> None:
         """Validate required configuration."""
         if not cls.GEMS_EXCHANGE_API_KEY:
             raise ValueError("GEMS_EXCHANGE_API_KEY environment variable is required. Obtain from https://exchange-1.gems.msi.umn.edu")
+        if cls.TRANSPORT not in ("stdio", "streamable-http", "sse"):
+            raise ValueError(f"Unknown transport '{cls.TRANSPORT}', expected stdio, streamable-http or sse")
+        if cls.WORKERS > 1 and (cls.TRANSPORT != "streamable-http" or not cls.HTTP_STATELESS):
+            raise ValueError("Several workers need GEMS_TRANSPORT=streamable-http with GEMS_HTTP_STATELESS on")
     
     @classmethod
     def get_headers(cls) -> dict:
         """Get HTTP headers for API requests."""
         return {"apikey": cls.GEMS_EXCHANGE_API_KEY}
 
-# Validate configuration on import
-Config.validate()
\ No newline at end of file
+    @classmethod
+    def get_timeout(cls) -> httpx.Timeout:
+        """Get connect/read/write/pool timeouts for the HTTP client."""
+        return httpx.Timeout(
+            connect=cls.CONNECT_TIMEOUT,
+            read=cls.READ_TIMEOUT,
+            write=cls.WRITE_TIMEOUT,
+            pool=cls.POOL_TIMEOUT
+        )
+
+    @classmethod
+    def get_limits(cls) -> httpx.Limits:
+        """Get connection pool limits for the HTTP client."""
+        return httpx.Limits(
+            max_connections=cls.MAX_CONNECTIONS,
+            max_keepalive_connections=cls.MAX_KEEPALIVE_CONNECTIONS,
+            keepalive_expiry=cls.KEEPALIVE_EXPIRY
+        )
+
+    @staticmethod
+    def parse_rate(spec: str) -> Optional[Tuple[float, float]]:
+        """Parse a "rate[:burst]" limit. Returns None when the limit is disabled."""
+        rate, _, burst = spec.strip().partition(":")
+        rate_value = float(rate or 0)
+        if rate_value <= 0:
+            return None
+        return rate_value, float(burst) if burst else rate_value
+
+    @classmethod
+    def get_rate_limit(cls) -> Optional[Tuple[float, float]]:
+        """Get the (rate, burst) limit for the API key as a whole."""
+        return cls.parse_rate(cls.RATE_LIMIT)
+
+    @classmethod
+    def get_service_rate_limits(cls) -> Dict[str, Tuple[float, float]]:
+        """Get (rate, burst) limits keyed by service path prefix."""
+        limits = {}
+        for item in cls.RATE_LIMITS.split(","):
+            prefix, _, spec = item.partition("=")
+            limit = cls.parse_rate(spec) if prefix.strip() else None
+            if limit:
+                limits[prefix.strip()] = limit
+        return limits
+
+    @classmethod
+    def get_cache_ttl(cls, route_class: str) -> float:
+        """Get the cache time-to-live for a route class."""
+        return cls.CACHE_TTLS.get(route_class, cls.CACHE_TTLS["default"])
@@ -0,0 +1,232 @@
+"""
+Pairwise coefficient-of-parentage store
+
+COP values from /pedtools/v1/cop/matrix are stored per (variety A, variety B,
+max_depth), with A and B the canonical names from the response's
+reverse_mapping, so a panel that grows by a few lines only needs the missing
+pairs computed upstream. Pairs live in a bounded in-memory LRU and, when a
+cache directory is configured, in a SQLite file that survives restarts.
+"""
+import asyncio
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from config import Config
+
+PairKey = Tuple[str, str, int]
+
+
+def pair_key(a: str, b: str, max_depth: int) -> PairKey:
+    """COP is symmetric, so store each pair once with the names in sorted order."""
+    return (a, b, max_depth) if a <= b else (b, a, max_depth)
+
+
+def alias_key(name: str) -> str:
+    return " ".join(name.split()).casefold()
+
+
+class PairDiskStore:
+    """SQLite-backed table of COP pairs and name aliases."""
+
+    def __init__(self, directory: str, max_pairs: int):
+        path = Path(directory).expanduser()
+        path.mkdir(parents=True, exist_ok=True)
+        self.path = path / "cop.sqlite3"
+        self.max_pairs = max_pairs
+        self.evictions = 0
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(str(self.path), check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS pairs ("
+            "a TEXT NOT NULL, b TEXT NOT NULL, depth INTEGER NOT NULL, cop REAL NOT NULL, "
+            "expires_at REAL NOT NULL, PRIMARY KEY (a, b, depth))"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS pairs_expires_at ON pairs(expires_at)")
+        self._conn.execute("CREATE TABLE IF NOT EXISTS aliases (name TEXT PRIMARY KEY, canonical TEXT NOT NULL)")
+
+    def get_pairs(self, keys: List[PairKey], now: float) -> Dict[PairKey, Tuple[float, float]]:
+        found = {}
+        with self._lock:
+            for key in keys:
+                row = self._conn.execute(
+                    "SELECT cop, expires_at FROM pairs WHERE a = ? AND b = ? AND depth = ?", key
+                ).fetchone()
+                if row is not None and row[1] > now:
+                    found[key] = (row[0], row[1])
+        return found
+
+    def set_pairs(self, pairs: Dict[PairKey, Tuple[float, float]], now: float) -> None:
+        with self._lock:
+            self._conn.execute("BEGIN")
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO pairs (a, b, depth, cop, expires_at) VALUES (?, ?, ?, ?, ?)",
+                [(*key, value, expires_at) for key, (value, expires_at) in pairs.items()]
+            )
+            self._conn.execute("COMMIT")
+            self._evict(now)
+
+    def get_alias(self, name: str) -> Optional[str]:
+        with self._lock:
+            row = self._conn.execute("SELECT canonical FROM aliases WHERE name = ?", (name,)).fetchone()
+        return row[0] if row else None
+
+    def set_aliases(self, aliases: Dict[str, str]) -> None:
+        with self._lock:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO aliases (name, canonical) VALUES (?, ?)", list(aliases.items())
+            )
+
+    def count(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM pairs").fetchone()[0]
+
+    def clear(self) -> None:
+        with self._lock:
+            self._conn.execute("DELETE FROM pairs")
+            self._conn.execute("DELETE FROM aliases")
+
+    def _evict(self, now: float) -> None:
+        self._conn.execute("DELETE FROM pairs WHERE expires_at <= ?", (now,))
+        excess = self._conn.execute("SELECT COUNT(*) FROM pairs").fetchone()[0] - self.max_pairs
+        if excess > 0:
+            # Pairs written longest ago expire first, so drop those
+            self._conn.execute(
+                "DELETE FROM pairs WHERE rowid IN (SELECT rowid FROM pairs ORDER BY expires_at LIMIT ?)", (excess,)
+            )
+            self.evictions += excess
+
+
+class COPStore:
+    """Two-tier store of pairwise COP values and variety name aliases."""
+
+    def __init__(self, max_pairs: int, ttl: float, directory: Optional[str] = None, disk_max_pairs: int = 0):
+        self.max_pairs = max_pairs
+        self.ttl = ttl
+        self.disk = PairDiskStore(directory, disk_max_pairs) if directory else None
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._pairs: "OrderedDict[PairKey, Tuple[float, float]]" = OrderedDict()
+        self._aliases: Dict[str, str] = {}
+
+    @classmethod
+    def from_config(cls) -> "COPStore":
+        """Create a store using the settings in Config."""
+        return cls(
+            Config.COP_MAX_PAIRS,
+            Config.get_cache_ttl("pedigree"),
+            Config.CACHE_DIR or None,
+            Config.COP_DISK_MAX_PAIRS
+        )
+
+    async def canonical(self, name: str) -> Optional[str]:
+        """Get the canonical name for a variety name seen in an earlier response."""
+        key = alias_key(name)
+        canonical = self._aliases.get(key)
+        if canonical is None and self.disk is not None:
+            canonical = await asyncio.to_thread(self.disk.get_alias, key)
+            if canonical is not None:
+                self._aliases[key] = canonical
+        return canonical
+
+    async def get_pairs(self, names: List[str], max_depth: int) -> Dict[PairKey, float]:
+        """Get every stored pair (including each variety with itself) among canonical names."""
+        now = time.time()
+        keys = [pair_key(a, b, max_depth) for i, a in enumerate(names) for b in names[i:]]
+        found: Dict[PairKey, float] = {}
+        missing = []
+        for key in keys:
+            entry = self._pairs.get(key)
+            if entry is not None and entry[1] > now:
+                self._pairs.move_to_end(key)
+                found[key] = entry[0]
+            else:
+                missing.append(key)
+        if missing and self.disk is not None:
+            from_disk = await asyncio.to_thread(self.disk.get_pairs, missing, now)
+            for key, entry in from_disk.items():
+                self._remember(key, entry)
+                found[key] = entry[0]
+        self.hits += len(found)
+        self.misses += len(keys) - len(found)
+        return found
+
+    async def add_response(self, response: Dict[str, Any], max_depth: int) -> Dict[PairKey, float]:
+        """Store the aliases and pairs from a COPResponse. Returns the pairs it held."""
+        reverse = response.get("reverse_mapping") or {}
+        aliases = {alias_key(name): canonical for name, canonical in reverse.items()}
+        for canonical in set(reverse.values()):
+            aliases[alias_key(canonical)] = canonical
+        self._aliases.update(aliases)
+
+        expires_at = time.time() + self.ttl
+        pairs: Dict[PairKey, float] = {}
+        for a, row in (response.get("cop") or {}).items():
+            for b, value in (row or {}).items():
+                if value is not None:
+                    pairs[pair_key(reverse.get(a, a), reverse.get(b, b), max_depth)] = float(value)
+        for key, value in pairs.items():
+            self._remember(key, (value, expires_at))
+        if self.disk is not None:
+            await asyncio.to_thread(self.disk.set_aliases, aliases)
+            if pairs:
+                await asyncio.to_thread(
+                    self.disk.set_pairs, {k: (v, expires_at) for k, v in pairs.items()}, time.time()
+                )
+        return pairs
+
+    def _remember(self, key: PairKey, entry: Tuple[float, float]) -> None:
+        self._pairs[key] = entry
+        self._pairs.move_to_end(key)
+        while len(self._pairs) > self.max_pairs:
+            self._pairs.popitem(last=False)
+            self.evictions += 1
+
+    async def clear(self) -> None:
+        """Remove every pair and alias from both tiers."""
+        self._pairs.clear()
+        self._aliases.clear()
+        if self.disk is not None:
+            await asyncio.to_thread(self.disk.clear)
+
+    def stats(self) -> Dict[str, Any]:
+        """Get hit/miss counters and store sizes."""
+        stats = {
+            "pair_hits": self.hits,
+            "pair_misses": self.misses,
+            "pairs": len(self._pairs),
+            "max_pairs": self.max_pairs,
+            "aliases": len(self._aliases),
+            "evictions": self.evictions,
+        }
+        if self.disk is not None:
+            stats["disk"] = {
+                "path": str(self.disk.path),
+                "pairs": self.disk.count(),
+                "max_pairs": self.disk.max_pairs,
+                "evictions": self.disk.evictions,
+            }
+        return stats
+
+
+def assemble(names: Iterable[str], canonical: Dict[str, str], pairs: Dict[PairKey, float], max_depth: int) -> Dict[str, Any]:
+    """Build a COPResponse-shaped matrix for the requested names from stored pairs."""
+    reverse = {name: canonical[name] for name in names if name in canonical}
+    forward: Dict[str, List[str]] = {}
+    for name, value in reverse.items():
+        forward.setdefault(value, []).append(name)
+    cop = {
+        a: {b: pairs[pair_key(a, b, max_depth)] for b in forward if pair_key(a, b, max_depth) in pairs}
+        for a in forward
+    }
+    return {"reverse_mapping": reverse, "forward_mapping": forward, "cop": cop}
+
+
+# Shared COP store used by the plant endpoints
+cop_store = COPStore.from_config()
@@ -6,5 +6,6 @@ from . import weather
 from . import plant
 from . import datasets
 from . import spatial
+from . import hydro
 
-__all__ = ['weather', 'plant', 'datasets', 'spatial']
\ No newline at end of file
+__all__ = ['weather', 'plant', 'datasets', 'spatial', 'hydro']
\ No newline at end of file
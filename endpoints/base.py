@@ -0,0 +1,132 @@
+"""
+Shared request helpers for GEMS Exchange endpoints
+"""
+import time
+from typing import Any, Dict, Optional, Tuple
+import httpx
+
+import jsoncodec
+from cache import response_cache, request_key, route_class
+from config import Config
+from metrics import error_class, metrics, status_class
+from ratelimit import rate_limiter
+from resilience import CircuitOpenError, service_name, upstream_guard
+from singleflight import request_coalescer
+
+
+async def request_json(
+    client: httpx.AsyncClient,
+    method: str,
+    path: str,
+    params: Optional[Dict[str, Any]] = None,
+    body: Any = None,
+    ttl: Optional[float] = None,
+    refresh: bool = False
+) -> Any:
+    """
+    Send a request through the response cache, request coalescer, retry/circuit
+    breaker guard and rate limiter and return the decoded JSON. The body is
+    decoded with the configured JSON backend straight from the response bytes.
+
+    While a service's circuit is open, an expired cache entry is returned instead of
+    failing, if one is still within the stale grace period. Pass ttl to override the
+    route-class TTL (0 skips the response cache). With refresh, the cached entry is
+    not used but the fresh response is still stored.
+    """
+    if params:
+        params = {k: v for k, v in params.items() if v is not None}
+    if ttl is None:
+        ttl = Config.get_cache_ttl(route_class(path))
+    key = request_key(method, path, params, body)
+
+    if ttl > 0 and not refresh:
+        entry = await response_cache.get(key)
+        if entry is not None:
+            jsoncodec.remember(entry.value, entry.body)
+            return entry.value
+
+    service = service_name(path)
+
+    async def send() -> httpx.Response:
+        await rate_limiter.acquire(path)
+        metrics.request_started()
+        start = time.perf_counter()
+        # Only left as is when the request is cancelled
+        result = "cancelled"
+        response = None
+        try:
+            response = await client.request(method, path, params=params, json=body)
+            result = status_class(response.status_code)
+        except Exception as e:
+            result = error_class(e)
+            raise
+        finally:
+            # Also on cancellation, so the in-flight gauge always comes back down
+            metrics.observe_upstream(
+                service,
+                time.perf_counter() - start,
+                result,
+                len(response.request.content) if response is not None else 0,
+                len(response.content) if response is not None else 0
+            )
+        return response
+
+    async def fetch() -> Tuple[Any, Optional[bytes]]:
+        try:
+            response = await upstream_guard.send(path, send)
+        except CircuitOpenError:
+            if ttl > 0 and Config.SERVE_STALE:
+                entry = await response_cache.get(key, allow_stale=True)
+                if entry is not None:
+                    upstream_guard.stale_served += 1
+                    return entry.value, entry.body
+            raise
+        response.raise_for_status()
+        start = time.perf_counter()
+        data = await jsoncodec.decode(response.content)
+        metrics.observe_decode(service, time.perf_counter() - start)
+        if ttl > 0:
+            await response_cache.set(key, data, response.content, ttl)
+        return data, response.content
+
+    try:
+        # Every coalesced caller gets the body too, for result passthrough in its own tool call
+        data, raw = await request_coalescer.do(key, fetch)
+    except Exception as e:
+        metrics.record_error(e)
+        raise
+    jsoncodec.remember(data, raw)
+    return data
+
+
+async def cache_json(path: str, params: Dict[str, Any], data: Any, ttl: Optional[float] = None) -> None:
+    """
+    Store data in the response cache as the response to GET path with params,
+    as if it had been fetched. Pass ttl to override the route-class TTL.
+    """
+    if ttl is None:
+        ttl = Config.get_cache_ttl(route_class(path))
+    if ttl > 0:
+        await response_cache.set(request_key("GET", path, params), data, jsoncodec.dumps(data), ttl)
+
+
+async def get_json(
+    client: httpx.AsyncClient,
+    path: str,
+    params: Optional[Dict[str, Any]] = None,
+    ttl: Optional[float] = None,
+    refresh: bool = False
+) -> Any:
+    """GET a path and return the decoded JSON."""
+    return await request_json(client, "GET", path, params=params, ttl=ttl, refresh=refresh)
+
+
+async def post_json(
+    client: httpx.AsyncClient,
+    path: str,
+    body: Any,
+    params: Optional[Dict[str, Any]] = None,
+    ttl: Optional[float] = None
+) -> Any:
+    """POST a JSON body to a path and return the decoded JSON."""
+    return await request_json(client, "POST", path, params=params, body=body, ttl=ttl)
@@ -1,71 +1,161 @@
 """
 Dataset listing endpoints for GEMS Exchange
 """
-from typing import Dict, Any, Optional
+import asyncio
+import logging
+from datetime import datetime, timezone
+from typing import Dict, Any, List, Optional, Set, Tuple
 import httpx
 
+from catalog import Catalog, build_records, catalog_store
+from config import Config
+from .base import get_json
+from .spatial import MAX_PAGE_SIZE, search_data
+
+logger = logging.getLogger(__name__)
+
+# APIs with /datasets and /{keyname}/layer listings
+CATALOG_APIS = ("climate", "soil", "landcover", "elevation", "crop", "hydro", "market", "biotic-risk")
+
 
 async def list_climate(client: httpx.AsyncClient) -> Dict[str, Any]:
     """List available climate datasets."""
-    response = await client.get("/climate/v2/datasets")
-    response.raise_for_status()
-    return response.json()
+    return await get_json(client, "/climate/v2/datasets")
 
 
 async def get_grid_info(client: httpx.AsyncClient, grid_id: Optional[int] = None) -> Dict[str, Any]:
     """Get information about GEMS grid system resolutions."""
     if grid_id is not None:
-        response = await client.get(f"/climate/v2/grid/{grid_id}")
-    else:
-        response = await client.get("/climate/v2/grid")
-    response.raise_for_status()
-    return response.json()
+        return await get_json(client, f"/climate/v2/grid/{grid_id}")
+    return await get_json(client, "/climate/v2/grid")
 
 
 async def list_soil(client: httpx.AsyncClient) -> Dict[str, Any]:
     """List available soil datasets and properties."""
-    response = await client.get("/soil/v2/datasets")
-    response.raise_for_status()
-    return response.json()
+    return await get_json(client, "/soil/v2/datasets")
 
 
 async def list_landcover(client: httpx.AsyncClient) -> Dict[str, Any]:
     """List available land cover datasets."""
-    response = await client.get("/landcover/v2/datasets")
-    response.raise_for_status()
-    return response.json()
+    return await get_json(client, "/landcover/v2/datasets")
 
 
 async def list_elevation(client: httpx.AsyncClient) -> Dict[str, Any]:
     """List available elevation datasets."""
-    response = await client.get("/elevation/v2/datasets")
-    response.raise_for_status()
-    return response.json()
+    return await get_json(client, "/elevation/v2/datasets")
 
 
 async def list_crop(client: httpx.AsyncClient) -> Dict[str, Any]:
     """List available crop calendar datasets."""
-    response = await client.get("/crop/v2/datasets")
-    response.raise_for_status()
-    return response.json()
+    return await get_json(client, "/crop/v2/datasets")
 
 
 async def list_hydro(client: httpx.AsyncClient) -> Dict[str, Any]:
     """List available water quality and hydrological datasets."""
-    response = await client.get("/hydro/v2/datasets")
-    response.raise_for_status()
-    return response.json()
+    return await get_json(client, "/hydro/v2/datasets")
 
 
 async def list_market(client: httpx.AsyncClient) -> Dict[str, Any]:
     """List available market accessibility datasets."""
-    response = await client.get("/market/v2/datasets")
-    response.raise_for_status()
-    return response.json()
+    return await get_json(client, "/market/v2/datasets")
 
 
 async def list_biotic_risk(client: httpx.AsyncClient) -> Dict[str, Any]:
     """List available biotic risk datasets."""
-    response = await client.get("/biotic-risk/v2/datasets")
-    response.raise_for_status()
-    return response.json()
\ No newline at end of file
+    return await get_json(client, "/biotic-risk/v2/datasets")
+
+
+async def list_datasets(client: httpx.AsyncClient, api_type: str, ttl: Optional[float] = None) -> List[Dict[str, Any]]:
+    """List the datasets of any API."""
+    return await get_json(client, f"/{api_type}/v2/datasets", ttl=ttl)
+
+
+async def list_layers(
+    client: httpx.AsyncClient,
+    api_type: str,
+    dataset_name: str,
+    ttl: Optional[float] = None
+) -> List[Dict[str, Any]]:
+    """List the layers of a dataset."""
+    return await get_json(client, f"/{api_type}/v2/{dataset_name}/layer", ttl=ttl)
+
+
+async def get_layer(client: httpx.AsyncClient, api_type: str, dataset_name: str, layer_id: int) -> Optional[Dict[str, Any]]:
+    """Get one layer of a dataset."""
+    return await get_json(client, f"/{api_type}/v2/{dataset_name}/layer/{layer_id}")
+
+
+async def load_catalog(client: httpx.AsyncClient) -> Tuple[List[Dict[str, Any]], Set[str]]:
+    """
+    Load catalog records for every API: datasets, their layers and the grid
+    levels and time ranges of their objects.
+
+    At most CATALOG_CONCURRENCY listing requests run at once, counting each
+    page of object results. Listings still in the response cache are reused,
+    so a reload only fetches those whose TTL has expired.
+
+    Returns the records and the APIs whose dataset listing failed. A dataset
+    whose layers or objects cannot be listed is still recorded, without those
+    details.
+    """
+    semaphore = asyncio.Semaphore(max(1, Config.CATALOG_CONCURRENCY))
+    failed: Set[str] = set()
+
+    async def limited(coroutine: Any) -> Any:
+        async with semaphore:
+            return await coroutine
+
+    async def list_objects(api_type: str, keyname: str) -> List[Dict[str, Any]]:
+        # One page at a time per dataset; the semaphore bounds the whole load
+        objects: List[Dict[str, Any]] = []
+        while len(objects) < Config.CATALOG_MAX_OBJECTS:
+            limit = min(MAX_PAGE_SIZE, Config.CATALOG_MAX_OBJECTS - len(objects))
+            page = await limited(search_data(client, api_type, keyname, limit=limit, offset=len(objects))) or []
+            objects.extend(page)
+            if len(page) < limit:
+                break
+        return objects
+
+    async def dataset_records(api_type: str, dataset: Dict[str, Any]) -> List[Dict[str, Any]]:
+        keyname = dataset.get("keyname")
+        layers, objects = await asyncio.gather(
+            limited(list_layers(client, api_type, keyname)),
+            list_objects(api_type, keyname) if Config.CATALOG_MAX_OBJECTS > 0 else asyncio.sleep(0),
+            return_exceptions=True
+        )
+        for name, value in (("layers", layers), ("objects", objects)):
+            if isinstance(value, Exception):
+                logger.info("Could not list %s of %s/%s: %s", name, api_type, keyname, value)
+        layers = layers if isinstance(layers, list) else None
+        objects = objects if isinstance(objects, list) else None
+        complete = objects is None or len(objects) < Config.CATALOG_MAX_OBJECTS
+        return build_records(api_type, dataset, layers, objects, complete)
+
+    async def api_records(api_type: str) -> List[Dict[str, Any]]:
+        try:
+            listed = await limited(list_datasets(client, api_type))
+        except Exception as e:
+            logger.info("Could not list %s datasets: %s", api_type, e)
+            failed.add(api_type)
+            return []
+        groups = await asyncio.gather(*(
+            dataset_records(api_type, dataset) for dataset in listed if isinstance(dataset, dict) and dataset.get("keyname")
+        ))
+        return [record for group in groups for record in group]
+
+    groups = await asyncio.gather(*(api_records(api_type) for api_type in CATALOG_APIS))
+    if len(failed) == len(CATALOG_APIS):
+        raise RuntimeError("No dataset listing could be loaded")
+    return [record for group in groups for record in group], failed
+
+
+async def catalog(client: httpx.AsyncClient) -> Catalog:
+    """Get the dataset catalog, loading it on first use."""
+    return await catalog_store.get(lambda: load_catalog(client))
+
+
+async def search_catalog(client: httpx.AsyncClient, query: str = "", limit: int = 20, **filters: Any) -> Dict[str, Any]:
+    """Search datasets and layers of every API by keyword, API, grid level, time and data type."""
+    snapshot = await catalog(client)
+    updated = datetime.fromtimestamp(snapshot.updated_at, timezone.utc).isoformat(timespec="seconds")
+    return {**catalog_store.search(snapshot, query=query, limit=limit, **filters), "catalog_updated": updated}
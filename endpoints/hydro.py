@@ -0,0 +1,107 @@
+"""
+Hydro catchment and lake endpoints for GEMS Exchange
+"""
+import asyncio
+from typing import Dict, Any, List, Optional
+import httpx
+
+from catchments import DIRECTIONS, catchment_graph
+from config import Config
+from .base import get_json
+
+
+async def get_catchment(client: httpx.AsyncClient, catchment_id: str) -> Optional[Dict[str, Any]]:
+    """Get a level-9 catchment record."""
+    record = catchment_graph.records.get(str(catchment_id))
+    if record is None:
+        record = await get_json(client, f"/hydro/v2/catchment/{catchment_id}")
+        catchment_graph.add(record)
+    return record
+
+
+async def search_point(client: httpx.AsyncClient, lat: float, lon: float, mndnr_level: int = 9) -> Any:
+    """Get the catchment containing a point at a Minnesota DNR HUC level."""
+    result = await get_json(
+        client, "/hydro/v2/catchment/search/point", {"lat": lat, "lon": lon, "mndnr_level": mndnr_level}
+    )
+    catchment_graph.add(result)
+    return result
+
+
+async def get_lake_catchment(client: httpx.AsyncClient, lake_id: str) -> Optional[Dict[str, Any]]:
+    """Get the level-9 catchment of a Minnesota lake."""
+    result = await get_json(client, f"/hydro/v2/lake-mn/{lake_id}/catchment")
+    catchment_graph.add(result)
+    return result
+
+
+async def get_network(
+    client: httpx.AsyncClient,
+    catchment_id: str,
+    direction: str = "upstream",
+    limit: Optional[int] = None
+) -> Dict[str, Any]:
+    """
+    Get the catchments upstream or downstream of a catchment.
+
+    Answered as a local graph walk when an earlier fetch covered this catchment's
+    network; otherwise the full set is fetched once and added to the graph.
+    """
+    if direction not in DIRECTIONS:
+        raise ValueError(f"direction must be one of {', '.join(DIRECTIONS)}")
+    catchment_id = str(catchment_id)
+    records = catchment_graph.walk(catchment_id, direction)
+    source = "local"
+    if records is None:
+        source = "upstream"
+        # Always fetch the whole set so it can answer later walks; the graph holds it,
+        # so the response cache is skipped
+        _, fetched = await asyncio.gather(
+            get_catchment(client, catchment_id),
+            get_json(client, f"/hydro/v2/catchment/{catchment_id}/{direction}", ttl=0)
+        )
+        catchment_graph.add_network(catchment_id, direction, fetched or [])
+        records = catchment_graph.walk(catchment_id, direction)
+        if records is None:
+            records = [r for r in fetched or [] if str(r.get("id")) != catchment_id]
+    total = len(records)
+    if limit is not None:
+        records = records[:limit]
+    return {"count": total, "source": source, "catchments": records}
+
+
+async def get_geometry(client: httpx.AsyncClient, catchment_id: str) -> Any:
+    """Get the GeoJSON geometry of a level-9 catchment, loading it on first use."""
+    catchment_id = str(catchment_id)
+    geometry = catchment_graph.get_geometry(catchment_id)
+    if geometry is None:
+        geometry = await get_json(client, f"/hydro/v2/catchment/{catchment_id}/geometry", ttl=0)
+        catchment_graph.set_geometry(catchment_id, geometry)
+    return geometry
+
+
+async def get_network_geometry(
+    client: httpx.AsyncClient,
+    catchment_id: str,
+    direction: str = "upstream",
+    union: bool = False
+) -> Any:
+    """Get the geometry of a catchment's upstream or downstream network."""
+    if direction not in DIRECTIONS:
+        raise ValueError(f"direction must be one of {', '.join(DIRECTIONS)}")
+    if union:
+        return await get_json(
+            client, f"/hydro/v2/catchment/{catchment_id}/{direction}/geometry", {"union": "true"}
+        )
+    network = await get_network(client, catchment_id, direction)
+    semaphore = asyncio.Semaphore(Config.POINT_CONCURRENCY)
+
+    async def feature(record: Dict[str, Any]) -> Dict[str, Any]:
+        async with semaphore:
+            geometry = await get_geometry(client, record["id"])
+        if isinstance(geometry, dict) and geometry.get("type") == "Feature":
+            return geometry
+        return {"type": "Feature", "id": record["id"], "properties": {"id": record["id"]}, "geometry": geometry}
+
+    features: List[Dict[str, Any]] = await asyncio.gather(*(feature(r) for r in network["catchments"]))
+    return {"type": "FeatureCollection", "features": features}
@@ -1,22 +1,112 @@
 """
 Plant variety and pedigree endpoints for GEMS Exchange
 """
-from typing import Dict, Any, List
+import asyncio
+from typing import Dict, Any, List, Optional
 import httpx
 
+import copstore
+from copstore import cop_store
+from pedigree import Crosses, pedigree_graph
+from .base import get_json, post_json
+
 
 async def search_variety(client: httpx.AsyncClient, variety_name: str, pedigree_depth: int = 5) -> Dict[str, Any]:
-    """Search for plant varieties and get pedigree information."""
-    response = await client.get(f"/pedtools/v1/{variety_name}?pedigree_depth={pedigree_depth}")
-    response.raise_for_status()
-    return response.json()
+    """Search for plant varieties and get pedigree information, adding them to the local pedigree graph."""
+    result = await get_json(client, f"/pedtools/v1/{variety_name}", {"pedigree_depth": pedigree_depth})
+    pedigree_graph.add_varieties(result, pedigree_depth)
+    return result
 
 
 async def calculate_cop_matrix(client: httpx.AsyncClient, variety_names: List[str], max_depth: int = 10) -> Dict[str, Any]:
-    """Calculate coefficient of parentage matrix for plant varieties."""
-    response = await client.post(
-        f"/pedtools/v1/cop/matrix?max_depth={max_depth}",
-        json=variety_names
-    )
-    response.raise_for_status()
-    return response.json()
\ No newline at end of file
+    """
+    Calculate coefficient of parentage matrix for plant varieties.
+
+    Pairs already in the COP store are reused; only the varieties involved in
+    missing pairs are sent upstream, and the full matrix is assembled locally.
+
+    /cop/matrix only computes the full matrix of the names it is sent; it cannot
+    be asked for the new-by-known block alone. A name not seen before is missing a
+    pair with every other variety, so adding it to a known panel still sends the
+    whole panel. Requests that only add pairs among known varieties send just the
+    varieties in those pairs.
+    """
+    names = list(dict.fromkeys(variety_names))
+    canonical: Dict[str, str] = {}
+    for name in names:
+        resolved = await cop_store.canonical(name)
+        if resolved is not None:
+            canonical[name] = resolved
+    known = list(dict.fromkeys(canonical.values()))
+    pairs = await cop_store.get_pairs(known, max_depth)
+    reused = len(pairs)
+
+    unknown = [name for name in names if name not in canonical]
+    involved = set()
+    for i, a in enumerate(known):
+        for b in known[i:]:
+            if copstore.pair_key(a, b, max_depth) not in pairs:
+                involved.update((a, b))
+    if unknown:
+        # Pairs of an unknown name are never stored, so it is paired with every known name
+        involved.update(known)
+    to_send = unknown + [name for name in known if name in involved]
+    if to_send:
+        # The pair store replaces the response cache for this route
+        response = await post_json(
+            client, "/pedtools/v1/cop/matrix", to_send, {"max_depth": max_depth}, ttl=0
+        ) or {}
+        pairs.update(await cop_store.add_response(response, max_depth))
+        for name in unknown:
+            resolved = (response.get("reverse_mapping") or {}).get(name) or await cop_store.canonical(name)
+            if resolved is not None:
+                canonical[name] = resolved
+    result = copstore.assemble(names, canonical, pairs, max_depth)
+    result["pairs_reused"] = reused
+    result["varieties_sent"] = len(to_send)
+    return result
+
+
+async def cop_matrix(client: httpx.AsyncClient, variety_names: List[str], max_depth: int = 10) -> Dict[str, Any]:
+    """
+    Calculate a COP matrix in-process for varieties whose ancestry is in the local pedigree graph.
+
+    Names may also be hypothetical crosses of loaded varieties in Purdy notation
+    (e.g. 'A/B'). Varieties whose ancestry was not loaded to max_depth
+    generations (see search_variety's pedigree_depth) are sent to the upstream
+    /cop/matrix route, along with the named local varieties they are paired with.
+    """
+    names = list(dict.fromkeys(variety_names))
+    crosses: Crosses = {}
+    nodes = {name: pedigree_graph.resolve(name, max_depth, crosses) for name in names}
+    local = [name for name in names if nodes[name] is not None]
+    remote = [name for name in names if nodes[name] is None]
+    labels = {name: pedigree_graph.names[nodes[name]] if nodes[name] >= 0 else name for name in local}
+
+    result: Dict[str, Any] = {"reverse_mapping": {}, "forward_mapping": {}, "cop": {}}
+    if remote:
+        # Hypothetical crosses are unknown upstream, so only send named varieties
+        named = [labels[name] for name in local if nodes[name] >= 0]
+        result = await calculate_cop_matrix(client, remote + named, max_depth)
+        result["reverse_mapping"] = {
+            name: result["reverse_mapping"][name] for name in remote if name in result["reverse_mapping"]
+        }
+        result["forward_mapping"] = {}
+        for name, canonical in result["reverse_mapping"].items():
+            result["forward_mapping"].setdefault(canonical, []).append(name)
+
+    if local:
+        unique = list(dict.fromkeys(nodes[name] for name in local))
+        matrix = await asyncio.to_thread(pedigree_graph.cop_matrix, unique, max_depth, crosses)
+        position = {node: i for i, node in enumerate(unique)}
+        for name in local:
+            result["reverse_mapping"][name] = labels[name]
+            result["forward_mapping"].setdefault(labels[name], []).append(name)
+        for a in local:
+            row = result["cop"].setdefault(labels[a], {})
+            for b in local:
+                row[labels[b]] = matrix[position[nodes[a]]][position[nodes[b]]]
+
+    result["pairs_local"] = len(local) * (len(local) + 1) // 2
+    result["varieties_upstream"] = len(remote)
+    return result
\ No newline at end of file
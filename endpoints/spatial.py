@@ -1,9 +1,28 @@
 """
 Spatial data search and retrieval endpoints for GEMS Exchange
 """
-from typing import Dict, Any, Optional
+import asyncio
+from collections import deque
+from typing import Dict, Any, AsyncIterator, List, Optional, Sequence, Tuple
 import httpx
 
+import aggregation
+from cache import request_key
+from config import Config
+from envelopes import EnvelopeIndex, envelope_store, select_object
+from rasters import raster_store
+import grid
+import sampling
+from sampling import tile_cache
+from snapping import cell_snapper, distinct_points
+from .base import get_json, post_json
+
+# Largest page the object/search routes accept
+MAX_PAGE_SIZE = 300
+
+# Aggregate routes available on every gridded object
+AGGREGATES = ("stats", "histogram", "quantiles", "valuecount")
+
 
 async def search_data(
     client: httpx.AsyncClient,
@@ -11,19 +30,91 @@ async def search_data(
     dataset_name: str,
     bbox: Optional[str] = None,
     grid_level: Optional[int] = None,
-    limit: int = 100
+    limit: int = 100,
+    offset: int = 0,
+    layer_id: Optional[int] = None,
+    ttl: Optional[float] = None
 ) -> Dict[str, Any]:
     """Search for spatial data objects in various dataset types."""
-    params = [f"limit={limit}"]
-    if bbox:
-        params.append(f"bbox={bbox}")
-    if grid_level is not None:
-        params.append(f"grid={grid_level}")
-    
-    query_string = "&".join(params)
-    response = await client.get(f"/{api_type}/v2/{dataset_name}/object/search?{query_string}")
-    response.raise_for_status()
-    return response.json()
+    params = {"limit": limit, "offset": offset or None, "bbox": bbox or None, "grid": grid_level, "layer": layer_id}
+    return await get_json(client, f"/{api_type}/v2/{dataset_name}/object/search", params, ttl=ttl)
+
+
+async def iter_search_pages(
+    client: httpx.AsyncClient,
+    api_type: str,
+    dataset_name: str,
+    bbox: Optional[str] = None,
+    grid_level: Optional[int] = None,
+    max_results: Optional[int] = None,
+    page_size: int = MAX_PAGE_SIZE,
+    concurrency: Optional[int] = None,
+    layer_id: Optional[int] = None,
+    ttl: Optional[float] = None
+) -> AsyncIterator[List[Dict[str, Any]]]:
+    """
+    Yield pages of search results in order until a short page or max_results is reached.
+
+    The total is not known up front, so only the first page is requested until
+    it comes back full. After that, up to `concurrency` pages are requested ahead
+    of the consumer, so the next page is usually already downloaded when the
+    current one has been processed. Pages past max_results are never requested.
+    """
+    page_size = max(1, min(page_size, MAX_PAGE_SIZE))
+    ahead = max(1, concurrency or Config.SEARCH_PAGE_CONCURRENCY)
+    pending: "deque[asyncio.Task[Any]]" = deque()
+    next_offset = 0
+    remaining = max_results
+    # One page at a time until a full page shows there are more results
+    window = 1
+
+    def schedule() -> None:
+        nonlocal next_offset
+        while len(pending) < window and (max_results is None or next_offset < max_results):
+            limit = page_size if max_results is None else min(page_size, max_results - next_offset)
+            pending.append(asyncio.ensure_future(
+                search_data(client, api_type, dataset_name, bbox, grid_level, limit, next_offset, layer_id, ttl)
+            ))
+            next_offset += limit
+
+    try:
+        schedule()
+        while pending:
+            limit = page_size if remaining is None else min(page_size, remaining)
+            page = await pending.popleft() or []
+            if remaining is not None:
+                remaining -= len(page)
+            if len(page) < limit or remaining == 0:
+                if page:
+                    yield page
+                return
+            window = ahead
+            schedule()
+            yield page
+    finally:
+        for task in pending:
+            task.cancel()
+
+
+async def search_all(
+    client: httpx.AsyncClient,
+    api_type: str,
+    dataset_name: str,
+    bbox: Optional[str] = None,
+    grid_level: Optional[int] = None,
+    max_results: Optional[int] = None,
+    concurrency: Optional[int] = None,
+    layer_id: Optional[int] = None,
+    ttl: Optional[float] = None
+) -> List[Dict[str, Any]]:
+    """Collect search results across pages, up to max_results objects."""
+    results: List[Dict[str, Any]] = []
+    async for page in iter_search_pages(
+        client, api_type, dataset_name, bbox, grid_level, max_results,
+        concurrency=concurrency, layer_id=layer_id, ttl=ttl
+    ):
+        results.extend(page)
+    return results
 
 
 async def get_point_data(
@@ -32,11 +123,434 @@ async def get_point_data(
     dataset_name: str,
     object_id: int,
     lat: float,
-    lon: float
+    lon: float,
+    snap: bool = True
 ) -> Dict[str, Any]:
-    """Get point data for a specific location from various dataset types."""
-    response = await client.get(
-        f"/{api_type}/v2/{dataset_name}/object/{object_id}/point?lat={lat}&lon={lon}"
+    """
+    Get point data for a specific location from various dataset types.
+
+    The location is snapped to the center of its cell in the object's grid, so
+    every point in a cell shares one cached lookup. The first call for an object
+    waits for its grid to load.
+    """
+    if snap:
+        cell_grid = await object_grid(client, api_type, dataset_name, object_id)
+        if cell_grid is not None:
+            lat, lon = cell_snapper.snap_point(cell_grid, lat, lon)
+    return await get_json(
+        client,
+        f"/{api_type}/v2/{dataset_name}/object/{object_id}/point",
+        {"lat": lat, "lon": lon}
     )
-    response.raise_for_status()
-    return response.json()
\ No newline at end of file
+
+
+async def object_grid(
+    client: httpx.AsyncClient,
+    api_type: str,
+    dataset_name: str,
+    object_id: int
+) -> Optional[grid.CellGrid]:
+    """Get the cell grid of a data object, or None when it is unknown or snapping is off."""
+    async def load() -> Dict[str, Any]:
+        metadata = await get_object(client, api_type, dataset_name, object_id)
+        return await get_json(client, f"/{api_type}/v2/grid/{metadata['grid_id']}")
+
+    return await cell_snapper.resolve((api_type, dataset_name, object_id), load)
+
+
+async def snap_points(
+    client: httpx.AsyncClient,
+    api_type: str,
+    dataset_name: str,
+    object_id: int,
+    points: Sequence[Tuple[float, float]]
+) -> Tuple[List[Tuple[float, float]], List[int]]:
+    """
+    Snap points to the cells of an object's grid. Returns the distinct points to
+    query and, for each input point, the index of its distinct point.
+    """
+    cell_grid = await object_grid(client, api_type, dataset_name, object_id) if points else None
+    if cell_grid is None:
+        return distinct_points(points)
+    return cell_snapper.snap(cell_grid, points)
+
+
+async def get_envelope(
+    client: httpx.AsyncClient,
+    api_type: str,
+    dataset_name: str,
+    object_id: int
+) -> Dict[str, Any]:
+    """Get the GeoJSON envelope of a spatial data object."""
+    return await get_json(client, f"/{api_type}/v2/{dataset_name}/object/{object_id}/envelope")
+
+
+async def get_raster(
+    client: httpx.AsyncClient,
+    api_type: str,
+    dataset_name: str,
+    object_id: int,
+    bbox: Optional[str] = None,
+    geometry: Optional[Dict[str, Any]] = None,
+    compress: str = "LZW"
+) -> Dict[str, Any]:
+    """Download an object's GeoTIFF to the local raster store and describe the file."""
+    path = f"/{api_type}/v2/{dataset_name}/object/{object_id}/raster"
+    params: Dict[str, Any] = {"compress": compress}
+    if geometry is not None:
+        method = "POST"
+    else:
+        method = "GET"
+        if bbox:
+            params["bbox"] = bbox
+    key = request_key(method, path, params, geometry)
+    file_info, envelope = await asyncio.gather(
+        raster_store.fetch(client, key, method, path, params, geometry),
+        get_envelope(client, api_type, dataset_name, object_id)
+    )
+    return {**file_info, "envelope": envelope}
+
+
+async def get_object(
+    client: httpx.AsyncClient,
+    api_type: str,
+    dataset_name: str,
+    object_id: int
+) -> Dict[str, Any]:
+    """Get metadata for a spatial data object."""
+    return await get_json(client, f"/{api_type}/v2/{dataset_name}/object/{object_id}")
+
+
+async def sample_points(
+    client: httpx.AsyncClient,
+    api_type: str,
+    dataset_name: str,
+    object_id: int,
+    points: Sequence[Tuple[float, float]],
+    interpolation: str = "nearest"
+) -> List[Dict[str, Any]]:
+    """
+    Get values of one object at many (lat, lon) points.
+
+    Points that fall inside locally cached raster tiles are answered with vectorized
+    lookups. When enough points fall outside them, the raster covering those points is
+    downloaded once and sampled. Anything left uses the HTTP point route.
+    """
+    if interpolation not in sampling.INTERPOLATIONS:
+        raise ValueError(f"interpolation must be one of {', '.join(sampling.INTERPOLATIONS)}")
+    results: List[Optional[Dict[str, Any]]] = [None] * len(points)
+    missing = list(range(len(points)))
+
+    if points and sampling.available():
+        np = sampling.np
+        object_key = (api_type, dataset_name, object_id)
+        lats = np.array([p[0] for p in points], dtype=np.float64)
+        lons = np.array([p[1] for p in points], dtype=np.float64)
+        values, covered = tile_cache.sample(object_key, lons, lats, interpolation)
+        todo = np.flatnonzero(~covered)
+        if len(todo) >= Config.SAMPLING_MIN_TILE_POINTS:
+            if await _load_tile(client, api_type, dataset_name, object_id, lons[todo], lats[todo]):
+                more_values, more_covered = tile_cache.sample(object_key, lons[todo], lats[todo], interpolation)
+                values[todo] = more_values
+                covered[todo] = more_covered
+        for i in np.flatnonzero(covered):
+            value = values[i]
+            results[i] = {"value": None if np.isnan(value) else float(value), "source": "local"}
+        missing = np.flatnonzero(~covered).tolist()
+
+    # Points left for the HTTP route share one request per grid cell
+    snapped, index = await snap_points(client, api_type, dataset_name, object_id, [points[i] for i in missing])
+    semaphore = asyncio.Semaphore(Config.POINT_CONCURRENCY)
+
+    async def fetch(lat: float, lon: float) -> Dict[str, Any]:
+        async with semaphore:
+            try:
+                result = await get_point_data(client, api_type, dataset_name, object_id, lat, lon, snap=False)
+                return {**(result or {}), "source": "http"}
+            except Exception as e:
+                return {"error": str(e), "source": "http"}
+
+    fetched = await asyncio.gather(*(fetch(lat, lon) for lat, lon in snapped))
+    for i, k in zip(missing, index):
+        results[i] = fetched[k]
+    return [
+        {"latitude": lat, "longitude": lon, **result}
+        for (lat, lon), result in zip(points, results)
+    ]
+
+
+async def _load_tile(
+    client: httpx.AsyncClient,
+    api_type: str,
+    dataset_name: str,
+    object_id: int,
+    lons: Any,
+    lats: Any
+) -> bool:
+    """Download and open the raster covering the given points. Returns False to fall back to HTTP."""
+    pad_lon = max(0.001, 0.01 * float(lons.max() - lons.min()))
+    pad_lat = max(0.001, 0.01 * float(lats.max() - lats.min()))
+    minx, maxx = max(-180.0, float(lons.min()) - pad_lon), min(180.0, float(lons.max()) + pad_lon)
+    miny, maxy = max(-90.0, float(lats.min()) - pad_lat), min(90.0, float(lats.max()) + pad_lat)
+    try:
+        metadata = await get_object(client, api_type, dataset_name, object_id)
+        details = await get_json(client, f"/{api_type}/v2/grid/{metadata['grid_id']}")
+        x, y = grid.project([minx, maxx], [miny, maxy], details["srid"])
+        pixels = (abs(x[1] - x[0]) / details["scale"] + 1) * (abs(y[1] - y[0]) / details["scale"] + 1)
+        if pixels > Config.SAMPLING_MAX_TILE_PIXELS:
+            return False
+        bbox = f"{minx:.6f},{miny:.6f},{maxx:.6f},{maxy:.6f}"
+        file_info = await get_raster(client, api_type, dataset_name, object_id, bbox=bbox, compress="NONE")
+        tile = await asyncio.to_thread(sampling.RasterTile.open, file_info["path"])
+    except Exception:
+        return False
+    tile_cache.add((api_type, dataset_name, object_id), tile)
+    return True
+
+
+async def envelope_index(
+    client: httpx.AsyncClient,
+    api_type: str,
+    dataset_name: str,
+    layer_id: Optional[int] = None
+) -> EnvelopeIndex:
+    """
+    Get the envelope index of a dataset's objects (optionally one layer).
+
+    The first call lists the objects with object/search and fetches every
+    envelope. Later refreshes list the objects again, bypassing the response
+    cache, and fetch envelopes only for objects not yet indexed.
+    """
+    async def fill(index: EnvelopeIndex) -> None:
+        objects = await search_all(
+            client, api_type, dataset_name, max_results=Config.ENVELOPE_MAX_OBJECTS,
+            layer_id=layer_id, ttl=0 if index.updated_at else None
+        )
+        semaphore = asyncio.Semaphore(max(1, Config.ENVELOPE_CONCURRENCY))
+
+        async def fetch(object_id: int) -> Tuple[int, Any]:
+            async with semaphore:
+                try:
+                    return object_id, await get_envelope(client, api_type, dataset_name, object_id)
+                except Exception:
+                    # Retried on the next refresh
+                    return object_id, None
+
+        fetched = await asyncio.gather(*(fetch(i) for i in index.missing_envelopes(objects)))
+        index.update(objects, {i: envelope for i, envelope in fetched if envelope is not None})
+
+    return await envelope_store.index((api_type, dataset_name, layer_id), fill)
+
+
+async def lookup_points(
+    client: httpx.AsyncClient,
+    api_type: str,
+    dataset_name: str,
+    points: Sequence[Tuple[float, float]],
+    layer_id: Optional[int] = None,
+    grid_level: Optional[int] = None,
+    when: Optional[str] = None,
+    interpolation: str = "nearest"
+) -> List[Dict[str, Any]]:
+    """
+    Get values at (lat, lon) points without knowing the object ids.
+
+    The object covering each point is resolved locally from the envelope index
+    (see envelopes.select_object for the choice between overlapping objects).
+    The points of each object are then sampled together with sample_points, from
+    cached rasters or the point route.
+    """
+    grid.require_numpy()
+    index = await envelope_index(client, api_type, dataset_name, layer_id)
+    np = grid.np
+    lats = np.array([p[0] for p in points], dtype=np.float64)
+    lons = np.array([p[1] for p in points], dtype=np.float64)
+    candidates = index.covering(lons, lats)
+
+    by_object: Dict[int, List[int]] = {}
+    results: List[Dict[str, Any]] = []
+    for i, ((lat, lon), ids) in enumerate(zip(points, candidates)):
+        chosen = select_object([index.objects[j] for j in ids], grid_level, when)
+        if chosen is None:
+            results.append({"latitude": lat, "longitude": lon, "error": "No object covers this point", "candidates": len(ids)})
+        else:
+            by_object.setdefault(chosen["id"], []).append(i)
+            results.append({})
+
+    semaphore = asyncio.Semaphore(max(1, Config.ENVELOPE_CONCURRENCY))
+
+    async def sample(object_id: int, rows: List[int]) -> None:
+        async with semaphore:
+            try:
+                sampled = await sample_points(
+                    client, api_type, dataset_name, object_id, [points[i] for i in rows], interpolation
+                )
+            except Exception as e:
+                sampled = [{"latitude": points[i][0], "longitude": points[i][1], "error": str(e)} for i in rows]
+        for i, result in zip(rows, sampled):
+            results[i] = {**result, "object_id": object_id}
+
+    await asyncio.gather(*(sample(object_id, rows) for object_id, rows in by_object.items()))
+    return results
+
+
+async def extract_points(
+    client: httpx.AsyncClient,
+    sites: Sequence[Tuple[float, float]],
+    layers: Sequence[Dict[str, Any]],
+    concurrency: Optional[int] = None,
+    per_service: Optional[int] = None
+) -> Dict[str, Any]:
+    """
+    Get point values for every (site, layer) pair as a columnar table.
+
+    Each layer is a dict with api_type, dataset and object_id (and an optional name).
+    Sites are snapped to each layer's grid cells, so sites sharing a cell share one
+    request. Requests run with at most `concurrency` in flight overall and
+    `per_service` per API. A failed cell is recorded in `errors` (once per site)
+    and left as None in `values`.
+    """
+    limit = asyncio.Semaphore(max(1, concurrency or Config.POINT_CONCURRENCY))
+    per_service = max(1, per_service or Config.POINT_CONCURRENCY_PER_SERVICE)
+    service_limits = {layer["api_type"]: asyncio.Semaphore(per_service) for layer in layers}
+    values: List[List[Any]] = [[None] * len(layers) for _ in sites]
+    errors: List[Dict[str, Any]] = []
+    snapped = await asyncio.gather(*(
+        snap_points(client, layer["api_type"], layer["dataset"], layer["object_id"], sites) for layer in layers
+    ))
+    # For each layer and snapped point, the sites it answers
+    site_rows: List[List[List[int]]] = []
+    for points, index in snapped:
+        rows_by_point: List[List[int]] = [[] for _ in points]
+        for row, k in enumerate(index):
+            rows_by_point[k].append(row)
+        site_rows.append(rows_by_point)
+
+    async def fetch(col: int, k: int) -> None:
+        lat, lon = snapped[col][0][k]
+        layer = layers[col]
+        rows = site_rows[col][k]
+        async with service_limits[layer["api_type"]], limit:
+            try:
+                result = await get_point_data(
+                    client, layer["api_type"], layer["dataset"], layer["object_id"], lat, lon, snap=False
+                )
+            except Exception as e:
+                errors.extend({"site": row, "layer": col, "error": str(e)} for row in rows)
+                return
+        value = result.get("value") if isinstance(result, dict) and "value" in result else result
+        for row in rows:
+            values[row][col] = value
+
+    await asyncio.gather(*(fetch(col, k) for col in range(len(layers)) for k in range(len(snapped[col][0]))))
+    errors.sort(key=lambda e: (e["site"], e["layer"]))
+    return {
+        "sites": [[lat, lon] for lat, lon in sites],
+        "layers": [
+            layer.get("name") or f"{layer['api_type']}:{layer['dataset']}:{layer['object_id']}"
+            for layer in layers
+        ],
+        "values": values,
+        "errors": errors
+    }
+
+
+async def get_aggregate(
+    client: httpx.AsyncClient,
+    api_type: str,
+    dataset_name: str,
+    object_id: int,
+    kind: str,
+    bbox: Optional[str] = None,
+    geometry: Optional[Dict[str, Any]] = None,
+    nbin: Optional[int] = None,
+    quantiles: Optional[Sequence[float]] = None
+) -> Any:
+    """Get stats, a histogram, quantiles or value counts of an object over a bbox or GeoJSON geometry."""
+    if kind not in AGGREGATES:
+        raise ValueError(f"Unknown aggregate '{kind}', expected one of {', '.join(AGGREGATES)}")
+    path = f"/{api_type}/v2/{dataset_name}/object/{object_id}/{kind}"
+    params: Dict[str, Any] = {}
+    if kind == "histogram":
+        params["nbin"] = nbin
+    if kind == "quantiles" and quantiles:
+        params["q"] = list(quantiles)
+    if geometry is not None:
+        return await post_json(client, path, geometry, params)
+    if not bbox:
+        raise ValueError("A bbox or geometry is required")
+    params["bbox"] = bbox
+    return await get_json(client, path, params)
+
+
+async def aggregate_tiled(
+    client: httpx.AsyncClient,
+    api_type: str,
+    dataset_name: str,
+    object_id: int,
+    kind: str,
+    bbox: str,
+    nbin: int = 10,
+    quantiles: Optional[Sequence[float]] = None,
+    max_tile_pixels: Optional[int] = None,
+    concurrency: Optional[int] = None
+) -> Dict[str, Any]:
+    """
+    Aggregate a large bbox by splitting it into pixel-aligned tiles queried concurrently.
+
+    Stats and value counts merge exactly. Histograms of discrete layers are binned
+    locally from the merged value counts, so they are exact too. Value counts of a
+    continuous layer hold one entry per distinct value, so histograms of continuous
+    (or unknown) layers are built from the tiles' quantile functions instead, like
+    quantiles. Both are approximate (rank error at most 1/aggregation.QUANTILE_RESOLUTION).
+    """
+    if kind not in AGGREGATES:
+        raise ValueError(f"Unknown aggregate '{kind}', expected one of {', '.join(AGGREGATES)}")
+    metadata = await get_object(client, api_type, dataset_name, object_id)
+    details = await get_json(client, f"/{api_type}/v2/grid/{metadata['grid_id']}")
+    tiles = aggregation.split_bbox(bbox, details, max_tile_pixels or Config.AGGREGATE_TILE_PIXELS)
+    if len(tiles) == 1:
+        result = await get_aggregate(
+            client, api_type, dataset_name, object_id, kind, bbox, nbin=nbin, quantiles=quantiles
+        )
+        return {"tiles": 1, "exact": True, "result": result}
+
+    semaphore = asyncio.Semaphore(max(1, concurrency or Config.AGGREGATE_CONCURRENCY))
+
+    async def fetch(tile: str, tile_kind: str, **kwargs: Any) -> Any:
+        async with semaphore:
+            return await get_aggregate(client, api_type, dataset_name, object_id, tile_kind, tile, **kwargs)
+
+    exact = True
+    if kind == "stats":
+        result = aggregation.merge_stats(await asyncio.gather(*(fetch(t, "stats") for t in tiles)))
+    elif kind == "valuecount" or (
+        kind == "histogram" and await layer_is_discrete(client, api_type, dataset_name, metadata)
+    ):
+        counts = aggregation.merge_value_counts(await asyncio.gather(*(fetch(t, "valuecount") for t in tiles)))
+        result = counts if kind == "valuecount" else aggregation.histogram_from_counts(counts, nbin)
+    else:
+        probabilities = aggregation.quantile_probabilities()
+        stats, parts = await asyncio.gather(
+            asyncio.gather(*(fetch(t, "stats") for t in tiles)),
+            asyncio.gather(*(fetch(t, "quantiles", quantiles=probabilities) for t in tiles))
+        )
+        counted = [((s or {}).get("count") or 0, q) for s, q in zip(stats, parts)]
+        if kind == "quantiles":
+            result = aggregation.merge_quantiles(counted, quantiles or [0.25, 0.5, 0.75])
+        else:
+            result = aggregation.histogram_from_quantiles(counted, nbin)
+        exact = False
+    return {"tiles": len(tiles), "exact": exact, "result": result}
+
+
+async def layer_is_discrete(client: httpx.AsyncClient, api_type: str, dataset_name: str, metadata: Dict[str, Any]) -> bool:
+    """Whether an object's layer holds classes rather than continuous values (False when unknown)."""
+    layer_id = metadata.get("layer_id")
+    if layer_id is None:
+        return False
+    try:
+        layer = await get_json(client, f"/{api_type}/v2/{dataset_name}/layer/{layer_id}")
+    except httpx.HTTPError:
+        return False
+    return bool((layer or {}).get("discrete"))
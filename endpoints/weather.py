@@ -1,35 +1,364 @@
 """
 Weather-related endpoints for GEMS Exchange
 """
-from typing import Dict, Any
+import asyncio
+import math
+import time
+from datetime import date, datetime, timedelta, timezone
+from typing import Dict, Any, Callable, List, Optional, Sequence, Tuple
 import httpx
 
+from config import Config
+import grid
+from history import chunk_key, history_store
+from snapping import cell_snapper, distinct_points
+from .base import cache_json, get_json
+
+# History products, their routes and the number of days fetched per upstream request
+HISTORY_PRODUCTS = {
+    "energy": ("/weather/v2/history/energy", 31),
+    "daily": ("/weather/v2/history/daily", 31),
+    "hourly": ("/weather/v2/history/hourly", 7),
+    "subhourly": ("/weather/v2/history/subhourly", 2),
+}
+
+# Fields describing the location rather than a single observation
+HISTORY_META_FIELDS = ("city_name", "city_id", "state_code", "country_code", "timezone", "lat", "lon", "station_id", "sources")
+
+
+async def weather_grid(client: httpx.AsyncClient) -> Optional[grid.CellGrid]:
+    """Get the GEMS grid weather locations are snapped to, or None when it is unknown or snapping is off."""
+    grid_id = Config.WEATHER_SNAP_GRID
+    if grid_id < 0:
+        return None
+    return await cell_snapper.resolve(
+        ("weather", grid_id), lambda: get_json(client, f"/climate/v2/grid/{grid_id}")
+    )
+
+
+async def snap_point(client: httpx.AsyncClient, lat: float, lon: float) -> Tuple[float, float]:
+    """
+    Snap a location to the center of its weather grid cell, so nearby locations
+    share one cached lookup. The first call waits for the grid to load.
+    """
+    cell_grid = await weather_grid(client)
+    if cell_grid is None:
+        return lat, lon
+    return cell_snapper.snap_point(cell_grid, lat, lon)
+
 
 async def get_current(client: httpx.AsyncClient, lat: float, lon: float) -> Dict[str, Any]:
     """Get current weather observations for a location."""
-    response = await client.get(f"/weather/v2/current?lat={lat}&lon={lon}")
-    response.raise_for_status()
-    return response.json()
+    lat, lon = await snap_point(client, lat, lon)
+    return await get_json(client, "/weather/v2/current", {"lat": lat, "lon": lon})
 
 
-async def get_alerts(client: httpx.AsyncClient, lat: float, lon: float) -> Dict[str, Any]:
-    """Get severe weather alerts for a location."""
-    response = await client.get(f"/weather/v2/alerts?lat={lat}&lon={lon}")
-    response.raise_for_status()
-    return response.json()
+async def get_alerts(client: httpx.AsyncClient, lat: float, lon: float, refresh: bool = False) -> Dict[str, Any]:
+    """
+    Get severe weather alerts for a location. Alerts cover polygons rather than
+    grid cells, so the location is not snapped.
+    """
+    return await get_json(client, "/weather/v2/alerts", {"lat": lat, "lon": lon}, refresh=refresh)
 
 
-async def get_forecast(client: httpx.AsyncClient, lat: float, lon: float, days: int = 5) -> Dict[str, Any]:
+async def get_forecast(
+    client: httpx.AsyncClient,
+    lat: float,
+    lon: float,
+    days: int = 5,
+    refresh: bool = False
+) -> Dict[str, Any]:
     """Get weather forecast for a location."""
-    response = await client.get(f"/weather/v2/forecast?lat={lat}&lon={lon}&days={days}")
-    response.raise_for_status()
-    return response.json()
+    lat, lon = await snap_point(client, lat, lon)
+    return await get_json(client, "/weather/v2/forecast", {"lat": lat, "lon": lon, "days": days}, refresh=refresh)
 
 
 async def get_historical(client: httpx.AsyncClient, lat: float, lon: float, start_date: str, end_date: str) -> Dict[str, Any]:
     """Get historical weather data for a location."""
-    response = await client.get(
-        f"/weather/v2/history/energy?lat={lat}&lon={lon}&start_date={start_date}&end_date={end_date}"
+    lat, lon = await snap_point(client, lat, lon)
+    return await get_json(
+        client,
+        "/weather/v2/history/energy",
+        {"lat": lat, "lon": lon, "start_date": start_date, "end_date": end_date}
     )
-    response.raise_for_status()
-    return response.json()
\ No newline at end of file
+
+
+async def get_history_range(
+    client: httpx.AsyncClient,
+    lat: float,
+    lon: float,
+    start_date: str,
+    end_date: str,
+    product: str = "daily",
+    concurrency: Optional[int] = None
+) -> Dict[str, Any]:
+    """
+    Get a historical weather series, fetching only the days not already cached.
+
+    The range [start_date, end_date) is split into chunks aligned to fixed day
+    boundaries. Stored chunks are looked up in one batch, missing days are fetched
+    concurrently and the history store keeps each day's records with its own
+    expiry, so overlapping or extended ranges only fetch the gap. Energy history
+    is requested per day (tp=daily) so it can be split.
+    """
+    if product not in HISTORY_PRODUCTS:
+        raise ValueError(f"Unknown history product '{product}', expected one of {', '.join(HISTORY_PRODUCTS)}")
+    path, chunk_days = HISTORY_PRODUCTS[product]
+    start, end = date.fromisoformat(start_date), date.fromisoformat(end_date)
+    if end <= start:
+        raise ValueError("end_date must be after start_date")
+    lat, lon = await snap_point(client, float(lat), float(lon))
+    lat, lon = round(lat, 4), round(lon, 4)
+    days = [start + timedelta(days=i) for i in range((end - start).days)]
+    keys = {
+        index: chunk_key(product, lat, lon, index)
+        for index in range(start.toordinal() // chunk_days, (end.toordinal() - 1) // chunk_days + 1)
+    }
+
+    records: Dict[date, List[Dict[str, Any]]] = {}
+    meta: Dict[str, Any] = {}
+    now = time.time()
+    for chunk in (await history_store.get_chunks(list(keys.values()))).values():
+        meta = meta or chunk["meta"]
+        for day_text, (expires_at, day_records) in chunk["days"].items():
+            day = date.fromisoformat(day_text)
+            if expires_at > now and start <= day < end:
+                records[day] = day_records
+    cached_days = len(records)
+
+    chunks = _history_chunks([day for day in days if day not in records], chunk_days)
+    semaphore = asyncio.Semaphore(max(1, concurrency or Config.HISTORY_CONCURRENCY))
+
+    async def fetch(chunk_start: date, chunk_end: date) -> Dict[str, Any]:
+        params = {"lat": lat, "lon": lon, "start_date": chunk_start.isoformat(), "end_date": chunk_end.isoformat()}
+        if product == "energy":
+            params["tp"] = "daily"
+        async with semaphore:
+            # The history store replaces the response cache for these routes
+            return await get_json(client, path, params, ttl=0) or {}
+
+    responses = await asyncio.gather(*(fetch(a, b) for a, b in chunks))
+    today = datetime.now(timezone.utc).date()
+    now = time.time()
+    fetched: Dict[str, Dict[str, Any]] = {}
+    for (chunk_start, chunk_end), response in zip(chunks, responses):
+        by_day: Dict[date, List[Dict[str, Any]]] = {
+            chunk_start + timedelta(days=i): [] for i in range((chunk_end - chunk_start).days)
+        }
+        for record in response.get("data") or []:
+            day = _record_day(record)
+            if day in by_day:
+                by_day[day].append(record)
+        # Chunks never cross a boundary, so each one updates a single stored chunk
+        chunk_meta = {k: response[k] for k in HISTORY_META_FIELDS if k in response}
+        stored = fetched.setdefault(keys[chunk_start.toordinal() // chunk_days], {"meta": {}, "days": {}})
+        stored["meta"] = stored["meta"] or chunk_meta
+        meta = meta or chunk_meta
+        for day, day_records in by_day.items():
+            # Settled days rarely change; the last couple may still be revised upstream
+            ttl = Config.HISTORY_DAY_TTL if day < today - timedelta(days=2) else Config.get_cache_ttl("history")
+            if ttl > 0:
+                stored["days"][day.isoformat()] = [now + ttl, day_records]
+            records[day] = day_records
+    await history_store.add(fetched)
+
+    data = [record for day in days for record in records.get(day, [])]
+    return {
+        **meta,
+        "product": product,
+        "start_date": start_date,
+        "end_date": end_date,
+        "count": len(data),
+        "days_cached": cached_days,
+        "chunks_fetched": len(chunks),
+        "data": data,
+    }
+
+
+def _history_chunks(days: List[date], chunk_days: int) -> List[Tuple[date, date]]:
+    """Group missing days into [start, end) ranges that never cross a chunk boundary."""
+    chunks: List[Tuple[date, date]] = []
+    for day in days:
+        if chunks and chunks[-1][1] == day and day.toordinal() % chunk_days != 0:
+            chunks[-1] = (chunks[-1][0], day + timedelta(days=1))
+        else:
+            chunks.append((day, day + timedelta(days=1)))
+    return chunks
+
+
+def _record_day(record: Dict[str, Any]) -> Optional[date]:
+    """Get the UTC day an observation belongs to."""
+    for field in ("timestamp_utc", "datetime", "date"):
+        value = record.get(field)
+        if isinstance(value, str) and len(value) >= 10:
+            try:
+                return date.fromisoformat(value[:10])
+            except ValueError:
+                pass
+    ts = record.get("ts")
+    if isinstance(ts, (int, float)):
+        return datetime.fromtimestamp(ts, timezone.utc).date()
+    return None
+
+
+async def get_current_batch(
+    client: httpx.AsyncClient,
+    points: Sequence[Tuple[float, float]],
+    chunk_size: Optional[int] = None,
+    concurrency: Optional[int] = None,
+    refresh: bool = False
+) -> List[Dict[str, Any]]:
+    """
+    Get current weather observations for many (lat, lon) points using the multi-point route.
+
+    Points are snapped to the weather grid first, so points sharing a cell are requested once.
+    """
+    cell_grid = await weather_grid(client) if points else None
+    unique, index = cell_snapper.snap(cell_grid, points) if cell_grid is not None else distinct_points(points)
+    results = await _fetch_groups(
+        client,
+        "points",
+        unique,
+        lambda chunk: ",".join(f"({lat}, {lon})" for lat, lon in chunk),
+        _match_points,
+        chunk_size,
+        concurrency,
+        refresh
+    )
+    return [
+        {"latitude": lat, "longitude": lon, **results[unique[k]]}
+        for (lat, lon), k in zip(points, index)
+    ]
+
+
+async def prefetch(client: httpx.AsyncClient, product: str, locations: List[Dict[str, Any]]) -> List[Any]:
+    """
+    Fetch one watchlist product for many watched locations. Cached responses are
+    not used, so every result is as fresh as its fetch time, but the fresh responses
+    are cached for other callers (and other HTTP workers).
+
+    Current conditions use the multi-point route; alerts and forecasts are fetched
+    per location, GEMS_WATCH_CONCURRENCY at a time. Results are in the shape of the
+    single-location tools, or an exception per failed location. Each current
+    observation is also cached under its single-point request, which is what
+    get_current looks up.
+    """
+    points = [(location["latitude"], location["longitude"]) for location in locations]
+    if product == "current":
+        observations = await get_current_batch(client, points, refresh=True)
+        # Same shape as a single-point /current response
+        results = [{"count": 1, "data": [o["data"]]} if "data" in o else o for o in observations]
+        for (lat, lon), result in zip(points, results):
+            if "data" in result:
+                lat, lon = await snap_point(client, lat, lon)
+                await cache_json("/weather/v2/current", {"lat": lat, "lon": lon}, result)
+        return results
+    semaphore = asyncio.Semaphore(max(1, Config.WATCH_CONCURRENCY))
+
+    async def fetch(location: Dict[str, Any]) -> Any:
+        async with semaphore:
+            lat, lon = location["latitude"], location["longitude"]
+            if product == "alerts":
+                return await get_alerts(client, lat, lon, refresh=True)
+            return await get_forecast(client, lat, lon, location["days"], refresh=True)
+
+    return await asyncio.gather(*(fetch(location) for location in locations), return_exceptions=True)
+
+
+async def get_current_stations(
+    client: httpx.AsyncClient,
+    stations: Sequence[str],
+    chunk_size: Optional[int] = None,
+    concurrency: Optional[int] = None
+) -> List[Dict[str, Any]]:
+    """Get current weather observations for many station call IDs using the multi-station route."""
+    unique = list(dict.fromkeys(s.upper() for s in stations))
+    results = await _fetch_groups(
+        client,
+        "stations",
+        unique,
+        ",".join,
+        _match_stations,
+        chunk_size,
+        concurrency
+    )
+    return [{"station": station, **results[station.upper()]} for station in stations]
+
+
+async def _fetch_groups(
+    client: httpx.AsyncClient,
+    param: str,
+    keys: List[Any],
+    format_chunk: Callable[[List[Any]], str],
+    match: Callable[[List[Any], List[Dict[str, Any]]], List[Optional[Dict[str, Any]]]],
+    chunk_size: Optional[int],
+    concurrency: Optional[int],
+    refresh: bool = False
+) -> Dict[Any, Dict[str, Any]]:
+    """Split keys into upstream-sized chunks, fetch them concurrently and map each key to its observation."""
+    chunk_size = max(1, chunk_size or Config.WEATHER_BATCH_SIZE)
+    semaphore = asyncio.Semaphore(max(1, concurrency or Config.WEATHER_BATCH_CONCURRENCY))
+    chunks = [keys[i:i + chunk_size] for i in range(0, len(keys), chunk_size)]
+    results: Dict[Any, Dict[str, Any]] = {}
+
+    async def fetch(chunk: List[Any]) -> None:
+        async with semaphore:
+            try:
+                group = await get_json(client, "/weather/v2/current", {param: format_chunk(chunk)}, refresh=refresh)
+            except Exception as e:
+                for key in chunk:
+                    results[key] = {"error": str(e)}
+                return
+        observations = (group or {}).get("data") or []
+        for key, obs in zip(chunk, match(chunk, observations)):
+            results[key] = {"data": obs} if obs is not None else {"error": "No observation returned"}
+
+    await asyncio.gather(*(fetch(chunk) for chunk in chunks))
+    return results
+
+
+def _match_points(
+    chunk: List[Tuple[float, float]],
+    observations: List[Dict[str, Any]]
+) -> List[Optional[Dict[str, Any]]]:
+    """
+    Pair requested points with observations, by position when counts agree.
+    Otherwise the closest (point, observation) pairs within WEATHER_MATCH_KM are
+    taken first, each observation used once; points left over get None.
+    """
+    if len(observations) == len(chunk):
+        return list(observations)
+    candidates = []
+    for j, obs in enumerate(observations):
+        obs_lat, obs_lon = obs.get("lat"), obs.get("lon")
+        if not isinstance(obs_lat, (int, float)) or not isinstance(obs_lon, (int, float)):
+            continue
+        for i, (lat, lon) in enumerate(chunk):
+            distance = _distance_km(lat, lon, obs_lat, obs_lon)
+            if distance <= Config.WEATHER_MATCH_KM:
+                candidates.append((distance, i, j))
+    matched: List[Optional[Dict[str, Any]]] = [None] * len(chunk)
+    used = set()
+    for _, i, j in sorted(candidates):
+        if matched[i] is None and j not in used:
+            matched[i] = observations[j]
+            used.add(j)
+    return matched
+
+
+def _distance_km(lat1: float, lon1: float, lat2: float, lon2: float) -> float:
+    """Great-circle distance between two points."""
+    phi1, phi2 = math.radians(lat1), math.radians(lat2)
+    a = (
+        math.sin((phi2 - phi1) / 2) ** 2
+        + math.cos(phi1) * math.cos(phi2) * math.sin(math.radians(lon2 - lon1) / 2) ** 2
+    )
+    return 2 * 6371.0 * math.asin(min(1.0, math.sqrt(a)))
+
+
+def _match_stations(chunk: List[str], observations: List[Dict[str, Any]]) -> List[Optional[Dict[str, Any]]]:
+    """Pair requested station IDs with observations by their station field."""
+    by_station = {str(obs.get("station", "")).upper(): obs for obs in observations}
+    if len(by_station) < len(chunk) and len(observations) == len(chunk):
+        return list(observations)
+    return [by_station.get(station) for station in chunk]
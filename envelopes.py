@@ -0,0 +1,321 @@
+"""
+Spatial index of data object envelopes
+
+An EnvelopeIndex holds the objects of one (api_type, dataset, layer) and their
+envelopes, which are GeoJSON polygons in lon/lat. The envelopes' bounding boxes
+are packed into a Sort-Tile-Recursive (STR) R-tree. The tree finds candidate
+objects for many points at once with vectorized NumPy box tests, one tree level
+at a time. Candidates are then checked against the envelope polygons.
+
+The spatial endpoints fill indexes from object/search results and the envelope
+route. Refreshes are incremental: the objects are listed again, and envelopes
+are fetched only for objects not already indexed.
+"""
+import asyncio
+import logging
+import math
+import time
+from collections import OrderedDict
+from datetime import datetime, timezone
+from typing import Any, Awaitable, Callable, Dict, Hashable, Iterable, List, Optional, Sequence, Tuple
+
+from config import Config
+import grid
+
+logger = logging.getLogger(__name__)
+
+# Entries per R-tree node
+NODE_CAPACITY = 16
+# Point x edge pairs tested at once in the polygon check
+_EDGE_BATCH = 1_000_000
+
+
+def _str_order(boxes: Any, capacity: int) -> Any:
+    """Sort-Tile-Recursive order: vertical slices by center x, each sorted by center y."""
+    np = grid.np
+    pages = math.ceil(len(boxes) / capacity)
+    per_slice = math.ceil(math.sqrt(pages)) * capacity
+    cx = (boxes[:, 0] + boxes[:, 2]) / 2
+    cy = (boxes[:, 1] + boxes[:, 3]) / 2
+    by_x = np.argsort(cx, kind="stable")
+    slices = [by_x[i:i + per_slice] for i in range(0, len(boxes), per_slice)]
+    return np.concatenate([s[np.argsort(cy[s], kind="stable")] for s in slices])
+
+
+def _contains(boxes: Any, x: Any, y: Any) -> Any:
+    return (boxes[:, 0] <= x) & (x <= boxes[:, 2]) & (boxes[:, 1] <= y) & (y <= boxes[:, 3])
+
+
+class STRTree:
+    """A static R-tree over (minx, miny, maxx, maxy) boxes, packed with Sort-Tile-Recursive."""
+
+    def __init__(self, boxes: Any, capacity: int = NODE_CAPACITY):
+        grid.require_numpy()
+        np = grid.np
+        boxes = np.asarray(boxes, dtype=np.float64).reshape(-1, 4)
+        self.size = len(boxes)
+        order = _str_order(boxes, capacity) if self.size else np.zeros(0, dtype=np.int64)
+        # Leaf entries in packed order, and the input index of each
+        self.leaves = boxes[order]
+        self.items = order
+        # Node levels from the bottom up: (node boxes, first child, end of children),
+        # with children indexing the level below (the leaves for levels[0])
+        self.levels: List[Tuple[Any, Any, Any]] = []
+        current = self.leaves
+        while len(current) > capacity:
+            start = np.arange(0, len(current), capacity)
+            end = np.minimum(start + capacity, len(current))
+            nodes = np.column_stack([
+                np.minimum.reduceat(current[:, 0], start),
+                np.minimum.reduceat(current[:, 1], start),
+                np.maximum.reduceat(current[:, 2], start),
+                np.maximum.reduceat(current[:, 3], start),
+            ])
+            node_order = _str_order(nodes, capacity)
+            self.levels.append((nodes[node_order], start[node_order], end[node_order]))
+            current = nodes[node_order]
+
+    def query_points(self, x: Any, y: Any) -> Tuple[Any, Any]:
+        """
+        Find the boxes containing each point. Returns parallel arrays of point
+        indexes and input box indexes, one pair per match.
+        """
+        np = grid.np
+        x = np.asarray(x, dtype=np.float64).ravel()
+        y = np.asarray(y, dtype=np.float64).ravel()
+        if not self.size or not len(x):
+            return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+        top = self.levels[-1][0] if self.levels else self.leaves
+        points = np.repeat(np.arange(len(x)), len(top))
+        entries = np.tile(np.arange(len(top)), len(x))
+        keep = _contains(top[entries], x[points], y[points])
+        points, entries = points[keep], entries[keep]
+        for depth in range(len(self.levels) - 1, -1, -1):
+            _, start, end = self.levels[depth]
+            below = self.levels[depth - 1][0] if depth else self.leaves
+            counts = end[entries] - start[entries]
+            points = np.repeat(points, counts)
+            offsets = np.arange(int(counts.sum())) - np.repeat(np.cumsum(counts) - counts, counts)
+            entries = np.repeat(start[entries], counts) + offsets
+            keep = _contains(below[entries], x[points], y[points])
+            points, entries = points[keep], entries[keep]
+        return points, self.items[entries]
+
+
+def envelope_edges(geometry: Any) -> Optional[Any]:
+    """Get the ring edges (x1, y1, x2, y2) of a GeoJSON Polygon, MultiPolygon or Feature."""
+    np = grid.np
+    if isinstance(geometry, dict) and geometry.get("type") == "Feature":
+        geometry = geometry.get("geometry")
+    if not isinstance(geometry, dict):
+        return None
+    if geometry.get("type") == "Polygon":
+        rings = geometry.get("coordinates") or []
+    elif geometry.get("type") == "MultiPolygon":
+        rings = [ring for polygon in geometry.get("coordinates") or [] for ring in polygon]
+    else:
+        return None
+    edges = []
+    for ring in rings:
+        coords = np.asarray(ring, dtype=np.float64)
+        if coords.ndim != 2 or len(coords) < 3:
+            continue
+        coords = coords[:, :2]
+        edges.append(np.hstack([coords, np.roll(coords, -1, axis=0)]))
+    return np.vstack(edges) if edges else None
+
+
+def points_in_edges(edges: Any, x: Any, y: Any) -> Any:
+    """Even-odd point-in-polygon test of many points against one set of ring edges."""
+    np = grid.np
+    inside = np.zeros(len(x), dtype=bool)
+    step = max(1, _EDGE_BATCH // max(1, len(edges)))
+    x1, y1, x2, y2 = (edges[:, i] for i in range(4))
+    for i in range(0, len(x), step):
+        px = x[i:i + step, None]
+        py = y[i:i + step, None]
+        straddles = (y1 > py) != (y2 > py)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            cross_x = x1 + (py - y1) * (x2 - x1) / (y2 - y1)
+        inside[i:i + step] = (straddles & (px < cross_x)).sum(axis=1) % 2 == 1
+    return inside
+
+
+class EnvelopeIndex:
+    """The objects of one (api_type, dataset, layer), with an R-tree over their envelopes."""
+
+    def __init__(self) -> None:
+        self.objects: Dict[int, Dict[str, Any]] = {}
+        self.edges: Dict[int, Any] = {}
+        self.tree: Optional[STRTree] = None
+        self._ids: List[int] = []
+        self.updated_at = 0.0
+
+    def missing_envelopes(self, objects: Iterable[Dict[str, Any]]) -> List[int]:
+        """Ids of listed objects whose envelope is not indexed yet."""
+        return [o["id"] for o in objects if o.get("id") is not None and o["id"] not in self.edges]
+
+    def update(self, objects: Sequence[Dict[str, Any]], envelopes: Dict[int, Any]) -> None:
+        """Replace the object list, add newly fetched envelopes and rebuild the tree."""
+        np = grid.np
+        self.objects = {o["id"]: o for o in objects if o.get("id") is not None}
+        self.edges = {i: e for i, e in self.edges.items() if i in self.objects}
+        for object_id, geometry in envelopes.items():
+            edges = envelope_edges(geometry)
+            if edges is not None and object_id in self.objects:
+                self.edges[object_id] = edges
+        self._ids = list(self.edges)
+        boxes = [
+            (e[:, 0].min(), e[:, 1].min(), e[:, 0].max(), e[:, 1].max())
+            for e in (self.edges[i] for i in self._ids)
+        ]
+        self.tree = STRTree(np.array(boxes, dtype=np.float64).reshape(-1, 4))
+        self.updated_at = time.time()
+
+    def covering(self, lons: Any, lats: Any) -> List[List[int]]:
+        """Get the ids of the objects whose envelope contains each point."""
+        np = grid.np
+        lons = np.asarray(lons, dtype=np.float64)
+        lats = np.asarray(lats, dtype=np.float64)
+        result: List[List[int]] = [[] for _ in range(len(lons))]
+        if self.tree is None:
+            return result
+        points, items = self.tree.query_points(lons, lats)
+        order = np.argsort(items, kind="stable")
+        points, items = points[order], items[order]
+        bounds = np.flatnonzero(np.diff(items)) + 1
+        for group_points, group_items in zip(np.split(points, bounds), np.split(items, bounds)):
+            if not len(group_items):
+                continue
+            object_id = self._ids[int(group_items[0])]
+            inside = points_in_edges(self.edges[object_id], lons[group_points], lats[group_points])
+            for p in group_points[inside].tolist():
+                result[p].append(object_id)
+        return result
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "objects": len(self.objects),
+            "envelopes": len(self.edges),
+            "age_s": round(time.time() - self.updated_at, 1) if self.updated_at else None,
+        }
+
+
+def parse_time(value: str) -> datetime:
+    """Parse an ISO 8601 time; times without a zone are UTC."""
+    parsed = datetime.fromisoformat(value.replace("Z", "+00:00"))
+    return parsed if parsed.tzinfo else parsed.replace(tzinfo=timezone.utc)
+
+
+def covers_time(metadata: Dict[str, Any], when: datetime) -> bool:
+    """True when one of an object's time ranges contains when. Objects without time ranges always match."""
+    ranges = metadata.get("t_ranges") or []
+    if not ranges:
+        return True
+    for t_range in ranges:
+        try:
+            begin = parse_time(t_range["begin"]) if t_range.get("begin") else None
+            end = parse_time(t_range["end"]) if t_range.get("end") else None
+        except ValueError:
+            continue
+        if (begin is None or begin <= when) and (end is None or when <= end):
+            return True
+    return False
+
+
+def select_object(
+    candidates: Sequence[Dict[str, Any]],
+    grid_level: Optional[int] = None,
+    when: Optional[str] = None
+) -> Optional[Dict[str, Any]]:
+    """
+    Pick the object to answer a point from the objects covering it.
+
+    Candidates are filtered by grid level and time, then the finest grid wins,
+    then the latest time range, then the highest id.
+    """
+    if grid_level is not None:
+        candidates = [o for o in candidates if o.get("grid_id") == grid_level]
+    if when:
+        moment = parse_time(when)
+        candidates = [o for o in candidates if covers_time(o, moment)]
+    if not candidates:
+        return None
+
+    def latest(o: Dict[str, Any]) -> str:
+        return max((r.get("begin") or "" for r in o.get("t_ranges") or []), default="")
+
+    return max(candidates, key=lambda o: (o.get("grid_id") or 0, latest(o), o["id"]))
+
+
+class EnvelopeStore:
+    """Envelope indexes by (api_type, dataset, layer), built once and refreshed in the background."""
+
+    def __init__(self, max_indexes: int = 64, max_age: float = 6 * 3600):
+        self.max_indexes = max_indexes
+        self.max_age = max_age
+        self.indexes: "OrderedDict[Hashable, EnvelopeIndex]" = OrderedDict()
+        self._pending: Dict[Hashable, "asyncio.Task[EnvelopeIndex]"] = {}
+        self.builds = 0
+        self.refreshes = 0
+        self.refresh_failures = 0
+
+    @classmethod
+    def from_config(cls) -> "EnvelopeStore":
+        """Create a store using the settings in Config."""
+        return cls(Config.ENVELOPE_MAX_INDEXES, Config.ENVELOPE_INDEX_TTL)
+
+    async def index(self, key: Hashable, fill: Callable[[EnvelopeIndex], Awaitable[None]]) -> EnvelopeIndex:
+        """
+        Get the index for key. A missing index is built with fill() and awaited;
+        an index older than max_age is served while fill() refreshes it in the background.
+        """
+        index = self.indexes.get(key)
+        if index is None:
+            task = self._pending.get(key)
+            if task is None:
+                task = self._pending[key] = asyncio.create_task(self._fill(key, EnvelopeIndex(), fill))
+            return await asyncio.shield(task)
+        self.indexes.move_to_end(key)
+        if time.time() - index.updated_at >= self.max_age and key not in self._pending:
+            self._pending[key] = asyncio.create_task(self._refresh(key, index, fill))
+        return index
+
+    async def _fill(self, key: Hashable, index: EnvelopeIndex, fill: Callable[[EnvelopeIndex], Awaitable[None]]) -> EnvelopeIndex:
+        try:
+            await fill(index)
+        finally:
+            self._pending.pop(key, None)
+        self.builds += 1
+        self.indexes[key] = index
+        while len(self.indexes) > self.max_indexes:
+            self.indexes.popitem(last=False)
+        return index
+
+    async def _refresh(self, key: Hashable, index: EnvelopeIndex, fill: Callable[[EnvelopeIndex], Awaitable[None]]) -> EnvelopeIndex:
+        try:
+            await fill(index)
+            self.refreshes += 1
+        except Exception as e:
+            # Keep serving the old index; the next lookup retries
+            self.refresh_failures += 1
+            logger.info("Could not refresh the envelope index for %s: %s", key, e)
+        finally:
+            self._pending.pop(key, None)
+        return index
+
+    def stats(self) -> Dict[str, Any]:
+        """Get index sizes and build counters."""
+        return {
+            "indexes": len(self.indexes),
+            "objects": sum(len(i.objects) for i in self.indexes.values()),
+            "envelopes": sum(len(i.edges) for i in self.indexes.values()),
+            "building": len(self._pending),
+            "builds": self.builds,
+            "refreshes": self.refreshes,
+            "refresh_failures": self.refresh_failures,
+        }
+
+
+# Shared envelope indexes
+envelope_store = EnvelopeStore.from_config()
@@ -0,0 +1,137 @@
+"""
+EASE-Grid 2.0 projection helpers for the GEMS grid system
+
+GEMS grids use the global EASE-Grid 2.0 projection (EPSG:6933), a Lambert
+cylindrical equal-area projection on the WGS 84 ellipsoid with a standard
+parallel of 30 degrees. Functions accept scalars or NumPy arrays.
+"""
+import math
+from typing import Any, Dict, Tuple
+
+# numpy is part of the optional "raster" extra; it is imported on first use so
+# that server startup does not pay for it
+np: Any = None
+
+EPSG_WGS84 = 4326
+EPSG_EASE2_GLOBAL = 6933
+
+# WGS 84 ellipsoid
+SEMI_MAJOR_AXIS = 6378137.0
+ECCENTRICITY = 0.081819190842622
+STANDARD_PARALLEL = 30.0
+
+_E2 = ECCENTRICITY ** 2
+_SIN_PHI1 = math.sin(math.radians(STANDARD_PARALLEL))
+_K0 = math.cos(math.radians(STANDARD_PARALLEL)) / math.sqrt(1 - _E2 * _SIN_PHI1 ** 2)
+# Authalic q at the poles
+_Q_POLE = (1 - _E2) * (1 / (1 - _E2) - math.log((1 - ECCENTRICITY) / (1 + ECCENTRICITY)) / (2 * ECCENTRICITY))
+
+
+def require_numpy() -> None:
+    """Import NumPy, raising a helpful error when the optional dependency is missing."""
+    global np
+    if np is None:
+        try:
+            import numpy
+        except ImportError:
+            raise RuntimeError("This feature requires NumPy: pip install 'gems-exchange-mcp-server[raster]'")
+        np = numpy
+
+
+def lonlat_to_ease2(lon: Any, lat: Any) -> Tuple[Any, Any]:
+    """Project longitude/latitude in degrees to EASE-Grid 2.0 global x/y in meters."""
+    require_numpy()
+    lam = np.radians(np.asarray(lon, dtype=np.float64))
+    sin_phi = np.sin(np.radians(np.asarray(lat, dtype=np.float64)))
+    e_sin = ECCENTRICITY * sin_phi
+    q = (1 - _E2) * (sin_phi / (1 - e_sin ** 2) - np.log((1 - e_sin) / (1 + e_sin)) / (2 * ECCENTRICITY))
+    x = SEMI_MAJOR_AXIS * _K0 * lam
+    y = SEMI_MAJOR_AXIS * q / (2 * _K0)
+    return x, y
+
+
+def project(lon: Any, lat: Any, epsg: int) -> Tuple[Any, Any]:
+    """Project longitude/latitude into a supported coordinate system."""
+    require_numpy()
+    if epsg == EPSG_WGS84:
+        return np.asarray(lon, dtype=np.float64), np.asarray(lat, dtype=np.float64)
+    if epsg == EPSG_EASE2_GLOBAL:
+        return lonlat_to_ease2(lon, lat)
+    raise ValueError(f"Unsupported coordinate system EPSG:{epsg}")
+
+
+def ease2_to_lonlat(x: Any, y: Any) -> Tuple[Any, Any]:
+    """Invert EASE-Grid 2.0 global x/y in meters to longitude/latitude in degrees."""
+    require_numpy()
+    lon = np.degrees(np.asarray(x, dtype=np.float64) / (SEMI_MAJOR_AXIS * _K0))
+    q = np.clip(2 * _K0 * np.asarray(y, dtype=np.float64) / SEMI_MAJOR_AXIS, -_Q_POLE, _Q_POLE)
+    # Fixed-point iteration for latitude from the authalic q (Snyder eq. 3-16)
+    phi = np.arcsin(q / 2)
+    for _ in range(8):
+        sin_phi = np.sin(phi)
+        e_sin = ECCENTRICITY * sin_phi
+        with np.errstate(divide="ignore", invalid="ignore"):
+            step = (1 - e_sin ** 2) ** 2 / (2 * np.cos(phi)) * (
+                q / (1 - _E2) - sin_phi / (1 - e_sin ** 2) + np.log((1 - e_sin) / (1 + e_sin)) / (2 * ECCENTRICITY)
+            )
+        phi = np.where(np.isfinite(step), phi + step, phi)
+    return lon, np.degrees(phi)
+
+
+def unproject(x: Any, y: Any, epsg: int) -> Tuple[Any, Any]:
+    """Convert coordinates in a supported coordinate system back to longitude/latitude."""
+    require_numpy()
+    if epsg == EPSG_WGS84:
+        return np.asarray(x, dtype=np.float64), np.asarray(y, dtype=np.float64)
+    if epsg == EPSG_EASE2_GLOBAL:
+        return ease2_to_lonlat(x, y)
+    raise ValueError(f"Unsupported coordinate system EPSG:{epsg}")
+
+
+class CellGrid:
+    """
+    The cells of one GEMS grid resolution, from its /grid metadata.
+
+    Cells are numbered row * width + col from the upper-left corner. Lookups
+    are vectorized, so many points are converted at once.
+    """
+
+    def __init__(self, srid: int, ul_x: float, ul_y: float, scale: float, width: int, height: int):
+        if srid not in (EPSG_WGS84, EPSG_EASE2_GLOBAL):
+            raise ValueError(f"Unsupported coordinate system EPSG:{srid}")
+        if scale <= 0 or width <= 0 or height <= 0:
+            raise ValueError("Grid scale, width and height must be positive")
+        self.srid = srid
+        self.ul_x = ul_x
+        self.ul_y = ul_y
+        self.scale = scale
+        self.width = width
+        self.height = height
+
+    @classmethod
+    def from_details(cls, details: Dict[str, Any]) -> "CellGrid":
+        """Build a grid from /grid/{id} metadata (srid, ul_x, ul_y, scale, width, height)."""
+        return cls(
+            int(details["srid"]),
+            float(details["ul_x"]),
+            float(details["ul_y"]),
+            float(details["scale"]),
+            int(details["width"]),
+            int(details["height"]),
+        )
+
+    def cell_ids(self, lon: Any, lat: Any) -> Any:
+        """Get the cell id of each longitude/latitude, or -1 outside the grid."""
+        x, y = project(lon, lat, self.srid)
+        col = np.floor((x - self.ul_x) / self.scale)
+        row = np.floor((self.ul_y - y) / self.scale)
+        with np.errstate(invalid="ignore"):
+            inside = (col >= 0) & (col < self.width) & (row >= 0) & (row < self.height)
+        col = np.where(inside, col, 0).astype(np.int64)
+        row = np.where(inside, row, 0).astype(np.int64)
+        return np.where(inside, row * self.width + col, -1)
+
+    def centers(self, cell_ids: Any) -> Tuple[Any, Any]:
+        """Get the longitude/latitude of each cell's center."""
+        row, col = np.divmod(np.asarray(cell_ids, dtype=np.int64), self.width)
+        return unproject(self.ul_x + (col + 0.5) * self.scale, self.ul_y - (row + 0.5) * self.scale, self.srid)
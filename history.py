@@ -0,0 +1,204 @@
+"""
+Store of historical weather series, one entry per location and chunk
+
+weather_history_series splits date ranges into chunks aligned to fixed day
+boundaries (see endpoints/weather.py). Each (product, location, chunk) is kept
+as one entry holding the location's metadata and the records of every day
+fetched so far, each day with its own expiry. A multi-year series takes a few
+dozen entries instead of one per day, and it is kept apart from the response
+cache so it cannot evict other responses.
+
+Entries live in an in-memory LRU bounded by their encoded size and, when a
+cache directory is configured, in a SQLite file that survives restarts. All the
+chunks of a range are looked up in one batch.
+"""
+import asyncio
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+import jsoncodec
+from config import Config
+
+# Keys per SQLite query, below the bound-parameter limit
+QUERY_BATCH = 500
+
+
+def chunk_key(product: str, lat: float, lon: float, chunk: int) -> str:
+    return f"{product} {lat},{lon} {chunk}"
+
+
+def _expires_at(chunk: Dict[str, Any]) -> float:
+    return max((expires_at for expires_at, _ in chunk["days"].values()), default=0.0)
+
+
+class ChunkDiskStore:
+    """SQLite-backed table of encoded history chunks."""
+
+    def __init__(self, directory: str, max_bytes: int):
+        path = Path(directory).expanduser()
+        path.mkdir(parents=True, exist_ok=True)
+        self.path = path / "history.sqlite3"
+        self.max_bytes = max_bytes
+        self.evictions = 0
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(str(self.path), check_same_thread=False, isolation_level=None, timeout=30)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS chunks ("
+            "key TEXT PRIMARY KEY, body BLOB NOT NULL, size INTEGER NOT NULL, "
+            "stored_at REAL NOT NULL, expires_at REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS chunks_stored_at ON chunks(stored_at)")
+
+    def get_chunks(self, keys: List[str], now: float) -> Dict[str, bytes]:
+        found = {}
+        with self._lock:
+            for i in range(0, len(keys), QUERY_BATCH):
+                batch = keys[i:i + QUERY_BATCH]
+                rows = self._conn.execute(
+                    f"SELECT key, body FROM chunks WHERE key IN ({','.join('?' * len(batch))}) AND expires_at > ?",
+                    (*batch, now)
+                )
+                found.update(rows)
+        return found
+
+    def set_chunks(self, chunks: Dict[str, Tuple[bytes, float]], now: float) -> None:
+        with self._lock:
+            self._conn.execute("BEGIN")
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO chunks (key, body, size, stored_at, expires_at) VALUES (?, ?, ?, ?, ?)",
+                [(key, body, len(body), now, expires_at) for key, (body, expires_at) in chunks.items()]
+            )
+            self._conn.execute("COMMIT")
+            self._evict(now)
+
+    def total_bytes(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM chunks").fetchone()[0]
+
+    def clear(self) -> None:
+        with self._lock:
+            self._conn.execute("DELETE FROM chunks")
+
+    def _evict(self, now: float) -> None:
+        self._conn.execute("DELETE FROM chunks WHERE expires_at <= ?", (now,))
+        total = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM chunks").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        # Drop the chunks written longest ago until the store fits again
+        freed = 0
+        doomed = []
+        for key, size in self._conn.execute("SELECT key, size FROM chunks ORDER BY stored_at"):
+            doomed.append((key,))
+            freed += size
+            if total - freed <= self.max_bytes:
+                break
+        self._conn.executemany("DELETE FROM chunks WHERE key = ?", doomed)
+        self.evictions += len(doomed)
+
+
+class HistoryStore:
+    """
+    Two-tier store of history chunks. A chunk is a dict with "meta" (location
+    fields) and "days" (ISO day -> [expires_at, records]).
+    """
+
+    def __init__(self, max_bytes: int, directory: Optional[str] = None, disk_max_bytes: int = 0):
+        self.max_bytes = max_bytes
+        self.disk = ChunkDiskStore(directory, disk_max_bytes) if directory else None
+        self.total_bytes = 0
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._chunks: "OrderedDict[str, Tuple[Dict[str, Any], int]]" = OrderedDict()
+
+    @classmethod
+    def from_config(cls) -> "HistoryStore":
+        """Create a store using the settings in Config."""
+        return cls(Config.HISTORY_MAX_BYTES, Config.CACHE_DIR or None, Config.HISTORY_DISK_MAX_BYTES)
+
+    async def get_chunks(self, keys: List[str]) -> Dict[str, Dict[str, Any]]:
+        """Get the stored chunks among keys, from memory and then from disk in one batch."""
+        now = time.time()
+        found: Dict[str, Dict[str, Any]] = {}
+        missing = []
+        for key in keys:
+            entry = self._chunks.get(key)
+            if entry is not None and _expires_at(entry[0]) > now:
+                self._chunks.move_to_end(key)
+                found[key] = entry[0]
+            else:
+                missing.append(key)
+        if missing and self.disk is not None:
+            bodies = await asyncio.to_thread(self.disk.get_chunks, missing, now)
+            for key, body in bodies.items():
+                chunk = await jsoncodec.decode(body)
+                self._remember(key, chunk, len(body))
+                found[key] = chunk
+            self.disk_hits += len(bodies)
+        self.hits += len(found)
+        self.misses += len(keys) - len(found)
+        return found
+
+    async def add(self, chunks: Dict[str, Dict[str, Any]]) -> None:
+        """Merge newly fetched days into the stored chunks and write them to both tiers."""
+        encoded: Dict[str, Tuple[bytes, float]] = {}
+        for key, chunk in chunks.items():
+            entry = self._chunks.get(key)
+            if entry is not None:
+                chunk = {"meta": chunk["meta"] or entry[0]["meta"], "days": {**entry[0]["days"], **chunk["days"]}}
+            body = jsoncodec.dumps(chunk)
+            self._remember(key, chunk, len(body))
+            encoded[key] = (body, _expires_at(chunk))
+        if self.disk is not None and encoded:
+            await asyncio.to_thread(self.disk.set_chunks, encoded, time.time())
+
+    def _remember(self, key: str, chunk: Dict[str, Any], size: int) -> None:
+        if size > self.max_bytes:
+            return
+        previous = self._chunks.pop(key, None)
+        if previous is not None:
+            self.total_bytes -= previous[1]
+        self._chunks[key] = (chunk, size)
+        self.total_bytes += size
+        while self.total_bytes > self.max_bytes:
+            _, (_, evicted) = self._chunks.popitem(last=False)
+            self.total_bytes -= evicted
+            self.evictions += 1
+
+    async def clear(self) -> None:
+        """Remove every chunk from both tiers."""
+        self._chunks.clear()
+        self.total_bytes = 0
+        if self.disk is not None:
+            await asyncio.to_thread(self.disk.clear)
+
+    def stats(self) -> Dict[str, Any]:
+        """Get hit/miss counters and store sizes."""
+        stats = {
+            "chunk_hits": self.hits,
+            "chunk_misses": self.misses,
+            "chunks": len(self._chunks),
+            "bytes": self.total_bytes,
+            "max_bytes": self.max_bytes,
+            "evictions": self.evictions,
+        }
+        if self.disk is not None:
+            stats["disk"] = {
+                "path": str(self.disk.path),
+                "hits": self.disk_hits,
+                "bytes": self.disk.total_bytes(),
+                "max_bytes": self.disk.max_bytes,
+                "evictions": self.disk.evictions,
+            }
+        return stats
+
+
+# Shared history store used by the weather endpoints
+history_store = HistoryStore.from_config()
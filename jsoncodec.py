@@ -0,0 +1,173 @@
+"""
+JSON decoding of upstream responses and encoding of tool results
+
+The backend is orjson or msgspec when installed, with the standard library as
+the fallback (GEMS_JSON_BACKEND=auto|orjson|msgspec|json). Upstream bodies are
+decoded straight from the response bytes. On interpreters without a GIL, bodies
+of at least GEMS_JSON_THREAD_BYTES are decoded in a worker thread. With the GIL,
+decoding holds it in every backend, so a thread would not unblock the event loop
+and decoding stays inline.
+
+Tool results are encoded here rather than by FastMCP, as compact UTF-8 JSON
+text. With GEMS_JSON_PASSTHROUGH on, a top-level value of the result that is
+still the exact object decoded from an upstream body (nothing was projected,
+reshaped or merged into it) is written as that body's bytes, without being
+encoded again.
+"""
+import asyncio
+import contextvars
+import functools
+import json
+import sys
+import time
+from typing import Any, Awaitable, Callable, Dict, NamedTuple, Optional, Tuple
+
+from config import Config
+from metrics import metrics
+
+BACKENDS = ("orjson", "msgspec", "json")
+
+# Decoding in a thread only frees the event loop when threads really run in parallel
+_PARALLEL_THREADS = not getattr(sys, "_is_gil_enabled", lambda: True)()
+
+# Upstream bodies decoded during the current tool call: id(value) -> (value, body).
+# The value is kept so its id cannot be reused while the call runs.
+_raw_bodies: "contextvars.ContextVar[Optional[Dict[int, Tuple[Any, bytes]]]]" = contextvars.ContextVar(
+    "raw_bodies", default=None
+)
+
+
+class Backend(NamedTuple):
+    """A JSON implementation: loads takes bytes, dumps returns compact UTF-8 bytes."""
+    name: str
+    loads: Callable[[bytes], Any]
+    dumps: Callable[[Any], bytes]
+
+
+def _default(value: Any) -> Any:
+    """Convert values the backends cannot encode natively."""
+    if isinstance(value, (set, frozenset, tuple)):
+        return list(value)
+    if hasattr(value, "tolist"):
+        # NumPy arrays and scalars
+        return value.tolist()
+    if hasattr(value, "model_dump"):
+        return value.model_dump(mode="json")
+    return str(value)
+
+
+def _orjson() -> Backend:
+    import orjson
+    options = orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY
+    return Backend("orjson", orjson.loads, lambda value: orjson.dumps(value, default=_default, option=options))
+
+
+def _msgspec() -> Backend:
+    import msgspec
+    decoder = msgspec.json.Decoder()
+    encoder = msgspec.json.Encoder(enc_hook=_default)
+    return Backend("msgspec", decoder.decode, encoder.encode)
+
+
+def _stdlib() -> Backend:
+    return Backend(
+        "json",
+        json.loads,
+        lambda value: json.dumps(value, default=_default, separators=(",", ":"), ensure_ascii=False).encode()
+    )
+
+
+_FACTORIES = {"orjson": _orjson, "msgspec": _msgspec, "json": _stdlib}
+_backend: Optional[Backend] = None
+
+
+def get_backend() -> Backend:
+    """Get the configured backend, falling back to the next available one."""
+    global _backend
+    if _backend is None:
+        choice = Config.JSON_BACKEND.lower()
+        if choice not in ("auto", *BACKENDS):
+            raise ValueError(f"Unknown JSON backend '{Config.JSON_BACKEND}', expected auto, {', '.join(BACKENDS)}")
+        candidates = BACKENDS if choice == "auto" else (choice, *(b for b in BACKENDS if b != choice))
+        for name in candidates:
+            try:
+                _backend = _FACTORIES[name]()
+                break
+            except ImportError:
+                continue
+    return _backend
+
+
+def loads(body: bytes) -> Any:
+    """Decode JSON from bytes."""
+    return get_backend().loads(body)
+
+
+def dumps(value: Any) -> bytes:
+    """Encode a value as compact UTF-8 JSON."""
+    return get_backend().dumps(value)
+
+
+async def decode(body: bytes) -> Any:
+    """Decode a response body, in a worker thread when it is large and threads run in parallel."""
+    if _PARALLEL_THREADS and 0 < Config.JSON_THREAD_BYTES <= len(body):
+        return await asyncio.to_thread(loads, body)
+    return loads(body)
+
+
+def remember(value: Any, body: Optional[bytes]) -> None:
+    """Record the upstream body a decoded value came from, for reuse by the current tool call."""
+    bodies = _raw_bodies.get()
+    if bodies is not None and body and isinstance(value, (dict, list)):
+        bodies[id(value)] = (value, body)
+
+
+def encode_result(result: Any, bodies: Optional[Dict[int, Tuple[Any, bytes]]] = None) -> Tuple[str, bool]:
+    """
+    Encode a tool result as JSON text. Returns the text and whether any upstream
+    bytes were reused.
+    """
+    if isinstance(result, str):
+        return result, False
+    if bodies and isinstance(result, dict) and any(id(value) in bodies for value in result.values()):
+        parts = []
+        for key, value in result.items():
+            raw = bodies.get(id(value))
+            part = raw[1] if raw is not None and raw[0] is value else dumps(value)
+            parts.append(dumps(str(key)) + b":" + part)
+        try:
+            return (b"{" + b",".join(parts) + b"}").decode(), True
+        except UnicodeDecodeError:
+            # Upstream bytes that are not UTF-8 are re-encoded from the decoded value
+            pass
+    return dumps(result).decode(), False
+
+
+def encoded(name: str, fn: Callable[..., Awaitable[Any]]) -> Callable[..., Awaitable[str]]:
+    """Wrap a tool coroutine to return its result as JSON text, reusing upstream bytes where possible."""
+
+    @functools.wraps(fn)
+    async def wrapper(*args: Any, **kwargs: Any) -> str:
+        bodies: Optional[Dict[int, Tuple[Any, bytes]]] = {} if Config.JSON_PASSTHROUGH else None
+        token = _raw_bodies.set(bodies)
+        try:
+            result = await fn(*args, **kwargs)
+        finally:
+            _raw_bodies.reset(token)
+        start = time.perf_counter()
+        text, reused = encode_result(result, bodies)
+        metrics.observe_encode(name, time.perf_counter() - start, reused)
+        return text
+
+    return wrapper
+
+
+def stats() -> Dict[str, Any]:
+    """Get the active backend and settings."""
+    return {
+        "backend": get_backend().name,
+        "thread_decode": _PARALLEL_THREADS and Config.JSON_THREAD_BYTES > 0,
+        "thread_bytes": Config.JSON_THREAD_BYTES,
+        "passthrough": Config.JSON_PASSTHROUGH,
+        "structured_output": Config.STRUCTURED_OUTPUT,
+    }
@@ -0,0 +1,262 @@
+"""
+Latency, size and error metrics for MCP tools and upstream calls
+
+Tool calls and upstream requests are recorded in fixed-bucket histograms and
+counters, which can be read as a dict or rendered in the OpenMetrics text
+format. Failures inside a tool call are classified (4xx, 5xx, timeout, ...)
+so a flattened error string can still be attributed to its cause.
+"""
+import contextvars
+import functools
+import math
+import time
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+import httpx
+
+from resilience import CircuitOpenError
+
+# Latency buckets in seconds
+LATENCY_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+# Body size buckets in bytes
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304, 16777216)
+
+# Error classes recorded while the current tool call runs; shared with child tasks
+_call_errors: "contextvars.ContextVar[Optional[List[str]]]" = contextvars.ContextVar("call_errors", default=None)
+
+
+class Histogram:
+    """Cumulative-bucket histogram with sum and count."""
+
+    def __init__(self, buckets: Tuple[float, ...]):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float) -> None:
+        index = len(self.buckets)
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                index = i
+                break
+        self.counts[index] += 1
+        self.sum += value
+        self.count += 1
+
+    def quantile(self, q: float) -> Optional[float]:
+        """Estimate a quantile by linear interpolation inside the bucket that holds it."""
+        if not self.count:
+            return None
+        rank = q * self.count
+        seen = 0
+        for i, count in enumerate(self.counts):
+            if seen + count >= rank and count:
+                lower = self.buckets[i - 1] if i > 0 else 0.0
+                upper = self.buckets[i] if i < len(self.buckets) else self.buckets[-1]
+                return lower + (upper - lower) * (rank - seen) / count
+            seen += count
+        return self.buckets[-1]
+
+    def summary(self, scale: float = 1.0, digits: int = 3) -> Dict[str, Any]:
+        def scaled(value: Optional[float]) -> Optional[float]:
+            return None if value is None else round(value * scale, digits)
+        return {
+            "count": self.count,
+            "mean": scaled(self.sum / self.count) if self.count else None,
+            "p50": scaled(self.quantile(0.5)),
+            "p90": scaled(self.quantile(0.9)),
+            "p99": scaled(self.quantile(0.99)),
+        }
+
+
+def status_class(status: int) -> str:
+    """Map an HTTP status code to its class, e.g. 404 -> '4xx'."""
+    return f"{status // 100}xx"
+
+
+def error_class(error: BaseException) -> str:
+    """Classify an exception raised while serving a tool call."""
+    if isinstance(error, httpx.HTTPStatusError):
+        return status_class(error.response.status_code)
+    if isinstance(error, httpx.TimeoutException):
+        return "timeout"
+    if isinstance(error, httpx.TransportError):
+        return "transport"
+    if isinstance(error, CircuitOpenError):
+        return "circuit_open"
+    if isinstance(error, (ValueError, KeyError, TypeError)):
+        return "invalid"
+    return "internal"
+
+
+class Metrics:
+    """Registry of tool and upstream metrics."""
+
+    def __init__(self) -> None:
+        self.started = time.time()
+        self.tool_latency: Dict[str, Histogram] = {}
+        self.tool_errors: Dict[Tuple[str, str], int] = {}
+        self.upstream_latency: Dict[str, Histogram] = {}
+        self.upstream_responses: Dict[Tuple[str, str], int] = {}
+        self.request_bytes: Dict[str, int] = {}
+        self.response_bytes: Dict[str, Histogram] = {}
+        self.decode_latency: Dict[str, Histogram] = {}
+        self.encode_latency: Dict[str, Histogram] = {}
+        self.passthrough: Dict[str, int] = {}
+        self.in_flight = 0
+        self.max_in_flight = 0
+
+    def instrument_tool(self, name: str, fn: Callable[..., Awaitable[Any]]) -> Callable[..., Awaitable[Any]]:
+        """Wrap a tool coroutine to record its latency and classify returned errors."""
+
+        @functools.wraps(fn)
+        async def wrapper(*args: Any, **kwargs: Any) -> Any:
+            errors: List[str] = []
+            token = _call_errors.set(errors)
+            start = time.perf_counter()
+            try:
+                result = await fn(*args, **kwargs)
+            except BaseException as e:
+                self._tool_done(name, start, error_class(e))
+                raise
+            finally:
+                _call_errors.reset(token)
+            failure = None
+            if isinstance(result, dict) and "error" in result:
+                failure = errors[-1] if errors else "local"
+                result.setdefault("error_class", failure)
+            self._tool_done(name, start, failure)
+            return result
+
+        return wrapper
+
+    def _tool_done(self, name: str, start: float, failure: Optional[str]) -> None:
+        self.tool_latency.setdefault(name, Histogram(LATENCY_BUCKETS)).observe(time.perf_counter() - start)
+        if failure is not None:
+            key = (name, failure)
+            self.tool_errors[key] = self.tool_errors.get(key, 0) + 1
+
+    def record_error(self, error: BaseException) -> None:
+        """Note a failed upstream call against the tool call in progress."""
+        errors = _call_errors.get()
+        if errors is not None:
+            errors.append(error_class(error))
+
+    def request_started(self) -> None:
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+
+    def observe_upstream(
+        self,
+        service: str,
+        seconds: float,
+        result: str,
+        request_bytes: int = 0,
+        response_bytes: int = 0
+    ) -> None:
+        """Record one upstream request attempt; result is a status class or error class."""
+        self.in_flight -= 1
+        self.upstream_latency.setdefault(service, Histogram(LATENCY_BUCKETS)).observe(seconds)
+        key = (service, result)
+        self.upstream_responses[key] = self.upstream_responses.get(key, 0) + 1
+        self.request_bytes[service] = self.request_bytes.get(service, 0) + request_bytes
+        self.response_bytes.setdefault(service, Histogram(SIZE_BUCKETS)).observe(response_bytes)
+
+    def observe_decode(self, service: str, seconds: float) -> None:
+        """Record time spent decoding a JSON response body."""
+        self.decode_latency.setdefault(service, Histogram(LATENCY_BUCKETS)).observe(seconds)
+
+    def observe_encode(self, tool: str, seconds: float, passthrough: bool = False) -> None:
+        """Record time spent encoding a tool result and whether upstream bytes were reused."""
+        self.encode_latency.setdefault(tool, Histogram(LATENCY_BUCKETS)).observe(seconds)
+        if passthrough:
+            self.passthrough[tool] = self.passthrough.get(tool, 0) + 1
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Get latency summaries (milliseconds), error counts and byte counts."""
+        tools = {}
+        for name, histogram in sorted(self.tool_latency.items()):
+            encode = self.encode_latency.get(name)
+            tools[name] = {
+                "latency_ms": histogram.summary(1000),
+                "errors": {cls: n for (tool, cls), n in sorted(self.tool_errors.items()) if tool == name},
+                "json_encode_ms": encode.summary(1000) if encode else None,
+                "passthrough": self.passthrough.get(name, 0),
+            }
+        upstream = {}
+        for service, histogram in sorted(self.upstream_latency.items()):
+            sizes = self.response_bytes.get(service)
+            decode = self.decode_latency.get(service)
+            upstream[service] = {
+                "latency_ms": histogram.summary(1000),
+                "responses": {cls: n for (svc, cls), n in sorted(self.upstream_responses.items()) if svc == service},
+                "request_bytes": self.request_bytes.get(service, 0),
+                "response_bytes": int(sizes.sum) if sizes else 0,
+                "json_decode_ms": decode.summary(1000) if decode else None,
+            }
+        return {
+            "uptime_s": round(time.time() - self.started, 1),
+            "in_flight": self.in_flight,
+            "max_in_flight": self.max_in_flight,
+            "tools": tools,
+            "upstream": upstream,
+        }
+
+    def openmetrics(self, gauges: Optional[Dict[str, float]] = None) -> str:
+        """Render the metrics, plus any extra gauges, in the OpenMetrics text format."""
+        lines: List[str] = []
+        self._histograms(lines, "gems_tool_duration_seconds", "MCP tool call latency", "tool", self.tool_latency)
+        self._counters(lines, "gems_tool_errors", "MCP tool calls that returned an error", ("tool", "class"), self.tool_errors)
+        self._histograms(lines, "gems_upstream_duration_seconds", "Upstream request latency per attempt", "service", self.upstream_latency)
+        self._counters(lines, "gems_upstream_responses", "Upstream responses by status or error class", ("service", "class"), self.upstream_responses)
+        self._counters(lines, "gems_upstream_request_bytes", "Upstream request body bytes", ("service",), {(k,): v for k, v in self.request_bytes.items()})
+        self._histograms(lines, "gems_upstream_response_bytes", "Upstream response body size", "service", self.response_bytes)
+        self._histograms(lines, "gems_json_decode_seconds", "Time spent decoding upstream JSON", "service", self.decode_latency)
+        self._histograms(lines, "gems_json_encode_seconds", "Time spent encoding tool results", "tool", self.encode_latency)
+        self._counters(lines, "gems_json_passthrough", "Tool results that reused upstream JSON bytes", ("tool",), {(k,): v for k, v in self.passthrough.items()})
+        all_gauges = {"gems_upstream_in_flight": self.in_flight, **(gauges or {})}
+        for name, value in sorted(all_gauges.items()):
+            if value is None or (isinstance(value, float) and math.isnan(value)):
+                continue
+            lines.append(f"# TYPE {name} gauge")
+            lines.append(f"{name} {_number(value)}")
+        lines.append("# EOF")
+        return "\n".join(lines) + "\n"
+
+    @staticmethod
+    def _histograms(lines: List[str], name: str, help_text: str, label: str, histograms: Dict[str, Histogram]) -> None:
+        if not histograms:
+            return
+        lines.append(f"# TYPE {name} histogram")
+        lines.append(f"# HELP {name} {help_text}")
+        for value, histogram in sorted(histograms.items()):
+            cumulative = 0
+            for bound, count in zip(list(histogram.buckets) + [math.inf], histogram.counts):
+                cumulative += count
+                le = "+Inf" if bound == math.inf else _number(bound)
+                lines.append(f'{name}_bucket{{{label}="{_escape(value)}",le="{le}"}} {cumulative}')
+            lines.append(f'{name}_sum{{{label}="{_escape(value)}"}} {_number(histogram.sum)}')
+            lines.append(f'{name}_count{{{label}="{_escape(value)}"}} {histogram.count}')
+
+    @staticmethod
+    def _counters(lines: List[str], name: str, help_text: str, labels: Tuple[str, ...], counters: Dict[Tuple[str, ...], int]) -> None:
+        if not counters:
+            return
+        lines.append(f"# TYPE {name} counter")
+        lines.append(f"# HELP {name} {help_text}")
+        for key, value in sorted(counters.items()):
+            label_text = ",".join(f'{label}="{_escape(v)}"' for label, v in zip(labels, key))
+            lines.append(f"{name}_total{{{label_text}}} {value}")
+
+
+def _number(value: float) -> str:
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+# Shared metrics registry
+metrics = Metrics()
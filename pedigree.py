@@ -0,0 +1,317 @@
+"""
+Local pedigree graph and coefficient-of-parentage engine
+
+Variety search results are folded into a DAG of integer node ids with compact
+mother/father arrays. Pedigree strings use Purdy notation (A/B, A/B//C,
+A/3/B/C//D, backcrosses A*3/B), so the unnamed intermediate crosses they
+describe become anonymous nodes.
+
+COP follows the usual assumptions for self-pollinated crops: every line is
+fully inbred (COP with itself is 1), each parent contributes half, selections
+inherit their parent's relationships, and ancestors without known parents are
+unrelated founders. Ancestry is truncated at max_depth generations.
+
+Each node records how many generations of its ancestry were loaded, so a COP
+is only computed locally when no ancestor within max_depth could be missing.
+"""
+import re
+from array import array
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+# Purdy separators: /n/ for level n, then // (level 2) and / (level 1)
+_SEPARATOR = re.compile(r"/(\d+)/|//|/")
+_BACKCROSS_LEFT = re.compile(r"^(.+?)\s*\*\s*(\d+)$")
+_BACKCROSS_RIGHT = re.compile(r"^(\d+)\s*\*\s*(.+)$")
+
+NO_PARENT = -1
+# Known ancestry of a loaded variety without parents: it is a founder
+COMPLETE = 2 ** 31 - 1
+
+# Temporary (hypothetical) crosses: negative node id -> (mother, father)
+Crosses = Dict[int, Tuple[int, int]]
+
+
+def name_key(name: str) -> str:
+    return " ".join(name.split()).casefold()
+
+
+class PedigreeGraph:
+    """Pedigree DAG with integer node ids and parent arrays."""
+
+    def __init__(self) -> None:
+        self.names: List[str] = []
+        self.mother = array("i")
+        self.father = array("i")
+        # Generations of each node's ancestry that were loaded (0 when unknown)
+        self.depth = array("i")
+        self._index: Dict[str, int] = {}
+        self.varieties_added = 0
+        self.local_pairs = 0
+
+    def __len__(self) -> int:
+        return len(self.names)
+
+    def node(self, name: str) -> int:
+        """Get or create the node for a named variety."""
+        key = name_key(name)
+        node = self._index.get(key)
+        if node is None:
+            node = self._new(name.strip())
+            self._index[key] = node
+        return node
+
+    def find(self, name: str) -> Optional[int]:
+        """Get a node id by name or alias, if known."""
+        return self._index.get(name_key(name))
+
+    def add_varieties(self, varieties: Any, pedigree_depth: int) -> int:
+        """
+        Add variety search results (VarietyModel dicts) fetched with
+        pedigree_depth. Returns how many were added.
+        """
+        added = 0
+        for variety in varieties if isinstance(varieties, list) else [varieties]:
+            if isinstance(variety, dict) and variety.get("preferred_name"):
+                self._add_variety(variety, pedigree_depth)
+                added += 1
+        self.varieties_added += added
+        return added
+
+    def _add_variety(self, variety: Dict[str, Any], pedigree_depth: int) -> None:
+        node = self.node(variety["preferred_name"])
+        for alias in variety.get("aliases") or []:
+            if alias.get("name"):
+                self._index.setdefault(name_key(alias["name"]), node)
+
+        parents: List[Optional[int]] = []
+        for field in ("mother", "father"):
+            parent = variety.get(field)
+            if isinstance(parent, dict) and parent.get("preferred_name"):
+                parent_node = self.node(parent["preferred_name"])
+                if parent.get("parentage") and not self._has_parents(parent_node):
+                    self._attach(parent_node, self.parse(parent["parentage"]))
+                parents.append(parent_node)
+            else:
+                parents.append(None)
+
+        description = variety.get("pedigree") or variety.get("parentage")
+        if description:
+            parsed = self.parse(description)
+            if any(p is not None for p in parents) and self._has_parents(parsed):
+                # Name the top-level halves of the pedigree after the known parents
+                halves = (self.mother[parsed], self.father[parsed])
+                for parent, half in zip(parents, halves):
+                    if parent is not None and half != NO_PARENT and half != parent:
+                        self._attach(parent, half)
+                parents = [p if p is not None else (h if h != NO_PARENT else None) for p, h in zip(parents, halves)]
+            elif not any(p is not None for p in parents):
+                self._attach(node, parsed)
+        if any(p is not None for p in parents):
+            self._set_parents(node, parents[0], parents[1])
+        if self._has_parents(node):
+            self._mark_depth(node, pedigree_depth)
+        else:
+            self.depth[node] = COMPLETE
+
+    def _mark_depth(self, node: int, depth: int) -> None:
+        """Record that node's ancestry is loaded to depth generations, and its ancestors' to fewer."""
+        frontier = [node]
+        while frontier and depth > 0:
+            next_frontier = []
+            for current in frontier:
+                if self.depth[current] >= depth:
+                    continue
+                self.depth[current] = depth
+                next_frontier.extend(p for p in (self.mother[current], self.father[current]) if p != NO_PARENT)
+            frontier = next_frontier
+            depth -= 1
+
+    def parse(self, expression: str) -> int:
+        """Parse a Purdy pedigree string into a node (anonymous for crosses)."""
+        node = _parse(expression, self.node, self._cross)
+        assert node is not None
+        return node
+
+    def _cross(self, mother: int, father: int) -> int:
+        node = self._new("")
+        self._set_parents(node, mother, father)
+        return node
+
+    def _new(self, name: str) -> int:
+        self.names.append(name)
+        self.mother.append(NO_PARENT)
+        self.father.append(NO_PARENT)
+        self.depth.append(0)
+        return len(self.names) - 1
+
+    def _set_parents(self, node: int, mother: Optional[int], father: Optional[int]) -> None:
+        self.mother[node] = NO_PARENT if mother is None or mother == node else mother
+        self.father[node] = NO_PARENT if father is None or father == node else father
+
+    def _has_parents(self, node: int) -> bool:
+        return self.mother[node] != NO_PARENT or self.father[node] != NO_PARENT
+
+    def _attach(self, named: int, parsed: int) -> None:
+        """Give a named node the parents of a parsed description of it."""
+        if named == parsed or self._has_parents(named):
+            return
+        if self._has_parents(parsed):
+            self._set_parents(named, self.mother[parsed], self.father[parsed])
+        elif self.names[parsed]:
+            # A single name describes a selection from that line
+            self._set_parents(named, parsed, None)
+
+    def _parents(self, node: int, crosses: Crosses) -> Tuple[int, int]:
+        if node < NO_PARENT:
+            return crosses[node]
+        return self.mother[node], self.father[node]
+
+    def known_depth(self, node: int, crosses: Optional[Crosses] = None) -> int:
+        """Generations of a node's ancestry that were loaded, including temporary crosses."""
+        if node >= 0:
+            return self.depth[node]
+        mother, father = (crosses or {})[node]
+        return min(self.known_depth(mother, crosses), self.known_depth(father, crosses)) + 1
+
+    def resolve(self, name: str, max_depth: int, crosses: Crosses) -> Optional[int]:
+        """
+        Get a node for a variety name, or a hypothetical cross such as 'A/B' of
+        known varieties, whose ancestry is loaded to max_depth generations.
+        Crosses get temporary negative ids recorded in crosses; the graph itself
+        is not changed.
+        """
+        node = self.find(name)
+        if node is None and _SEPARATOR.search(name):
+            def cross(mother: int, father: int) -> int:
+                temporary = NO_PARENT - 1 - len(crosses)
+                crosses[temporary] = (mother, father)
+                return temporary
+            node = _parse(name, self.find, cross)
+        if node is None or self.known_depth(node, crosses) < max_depth:
+            return None
+        return node
+
+    def cop_matrix(self, nodes: List[int], max_depth: int, crosses: Optional[Crosses] = None) -> List[List[float]]:
+        """
+        COP between every pair of nodes (including temporary crosses), with
+        ancestry truncated at max_depth generations.
+        """
+        crosses = crosses or {}
+        depth = self._ancestor_depths(nodes, max_depth, crosses)
+        generation: Dict[int, int] = {}
+
+        def parents(node: int) -> Tuple[int, ...]:
+            if depth[node] >= max_depth:
+                return ()
+            return tuple(p for p in self._parents(node, crosses) if p != NO_PARENT)
+
+        def gen(node: int) -> int:
+            if node not in generation:
+                # Seed the entry first so a cycle in bad pedigree data terminates
+                generation[node] = 0
+                generation[node] = 1 + max((gen(p) for p in parents(node)), default=-1)
+            return generation[node]
+
+        memo: Dict[Tuple[int, int], float] = {}
+
+        def cop(a: int, b: int) -> float:
+            if a == b:
+                return 1.0
+            key = (a, b) if a < b else (b, a)
+            if key in memo:
+                return memo[key]
+            # Expand the younger node; it cannot be an ancestor of the other
+            if gen(a) < gen(b):
+                a, b = b, a
+            memo[key] = 0.0
+            ps = parents(a)
+            value = sum(cop(p, b) for p in ps) / len(ps) if ps else 0.0
+            memo[key] = value
+            return value
+
+        matrix = [[cop(a, b) for b in nodes] for a in nodes]
+        self.local_pairs += len(nodes) * (len(nodes) + 1) // 2
+        return matrix
+
+    def _ancestor_depths(self, nodes: Iterable[int], max_depth: int, crosses: Crosses) -> Dict[int, int]:
+        """Breadth-first generations from the nearest panel node, up to max_depth."""
+        depth = {node: 0 for node in nodes}
+        frontier = list(depth)
+        level = 0
+        while frontier and level < max_depth:
+            level += 1
+            next_frontier = []
+            for node in frontier:
+                for parent in self._parents(node, crosses):
+                    if parent != NO_PARENT and parent not in depth:
+                        depth[parent] = level
+                        next_frontier.append(parent)
+            frontier = next_frontier
+        return depth
+
+    def stats(self) -> Dict[str, Any]:
+        """Get graph size and usage counters."""
+        return {
+            "nodes": len(self.names),
+            "named": sum(1 for name in self.names if name),
+            "loaded": sum(1 for depth in self.depth if depth),
+            "varieties_added": self.varieties_added,
+            "local_pairs": self.local_pairs,
+        }
+
+
+def _parse(
+    expression: str,
+    leaf: Callable[[str], Optional[int]],
+    cross: Callable[[int, int], int]
+) -> Optional[int]:
+    """
+    Parse a Purdy pedigree string bottom-up, getting named nodes from leaf and
+    making crosses with cross. None when leaf does not know a name.
+    """
+    expression = expression.strip()
+    separators = list(_SEPARATOR.finditer(expression))
+    if not separators:
+        return _leaf(expression, leaf)
+    levels = [int(m.group(1)) if m.group(1) else len(m.group(0)) for m in separators]
+    top = max(levels)
+    # Left-associative: split at the last separator of the highest level
+    split = [m for m, level in zip(separators, levels) if level == top][-1]
+    left, right = expression[:split.start()].strip(), expression[split.end():].strip()
+
+    recurrent = _BACKCROSS_LEFT.match(left) if not _SEPARATOR.search(left) else None
+    if recurrent and int(recurrent.group(2)) > 1:
+        return _backcross(_leaf(recurrent.group(1), leaf), _parse(right, leaf, cross), int(recurrent.group(2)), True, cross)
+    recurrent = _BACKCROSS_RIGHT.match(right) if not _SEPARATOR.search(right) else None
+    if recurrent and int(recurrent.group(1)) > 1:
+        return _backcross(_leaf(recurrent.group(2), leaf), _parse(left, leaf, cross), int(recurrent.group(1)), False, cross)
+    mother, father = _parse(left, leaf, cross), _parse(right, leaf, cross)
+    if mother is None or father is None:
+        return None
+    return cross(mother, father)
+
+
+def _backcross(
+    recurrent: Optional[int],
+    donor: Optional[int],
+    doses: int,
+    recurrent_is_mother: bool,
+    cross: Callable[[int, int], int]
+) -> Optional[int]:
+    if recurrent is None or donor is None:
+        return None
+    node = donor
+    for _ in range(doses):
+        node = cross(recurrent, node) if recurrent_is_mother else cross(node, recurrent)
+    return node
+
+
+def _leaf(text: str, leaf: Callable[[str], Optional[int]]) -> Optional[int]:
+    match = _BACKCROSS_LEFT.match(text) or _BACKCROSS_RIGHT.match(text)
+    if match:
+        text = match.group(1) if match.re is _BACKCROSS_LEFT else match.group(2)
+    return leaf(text)
+
+
+# Shared pedigree graph populated by the plant endpoints
+pedigree_graph = PedigreeGraph()
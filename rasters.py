@@ -0,0 +1,185 @@
+"""
+Content-addressed local store for raster downloads
+
+Raster bodies are streamed from upstream straight to disk and stored under
+their SHA-256 digest. A small reference file maps each normalized request to
+the digest, so repeated requests reuse the file without another download.
+"""
+import asyncio
+import hashlib
+import json
+import os
+import tempfile
+import time
+from pathlib import Path
+from typing import Any, Dict, Optional
+
+import httpx
+
+from config import Config
+from metrics import error_class, metrics, status_class
+from ratelimit import rate_limiter
+from resilience import service_name, upstream_guard
+from singleflight import request_coalescer
+
+# Size of the chunks read from the response body
+CHUNK_SIZE = 256 * 1024
+
+
+class RasterStore:
+    """Directory of downloaded rasters keyed by content digest."""
+
+    def __init__(self, directory: str, max_bytes: int):
+        self.root = Path(directory).expanduser()
+        self.objects = self.root / "objects"
+        self.refs = self.root / "refs"
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.downloads = 0
+        self.bytes_downloaded = 0
+
+    @classmethod
+    def from_config(cls) -> "RasterStore":
+        """Create a store using the settings in Config."""
+        return cls(Config.RASTER_DIR, Config.RASTER_DIR_MAX_BYTES)
+
+    async def fetch(
+        self,
+        client: httpx.AsyncClient,
+        key: str,
+        method: str,
+        path: str,
+        params: Optional[Dict[str, Any]] = None,
+        body: Any = None
+    ) -> Dict[str, Any]:
+        """Return the cached file for a request, streaming it from upstream on a miss."""
+        ref = await asyncio.to_thread(self._lookup, key)
+        if ref is not None:
+            self.hits += 1
+            return {**ref, "cached": True}
+        try:
+            ref = await request_coalescer.do(
+                f"RASTER {key}", lambda: self._download(client, key, method, path, params, body)
+            )
+        except Exception as e:
+            metrics.record_error(e)
+            raise
+        return {**ref, "cached": False}
+
+    async def _download(
+        self,
+        client: httpx.AsyncClient,
+        key: str,
+        method: str,
+        path: str,
+        params: Optional[Dict[str, Any]],
+        body: Any
+    ) -> Dict[str, Any]:
+        await asyncio.to_thread(self._prepare)
+        digest = hashlib.sha256()
+        size = 0
+        fd, tmp_name = tempfile.mkstemp(dir=self.objects, suffix=".part")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                metrics.request_started()
+                start = time.perf_counter()
+                result = "internal"
+
+                async def send() -> httpx.Response:
+                    await rate_limiter.acquire(path)
+                    request = client.build_request(method, path, params=params, json=body)
+                    return await client.send(request, stream=True)
+
+                try:
+                    # Retries and the circuit breaker apply before the body is streamed
+                    response = await upstream_guard.send(path, send)
+                    try:
+                        result = status_class(response.status_code)
+                        response.raise_for_status()
+                        content_type = response.headers.get("content-type", "")
+                        async for chunk in response.aiter_bytes(CHUNK_SIZE):
+                            digest.update(chunk)
+                            size += len(chunk)
+                            await asyncio.to_thread(f.write, chunk)
+                    finally:
+                        await response.aclose()
+                except Exception as e:
+                    if isinstance(e, (httpx.TimeoutException, httpx.TransportError)):
+                        result = error_class(e)
+                    raise
+                finally:
+                    metrics.observe_upstream(
+                        service_name(path), time.perf_counter() - start, result,
+                        len(json.dumps(body)) if body is not None else 0, size
+                    )
+            sha256 = digest.hexdigest()
+            ref = {
+                "path": str(self.objects / f"{sha256}.tif"),
+                "size": size,
+                "sha256": sha256,
+                "content_type": content_type,
+            }
+            await asyncio.to_thread(self._commit, tmp_name, key, ref)
+        except BaseException:
+            if os.path.exists(tmp_name):
+                os.unlink(tmp_name)
+            raise
+        self.downloads += 1
+        self.bytes_downloaded += size
+        return ref
+
+    def _prepare(self) -> None:
+        self.objects.mkdir(parents=True, exist_ok=True)
+        self.refs.mkdir(parents=True, exist_ok=True)
+
+    def _ref_path(self, key: str) -> Path:
+        return self.refs / f"{hashlib.sha256(key.encode()).hexdigest()}.json"
+
+    def _lookup(self, key: str) -> Optional[Dict[str, Any]]:
+        ref_path = self._ref_path(key)
+        try:
+            ref = json.loads(ref_path.read_text())
+        except (OSError, ValueError):
+            return None
+        try:
+            # Touch the file so eviction treats it as recently used
+            os.utime(ref["path"])
+        except OSError:
+            ref_path.unlink(missing_ok=True)
+            return None
+        return ref
+
+    def _commit(self, tmp_name: str, key: str, ref: Dict[str, Any]) -> None:
+        target = Path(ref["path"])
+        if target.exists():
+            os.unlink(tmp_name)
+            os.utime(target)
+        else:
+            os.replace(tmp_name, target)
+        self._ref_path(key).write_text(json.dumps(ref))
+        self._evict(keep=target)
+
+    def _evict(self, keep: Path) -> None:
+        files = [(p.stat().st_mtime, p.stat().st_size, p) for p in self.objects.glob("*.tif")]
+        total = sum(size for _, size, _ in files)
+        for _, size, path in sorted(files):
+            if total <= self.max_bytes:
+                break
+            if path == keep:
+                continue
+            path.unlink(missing_ok=True)
+            total -= size
+
+    def stats(self) -> Dict[str, Any]:
+        """Get counters for cached and downloaded rasters."""
+        return {
+            "directory": str(self.root),
+            "hits": self.hits,
+            "downloads": self.downloads,
+            "bytes_downloaded": self.bytes_downloaded,
+            "max_bytes": self.max_bytes,
+        }
+
+
+# Shared raster store used by the spatial endpoints
+raster_store = RasterStore.from_config()
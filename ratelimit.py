@@ -0,0 +1,198 @@
+"""
+Client-side token-bucket rate limiting for upstream GEMS Exchange calls
+
+One bucket covers the shared API key as a whole and optional buckets cover
+individual service prefixes (e.g. /weather/v2). Callers that have to wait are
+queued first-in, first-out rather than rejected.
+
+With GEMS_SHARED_STATE_DIR set (the default with several HTTP workers), bucket
+levels live in a SQLite file in WAL mode, so every worker process draws on the
+same quota. Each request reserves its token in one short transaction and then
+sleeps until its reservation is due.
+"""
+import asyncio
+import logging
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+from config import Config
+
+logger = logging.getLogger(__name__)
+
+
+class TokenBucket:
+    """Token bucket with a FIFO queue of waiting callers."""
+
+    def __init__(self, name: str, rate: float, burst: float):
+        self.name = name
+        self.rate = rate
+        self.burst = max(1.0, burst)
+        self.tokens = self.burst
+        self.updated = time.monotonic()
+        self.waiting = 0
+        self.max_waiting = 0
+        self.acquired = 0
+        self.delayed = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+        # asyncio.Lock wakes waiters in arrival order, which makes the queue fair
+        self._lock = asyncio.Lock()
+
+    async def acquire(self) -> float:
+        """Take one token, waiting in line if none is available. Returns the time waited."""
+        start = time.monotonic()
+        self.waiting += 1
+        self.max_waiting = max(self.max_waiting, self.waiting)
+        try:
+            await self._take()
+        finally:
+            self.waiting -= 1
+        waited = time.monotonic() - start
+        self.acquired += 1
+        self.total_wait += waited
+        self.max_wait = max(self.max_wait, waited)
+        if waited > 0.001:
+            self.delayed += 1
+        return waited
+
+    async def _take(self) -> None:
+        async with self._lock:
+            self._refill()
+            if self.tokens < 1:
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+                self._refill()
+            self.tokens -= 1
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "rate": self.rate,
+            "burst": self.burst,
+            "queue_depth": self.waiting,
+            "max_queue_depth": self.max_waiting,
+            "acquired": self.acquired,
+            "delayed": self.delayed,
+            "avg_wait_ms": round(1000 * self.total_wait / self.acquired, 3) if self.acquired else 0.0,
+            "max_wait_ms": round(1000 * self.max_wait, 3),
+        }
+
+
+class SharedBucketStore:
+    """Bucket levels in a SQLite file shared by worker processes."""
+
+    def __init__(self, directory: str):
+        path = Path(directory).expanduser()
+        path.mkdir(parents=True, exist_ok=True)
+        self.path = path / "ratelimit.sqlite3"
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(str(self.path), check_same_thread=False, isolation_level=None, timeout=30)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS buckets (name TEXT PRIMARY KEY, tokens REAL NOT NULL, updated REAL NOT NULL)"
+        )
+
+    def reserve(self, name: str, rate: float, burst: float) -> float:
+        """
+        Take one token, letting the level go negative when none is left. Returns
+        how long the caller must wait before its token is actually available.
+        """
+        with self._lock:
+            # IMMEDIATE takes the write lock up front, so the read-modify-write is atomic across processes
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = self._conn.execute("SELECT tokens, updated FROM buckets WHERE name = ?", (name,)).fetchone()
+                now = time.time()
+                tokens = burst if row is None else min(burst, row[0] + max(0.0, now - row[1]) * rate)
+                tokens -= 1
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO buckets (name, tokens, updated) VALUES (?, ?, ?)", (name, tokens, now)
+                )
+                self._conn.execute("COMMIT")
+            except BaseException:
+                if self._conn.in_transaction:
+                    self._conn.execute("ROLLBACK")
+                raise
+        return max(0.0, -tokens / rate)
+
+
+class SharedTokenBucket(TokenBucket):
+    """Token bucket whose level is kept in a SharedBucketStore."""
+
+    def __init__(self, name: str, rate: float, burst: float, store: SharedBucketStore):
+        super().__init__(name, rate, burst)
+        self.store = store
+        self.store_errors = 0
+
+    async def _take(self) -> None:
+        try:
+            delay = await asyncio.to_thread(self.store.reserve, self.name, self.rate, self.burst)
+        except sqlite3.Error as e:
+            # Fall back to this process's own bucket rather than failing the request
+            self.store_errors += 1
+            logger.info("Shared rate-limit state unavailable, limiting locally: %s", e)
+            await super()._take()
+            return
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+    def stats(self) -> Dict[str, Any]:
+        return {**super().stats(), "shared": True, "store_errors": self.store_errors}
+
+
+class RateLimiter:
+    """Key-wide bucket plus per-service-prefix buckets."""
+
+    def __init__(
+        self,
+        key_limit: Optional[Tuple[float, float]],
+        service_limits: Dict[str, Tuple[float, float]],
+        store: Optional[SharedBucketStore] = None
+    ):
+        def bucket(name: str, rate: float, burst: float) -> TokenBucket:
+            return SharedTokenBucket(name, rate, burst, store) if store else TokenBucket(name, rate, burst)
+
+        self.key_bucket = bucket("apikey", *key_limit) if key_limit else None
+        # Longest prefix first so the most specific limit wins
+        self.service_buckets: List[Tuple[str, TokenBucket]] = [
+            (prefix, bucket(prefix, rate, burst))
+            for prefix, (rate, burst) in sorted(service_limits.items(), key=lambda item: -len(item[0]))
+        ]
+
+    @classmethod
+    def from_config(cls) -> "RateLimiter":
+        """Create a limiter using the settings in Config."""
+        key_limit = Config.get_rate_limit()
+        service_limits = Config.get_service_rate_limits()
+        store = None
+        if Config.SHARED_STATE_DIR and (key_limit or service_limits):
+            store = SharedBucketStore(Config.SHARED_STATE_DIR)
+        return cls(key_limit, service_limits, store)
+
+    async def acquire(self, path: str) -> float:
+        """Wait for permission to send a request to path. Returns the total time waited."""
+        waited = 0.0
+        for prefix, bucket in self.service_buckets:
+            if path.startswith(prefix):
+                waited += await bucket.acquire()
+                break
+        if self.key_bucket is not None:
+            waited += await self.key_bucket.acquire()
+        return waited
+
+    def stats(self) -> Dict[str, Any]:
+        """Get queue depth and wait time for each bucket."""
+        buckets = [self.key_bucket] if self.key_bucket else []
+        buckets.extend(bucket for _, bucket in self.service_buckets)
+        return {bucket.name: bucket.stats() for bucket in buckets}
+
+
+# Shared limiter used by all endpoint modules
+rate_limiter = RateLimiter.from_config()
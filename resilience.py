@@ -0,0 +1,200 @@
+"""
+Retry, backoff and circuit breaking for upstream GEMS Exchange calls
+
+Retries use full-jitter exponential backoff and honour Retry-After. Each
+upstream service (weather, soil, pedtools, ...) has its own circuit breaker
+that fails fast while the service is unhealthy.
+"""
+import asyncio
+import email.utils
+import random
+import time
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+import httpx
+
+from config import Config
+
+# Status codes worth retrying
+RETRY_STATUSES = frozenset({429, 502, 503, 504})
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+class CircuitOpenError(Exception):
+    """Raised when a call is rejected because the service's circuit is open."""
+
+    def __init__(self, service: str, retry_in: float):
+        super().__init__(
+            f"{service} API is unavailable after repeated failures; retry in {retry_in:.0f}s"
+        )
+        self.service = service
+        self.retry_in = retry_in
+
+
+def service_name(path: str) -> str:
+    """Get the upstream service for an API path, e.g. '/weather/v2/current' -> 'weather'."""
+    return path.lstrip("/").split("/", 1)[0] or "default"
+
+
+class CircuitBreaker:
+    """Consecutive-failure circuit breaker with a single half-open trial call."""
+
+    def __init__(self, service: str, failure_threshold: int, reset_timeout: float):
+        self.service = service
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self.times_opened = 0
+        self.rejected = 0
+        self._trial_running = False
+
+    def before_call(self) -> None:
+        """Raise CircuitOpenError unless a call may go upstream now."""
+        if self.state == CLOSED:
+            return
+        elapsed = time.monotonic() - self.opened_at
+        if self.state == OPEN and elapsed >= self.reset_timeout:
+            self.state = HALF_OPEN
+        if self.state == HALF_OPEN and not self._trial_running:
+            self._trial_running = True
+            return
+        self.rejected += 1
+        raise CircuitOpenError(self.service, max(0.0, self.reset_timeout - elapsed))
+
+    def record_success(self) -> None:
+        self.state = CLOSED
+        self.failures = 0
+        self._trial_running = False
+
+    def release_trial(self) -> None:
+        """End a call that says nothing about the service's health, such as a cancelled one."""
+        self._trial_running = False
+
+    def record_failure(self) -> None:
+        self.failures += 1
+        self._trial_running = False
+        if self.state == HALF_OPEN or self.failures >= self.failure_threshold:
+            if self.state != OPEN:
+                self.times_opened += 1
+            self.state = OPEN
+            self.opened_at = time.monotonic()
+
+    @property
+    def is_open(self) -> bool:
+        return self.state == OPEN and time.monotonic() - self.opened_at < self.reset_timeout
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "state": self.state,
+            "consecutive_failures": self.failures,
+            "times_opened": self.times_opened,
+            "rejected": self.rejected,
+        }
+
+
+class UpstreamGuard:
+    """Applies retries and per-service circuit breakers to upstream requests."""
+
+    def __init__(
+        self,
+        max_attempts: int,
+        base_delay: float,
+        max_delay: float,
+        max_retry_after: float,
+        failure_threshold: int,
+        reset_timeout: float
+    ):
+        self.max_attempts = max(1, max_attempts)
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.max_retry_after = max_retry_after
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.retries = 0
+        self.stale_served = 0
+        self.breakers: Dict[str, CircuitBreaker] = {}
+
+    @classmethod
+    def from_config(cls) -> "UpstreamGuard":
+        """Create a guard using the settings in Config."""
+        return cls(
+            Config.RETRY_MAX_ATTEMPTS,
+            Config.RETRY_BASE_DELAY,
+            Config.RETRY_MAX_DELAY,
+            Config.RETRY_AFTER_MAX,
+            Config.BREAKER_FAILURE_THRESHOLD,
+            Config.BREAKER_RESET_TIMEOUT
+        )
+
+    def breaker(self, service: str) -> CircuitBreaker:
+        """Get the circuit breaker for a service."""
+        breaker = self.breakers.get(service)
+        if breaker is None:
+            breaker = self.breakers[service] = CircuitBreaker(
+                service, self.failure_threshold, self.reset_timeout
+            )
+        return breaker
+
+    async def send(self, path: str, send: Callable[[], Awaitable[httpx.Response]]) -> httpx.Response:
+        """Send a request with retries, failing fast while the service's circuit is open."""
+        breaker = self.breaker(service_name(path))
+        for attempt in range(self.max_attempts):
+            breaker.before_call()
+            last_attempt = attempt == self.max_attempts - 1
+            try:
+                response = await send()
+            except (httpx.TimeoutException, httpx.TransportError):
+                breaker.record_failure()
+                if last_attempt:
+                    raise
+                delay = self._backoff(attempt)
+            except BaseException:
+                # Cancelled, or failed before a usable response (bad URL, undecodable body,
+                # redirect loop): no verdict, but a half-open trial must not stay claimed
+                breaker.release_trial()
+                raise
+            else:
+                if response.status_code < 500 and response.status_code != 429:
+                    breaker.record_success()
+                    return response
+                breaker.record_failure()
+                if last_attempt or response.status_code not in RETRY_STATUSES:
+                    return response
+                delay = self._retry_after(response) or self._backoff(attempt)
+                await response.aclose()
+            self.retries += 1
+            await asyncio.sleep(delay)
+        raise AssertionError("unreachable")
+
+    def _backoff(self, attempt: int) -> float:
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+
+    def _retry_after(self, response: httpx.Response) -> Optional[float]:
+        value = response.headers.get("retry-after")
+        if not value:
+            return None
+        try:
+            delay = float(value)
+        except ValueError:
+            try:
+                delay = email.utils.parsedate_to_datetime(value).timestamp() - time.time()
+            except (TypeError, ValueError):
+                return None
+        return min(max(0.0, delay), self.max_retry_after)
+
+    def stats(self) -> Dict[str, Any]:
+        """Get retry counters and circuit breaker states."""
+        return {
+            "retries": self.retries,
+            "stale_served": self.stale_served,
+            "services": {name: b.stats() for name, b in sorted(self.breakers.items())},
+        }
+
+
+# Shared guard used by all endpoint modules
+upstream_guard = UpstreamGuard.from_config()
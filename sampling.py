@@ -0,0 +1,204 @@
+"""
+Local raster point-sampling engine
+
+Raster tiles downloaded through the raster store are opened once (memory-mapped
+when the GeoTIFF is uncompressed) and answer many point queries with vectorized
+NumPy index lookups. Requires the optional NumPy and tifffile dependencies.
+"""
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, List, Optional, Tuple
+
+from config import Config
+import grid
+
+# numpy and tifffile are part of the optional "raster" extra; they are imported
+# on first use so that server startup does not pay for them
+np: Any = None
+tifffile: Any = None
+_missing = False
+
+# GeoTIFF tags and keys
+TAG_MODEL_PIXEL_SCALE = 33550
+TAG_MODEL_TIEPOINT = 33922
+TAG_GEO_KEY_DIRECTORY = 34735
+TAG_GDAL_NODATA = 42113
+KEY_RASTER_TYPE = 1025
+KEY_GEOGRAPHIC_TYPE = 2048
+KEY_PROJECTED_CS_TYPE = 3072
+RASTER_PIXEL_IS_POINT = 2
+
+INTERPOLATIONS = ("nearest", "bilinear")
+
+
+def available() -> bool:
+    """Whether the optional dependencies for local sampling are installed, importing them if so."""
+    global np, tifffile, _missing
+    if np is None and not _missing:
+        try:
+            import numpy
+            import tifffile as tiff
+        except ImportError:
+            _missing = True
+            return False
+        np, tifffile = numpy, tiff
+    return np is not None
+
+
+class RasterTile:
+    """A georeferenced single-band raster held in memory or memory-mapped."""
+
+    def __init__(self, path: str, array: Any, x0: float, y0: float, sx: float, sy: float, epsg: int, nodata: Optional[float]):
+        self.path = path
+        self.array = array
+        self.x0 = x0
+        self.y0 = y0
+        self.sx = sx
+        self.sy = sy
+        self.epsg = epsg
+        self.nodata = nodata
+        self.height, self.width = array.shape
+
+    @classmethod
+    def open(cls, path: str) -> "RasterTile":
+        """Open a GeoTIFF, memory-mapping it when the file layout allows."""
+        if not available():
+            raise RuntimeError("Local raster sampling requires: pip install 'gems-exchange-mcp-server[raster]'")
+        with tifffile.TiffFile(path) as tif:
+            page = tif.pages[0]
+            tags = {tag.code: tag.value for tag in page.tags.values()}
+            memmappable = page.is_memmappable
+            array = None if memmappable else page.asarray()
+        if memmappable:
+            array = tifffile.memmap(path, mode="r")
+        if array.ndim == 3:
+            # Keep the first band of planar or interleaved multi-band rasters
+            array = array[0] if array.shape[0] < array.shape[-1] else array[..., 0]
+
+        sx, sy = tags[TAG_MODEL_PIXEL_SCALE][:2]
+        i, j, _, x, y, _ = tags[TAG_MODEL_TIEPOINT][:6]
+        x0, y0 = x - i * sx, y + j * sy
+        keys = _geo_keys(tags.get(TAG_GEO_KEY_DIRECTORY, ()))
+        if keys.get(KEY_RASTER_TYPE) == RASTER_PIXEL_IS_POINT:
+            x0, y0 = x0 - sx / 2, y0 + sy / 2
+        epsg = keys.get(KEY_PROJECTED_CS_TYPE) or keys.get(KEY_GEOGRAPHIC_TYPE) or grid.EPSG_WGS84
+        nodata = tags.get(TAG_GDAL_NODATA)
+        nodata = float(str(nodata).strip("\x00 ")) if nodata not in (None, "") else None
+        return cls(path, array, x0, y0, sx, sy, epsg, nodata)
+
+    @property
+    def nbytes(self) -> int:
+        return int(self.array.nbytes)
+
+    def sample(self, x: Any, y: Any, interpolation: str = "nearest") -> Tuple[Any, Any]:
+        """Sample projected coordinates. Returns (values, covered) arrays; nodata becomes NaN."""
+        col = (x - self.x0) / self.sx
+        row = (self.y0 - y) / self.sy
+        covered = (col >= 0) & (col < self.width) & (row >= 0) & (row < self.height)
+        values = np.full(col.shape, np.nan)
+        if not covered.any():
+            return values, covered
+        col, row = col[covered], row[covered]
+        if interpolation == "bilinear":
+            values[covered] = self._bilinear(col, row)
+        else:
+            values[covered] = self._read(row.astype(np.intp), col.astype(np.intp))
+        return values, covered
+
+    def _read(self, rows: Any, cols: Any) -> Any:
+        values = np.asarray(self.array[rows, cols], dtype=np.float64)
+        if self.nodata is not None:
+            values[values == self.nodata] = np.nan
+        return values
+
+    def _bilinear(self, col: Any, row: Any) -> Any:
+        # Pixel centers sit at half-integer offsets
+        c = col - 0.5
+        r = row - 0.5
+        c0 = np.floor(c).astype(np.intp)
+        r0 = np.floor(r).astype(np.intp)
+        fc = c - c0
+        fr = r - r0
+        c0c, c1c = np.clip(c0, 0, self.width - 1), np.clip(c0 + 1, 0, self.width - 1)
+        r0c, r1c = np.clip(r0, 0, self.height - 1), np.clip(r0 + 1, 0, self.height - 1)
+        corners = np.stack([
+            self._read(r0c, c0c), self._read(r0c, c1c),
+            self._read(r1c, c0c), self._read(r1c, c1c),
+        ])
+        weights = np.stack([(1 - fr) * (1 - fc), (1 - fr) * fc, fr * (1 - fc), fr * fc])
+        # Renormalize over the corners that hold data
+        weights = np.where(np.isnan(corners), 0.0, weights)
+        total = weights.sum(axis=0)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            return np.where(total > 0, (np.nan_to_num(corners) * weights).sum(axis=0) / total, np.nan)
+
+
+class TileCache:
+    """LRU of loaded raster tiles grouped by object."""
+
+    def __init__(self, max_tiles: int):
+        self.max_tiles = max_tiles
+        self.tiles_loaded = 0
+        self.local_points = 0
+        self._tiles: "OrderedDict[Tuple[Hashable, str], RasterTile]" = OrderedDict()
+
+    def add(self, object_key: Hashable, tile: RasterTile) -> None:
+        self._tiles[(object_key, tile.path)] = tile
+        self._tiles.move_to_end((object_key, tile.path))
+        self.tiles_loaded += 1
+        while len(self._tiles) > self.max_tiles:
+            self._tiles.popitem(last=False)
+
+    def tiles_for(self, object_key: Hashable) -> List[RasterTile]:
+        tiles = []
+        for key in [k for k in self._tiles if k[0] == object_key]:
+            self._tiles.move_to_end(key)
+            tiles.append(self._tiles[key])
+        return tiles
+
+    def sample(self, object_key: Hashable, lons: Any, lats: Any, interpolation: str = "nearest") -> Tuple[Any, Any]:
+        """Sample lon/lat arrays against every cached tile of an object. Returns (values, covered)."""
+        values = np.full(lons.shape, np.nan)
+        covered = np.zeros(lons.shape, dtype=bool)
+        projected: Dict[int, Tuple[Any, Any]] = {}
+        for tile in self.tiles_for(object_key):
+            todo = ~covered
+            if not todo.any():
+                break
+            if tile.epsg not in projected:
+                try:
+                    projected[tile.epsg] = grid.project(lons, lats, tile.epsg)
+                except ValueError:
+                    continue
+            x, y = projected[tile.epsg]
+            tile_values, tile_covered = tile.sample(x[todo], y[todo], interpolation)
+            idx = np.flatnonzero(todo)[tile_covered]
+            values[idx] = tile_values[tile_covered]
+            covered[idx] = True
+        self.local_points += int(covered.sum())
+        return values, covered
+
+    def stats(self) -> Dict[str, Any]:
+        """Get counters for loaded tiles and locally answered points."""
+        return {
+            "available": available(),
+            "tiles": len(self._tiles),
+            "max_tiles": self.max_tiles,
+            "tile_bytes": sum(t.nbytes for t in self._tiles.values()),
+            "tiles_loaded": self.tiles_loaded,
+            "local_points": self.local_points,
+        }
+
+
+def _geo_keys(directory: Any) -> Dict[int, int]:
+    """Decode the short-valued entries of a GeoKeyDirectory tag."""
+    keys: Dict[int, int] = {}
+    values = list(directory)
+    for offset in range(4, len(values) - 3, 4):
+        key_id, location, _, value = values[offset:offset + 4]
+        if location == 0:
+            keys[key_id] = value
+    return keys
+
+
+# Shared tile cache used by the spatial endpoints
+tile_cache = TileCache(Config.SAMPLING_MAX_TILES)
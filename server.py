@@ -6,27 +6,234 @@ A Model Context Protocol server for accessing GEMS Exchange APIs.
 Provides agricultural, environmental, and climate data through standardized tools.
 """
 
+import asyncio
+import importlib.util
 import json
-from typing import Any, Dict, List, Optional
+import logging
+import os
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, List, Optional
 import httpx
 from mcp.server.fastmcp import FastMCP
+from starlette.applications import Starlette
 
-# Import configuration and endpoint modules
+# Only what tool registration needs is imported here. The endpoint modules and
+# the caches and stores they share are imported by the functions that use them,
+# so a session that calls a few tools never loads the rest.
 from config import Config
-from endpoints import weather, plant, datasets, spatial
+from metrics import metrics
+import jsoncodec
+import shaping
+
+logger = logging.getLogger(__name__)
+
+
+def create_client() -> httpx.AsyncClient:
+    """Create the shared HTTP client with the pool, timeout and HTTP/2 settings from Config."""
+    http2 = Config.HTTP2 and importlib.util.find_spec("h2") is not None
+    if Config.HTTP2 and not http2:
+        logger.info("HTTP/2 requested but the 'h2' package is not installed; using HTTP/1.1")
+    return httpx.AsyncClient(
+        base_url=Config.BASE_URL,
+        timeout=Config.get_timeout(),
+        limits=Config.get_limits(),
+        http2=http2,
+        headers=Config.get_headers()
+    )
+
+
+async def warm_client(connections: int) -> None:
+    """
+    Open pooled connections ahead of the first tool call. httpx imports its
+    transport (httpcore) when the first client is created; that import is done
+    in a thread first, so the event loop keeps answering the handshake.
+    """
+    await asyncio.to_thread(importlib.import_module, "httpcore")
+    http_client = get_client()
+
+    async def touch() -> None:
+        try:
+            await http_client.head("/")
+        except httpx.HTTPError as e:
+            logger.info("Connection warm-up failed: %s", e)
+
+    await asyncio.gather(*(touch() for _ in range(connections)))
+
+
+def metric_gauges() -> Dict[str, float]:
+    """Cache, coalescing, retry and pool figures exported alongside the metrics."""
+    from cache import response_cache
+    from singleflight import request_coalescer
+    from resilience import upstream_guard
+    cache = response_cache.stats()
+    coalescing = request_coalescer.stats()
+    guard = upstream_guard.stats()
+    limits = Config.get_limits()
+    return {
+        "gems_cache_hits": cache["hits"],
+        "gems_cache_misses": cache["misses"],
+        "gems_cache_memory_entries": cache["memory"]["entries"],
+        "gems_cache_memory_bytes": cache["memory"]["bytes"],
+        "gems_coalesced_requests": coalescing["deduplicated"],
+        "gems_upstream_retries": guard["retries"],
+        "gems_stale_responses_served": guard["stale_served"],
+        "gems_open_circuits": sum(1 for b in guard["services"].values() if b["state"] != "closed"),
+        "gems_pool_max_connections": limits.max_connections,
+        "gems_pool_max_keepalive_connections": limits.max_keepalive_connections,
+    }
+
+
+def write_metrics_file(path: str) -> None:
+    """Atomically write the OpenMetrics text dump, e.g. for a node_exporter textfile collector."""
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w") as f:
+        f.write(metrics.openmetrics(metric_gauges()))
+    os.replace(tmp_path, path)
+
+
+async def dump_metrics(path: str, interval: float) -> None:
+    """Rewrite the metrics file every interval seconds, and once more when cancelled."""
+    try:
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                await asyncio.to_thread(write_metrics_file, path)
+            except OSError as e:
+                logger.info("Could not write metrics file %s: %s", path, e)
+    finally:
+        try:
+            write_metrics_file(path)
+        except OSError as e:
+            logger.info("Could not write metrics file %s: %s", path, e)
+
+
+def deployment_tasks() -> List["asyncio.Task[None]"]:
+    """Start the background jobs that run in one process per deployment (see workers.py)."""
+    from watchlist import SYNC_INTERVAL, weather_watchlist
+    tasks = []
+    if Config.CATALOG_PRELOAD and Config.CATALOG_REFRESH > 0:
+        from catalog import catalog_store
+        from endpoints import datasets
+        tasks.append(asyncio.create_task(catalog_store.run(
+            lambda: datasets.load_catalog(get_client()), Config.CATALOG_REFRESH
+        )))
+
+    async def prefetch(product: str, locations: List[Dict[str, Any]]) -> List[Any]:
+        # Imported on the first refresh, so an empty watchlist costs nothing at startup
+        from endpoints import weather
+        return await weather.prefetch(get_client(), product, locations)
+
+    tasks.append(asyncio.create_task(weather_watchlist.run(
+        prefetch,
+        # Other workers edit the watchlist file too
+        SYNC_INTERVAL if Config.WORKERS > 1 else None
+    )))
+    if Config.METRICS_FILE:
+        tasks.append(asyncio.create_task(dump_metrics(Config.METRICS_FILE, Config.METRICS_INTERVAL)))
+    return tasks
 
-# Initialize FastMCP server
-mcp = FastMCP(Config.SERVER_NAME)
 
-# Global HTTP client
-client = httpx.AsyncClient(
-    base_url=Config.BASE_URL,
-    timeout=Config.TIMEOUT,
-    headers=Config.get_headers()
+@asynccontextmanager
+async def background_tasks() -> AsyncIterator[None]:
+    """
+    Warm the HTTP client, and load the dataset catalog and refresh watched locations
+    if this process holds the deployment lock. Stop them and close the client cleanly
+    on shutdown.
+    """
+    from workers import LeaderLock, lead
+    tasks = []
+    if Config.WARM_CONNECTIONS > 0:
+        # Warm-up must not delay the initialize handshake
+        tasks.append(asyncio.create_task(warm_client(Config.WARM_CONNECTIONS)))
+    lock = LeaderLock(Config.SHARED_STATE_DIR) if Config.SHARED_STATE_DIR else None
+    tasks.append(asyncio.create_task(lead(lock, deployment_tasks)))
+    try:
+        yield
+    finally:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        if client is not None:
+            await client.aclose()
+
+
+@asynccontextmanager
+async def lifespan(server: FastMCP) -> AsyncIterator[None]:
+    """
+    Run the background tasks for a stdio session. Over HTTP, FastMCP enters this
+    for every session (every request when stateless), so http_app runs the
+    background tasks once per worker process instead.
+    """
+    if Config.TRANSPORT == "stdio":
+        async with background_tasks():
+            yield
+    else:
+        yield
+
+
+# Initialize FastMCP server
+mcp = FastMCP(
+    Config.SERVER_NAME,
+    lifespan=lifespan,
+    host=Config.HTTP_HOST,
+    port=Config.HTTP_PORT,
+    stateless_http=Config.HTTP_STATELESS,
+    json_response=Config.HTTP_JSON_RESPONSE
 )
 
+
+def http_app() -> Starlette:
+    """
+    Build the ASGI app of one HTTP worker: FastMCP's streamable HTTP (or SSE) app,
+    with the background tasks added to its lifespan.
+    """
+    app = mcp.streamable_http_app() if Config.TRANSPORT == "streamable-http" else mcp.sse_app()
+    sessions = app.router.lifespan_context
+
+    @asynccontextmanager
+    async def app_lifespan(app: Starlette) -> AsyncIterator[Any]:
+        async with background_tasks():
+            async with sessions(app) as state:
+                yield state
+
+    app.router.lifespan_context = app_lifespan
+    return app
+
+
+def tool(name: str) -> Callable[[Callable[..., Awaitable[Any]]], Callable[..., Awaitable[Any]]]:
+    """
+    Register an MCP tool with output shaping arguments, latency and error metrics
+    and JSON encoding of its result.
+
+    Results are encoded by jsoncodec as text content, reusing upstream bytes where
+    possible. With GEMS_STRUCTURED_OUTPUT, FastMCP encodes them instead and also
+    returns them as structured content.
+    """
+    def decorator(fn: Callable[..., Awaitable[Any]]) -> Callable[..., Awaitable[Any]]:
+        wrapped = metrics.instrument_tool(name, shaping.shaped(fn))
+        if Config.STRUCTURED_OUTPUT:
+            mcp.tool(name)(wrapped)
+        else:
+            mcp.tool(name, structured_output=False)(jsoncodec.encoded(name, wrapped))
+        # Calling the module-level function directly still returns the result dict
+        return wrapped
+    return decorator
+
+
+# Global HTTP client, created on first use so startup does not pay for TLS setup
+client: Optional[httpx.AsyncClient] = None
+
+
+def get_client() -> httpx.AsyncClient:
+    """Get the shared HTTP client, creating it on first use."""
+    global client
+    if client is None or client.is_closed:
+        client = create_client()
+    return client
+
+
 # Weather Tools
-@mcp.tool("weather_current")
+@tool("weather_current")
 async def weather_current(latitude: float, longitude: float) -> Dict[str, Any]:
     """
     Get current weather observations for a specific location.
@@ -35,8 +242,13 @@ async def weather_current(latitude: float, longitude: float) -> Dict[str, Any]:
         latitude: Latitude in decimal degrees (-90 to 90)
         longitude: Longitude in decimal degrees (-180 to 180)
     """
+    from endpoints import weather
+    from watchlist import weather_watchlist
     try:
-        result = await weather.get_current(client, latitude, longitude)
+        watched = weather_watchlist.lookup("current", latitude, longitude)
+        if watched is not None:
+            return {"location": {"latitude": latitude, "longitude": longitude}, **watched}
+        result = await weather.get_current(get_client(), latitude, longitude)
         return {
             "location": {"latitude": latitude, "longitude": longitude},
             "data": result
@@ -45,7 +257,34 @@ async def weather_current(latitude: float, longitude: float) -> Dict[str, Any]:
         return {"error": str(e), "location": {"latitude": latitude, "longitude": longitude}}
 
 
-@mcp.tool("weather_alerts")
+@tool("weather_current_batch")
+async def weather_current_batch(
+    points: Optional[List[List[float]]] = None,
+    stations: Optional[List[str]] = None
+) -> Dict[str, Any]:
+    """
+    Get current weather observations for many locations at once.
+    
+    Locations are grouped into multi-point/multi-station upstream requests that run
+    concurrently. Results are returned in the same order as the input.
+    
+    Args:
+        points: List of [latitude, longitude] pairs in decimal degrees
+        stations: List of weather station call IDs (e.g. KMSP, KRDU)
+    """
+    from endpoints import weather
+    try:
+        results = []
+        if points:
+            results.extend(await weather.get_current_batch(get_client(), [(p[0], p[1]) for p in points]))
+        if stations:
+            results.extend(await weather.get_current_stations(get_client(), stations))
+        return {"count": len(results), "data": results}
+    except Exception as e:
+        return {"error": str(e)}
+
+
+@tool("weather_alerts")
 async def weather_alerts(latitude: float, longitude: float) -> Dict[str, Any]:
     """
     Get severe weather alerts for a specific location.
@@ -54,8 +293,13 @@ async def weather_alerts(latitude: float, longitude: float) -> Dict[str, Any]:
         latitude: Latitude in decimal degrees (-90 to 90)
         longitude: Longitude in decimal degrees (-180 to 180)
     """
+    from endpoints import weather
+    from watchlist import weather_watchlist
     try:
-        result = await weather.get_alerts(client, latitude, longitude)
+        watched = weather_watchlist.lookup("alerts", latitude, longitude)
+        if watched is not None:
+            return {"location": {"latitude": latitude, "longitude": longitude}, **watched}
+        result = await weather.get_alerts(get_client(), latitude, longitude)
         return {
             "location": {"latitude": latitude, "longitude": longitude},
             "data": result
@@ -64,7 +308,7 @@ async def weather_alerts(latitude: float, longitude: float) -> Dict[str, Any]:
         return {"error": str(e), "location": {"latitude": latitude, "longitude": longitude}}
 
 
-@mcp.tool("weather_forecast")
+@tool("weather_forecast")
 async def weather_forecast(latitude: float, longitude: float, days: int = 5) -> Dict[str, Any]:
     """
     Get weather forecast for a specific location.
@@ -74,8 +318,13 @@ async def weather_forecast(latitude: float, longitude: float, days: int = 5) ->
         longitude: Longitude in decimal degrees (-180 to 180)
         days: Number of forecast days (1-10, default 5)
     """
+    from endpoints import weather
+    from watchlist import weather_watchlist
     try:
-        result = await weather.get_forecast(client, latitude, longitude, days)
+        watched = weather_watchlist.lookup("forecast", latitude, longitude, days)
+        if watched is not None:
+            return {"location": {"latitude": latitude, "longitude": longitude}, "days": days, **watched}
+        result = await weather.get_forecast(get_client(), latitude, longitude, days)
         return {
             "location": {"latitude": latitude, "longitude": longitude},
             "days": days,
@@ -85,7 +334,7 @@ async def weather_forecast(latitude: float, longitude: float, days: int = 5) ->
         return {"error": str(e), "location": {"latitude": latitude, "longitude": longitude}}
 
 
-@mcp.tool("weather_historical")
+@tool("weather_historical")
 async def weather_historical(
     latitude: float, 
     longitude: float, 
@@ -101,8 +350,42 @@ async def weather_historical(
         start_date: Start date for historical data (YYYY-MM-DD format)
         end_date: End date for historical data (YYYY-MM-DD format)
     """
+    from endpoints import weather
+    try:
+        result = await weather.get_historical(get_client(), latitude, longitude, start_date, end_date)
+        return {
+            "location": {"latitude": latitude, "longitude": longitude},
+            "period": {"start": start_date, "end": end_date},
+            "data": result
+        }
+    except Exception as e:
+        return {"error": str(e), "location": {"latitude": latitude, "longitude": longitude}}
+
+
+@tool("weather_history_series")
+async def weather_history_series(
+    latitude: float,
+    longitude: float,
+    start_date: str,
+    end_date: str,
+    product: str = "daily"
+) -> Dict[str, Any]:
+    """
+    Get a historical weather time series for a location over a date range.
+
+    Long ranges are split into chunks fetched in parallel, and each day is cached,
+    so overlapping or extended ranges only fetch the missing days.
+
+    Args:
+        latitude: Latitude in decimal degrees (-90 to 90)
+        longitude: Longitude in decimal degrees (-180 to 180)
+        start_date: First day of the series (YYYY-MM-DD format)
+        end_date: Day after the last day of the series (YYYY-MM-DD format)
+        product: One of "daily", "hourly", "subhourly" or "energy" (daily energy records)
+    """
+    from endpoints import weather
     try:
-        result = await weather.get_historical(client, latitude, longitude, start_date, end_date)
+        result = await weather.get_history_range(get_client(), latitude, longitude, start_date, end_date, product)
         return {
             "location": {"latitude": latitude, "longitude": longitude},
             "period": {"start": start_date, "end": end_date},
@@ -112,8 +395,65 @@ async def weather_historical(
         return {"error": str(e), "location": {"latitude": latitude, "longitude": longitude}}
 
 
+@tool("watchlist_add")
+async def watchlist_add(
+    name: str,
+    latitude: float,
+    longitude: float,
+    products: Optional[List[str]] = None,
+    days: int = 5
+) -> Dict[str, Any]:
+    """
+    Watch a location so its weather is prefetched in the background.
+    
+    weather_current, weather_alerts and weather_forecast calls for exactly these coordinates
+    are then answered from memory, with fetched_at and age_seconds showing how fresh the data is.
+    Alerts refresh every few minutes, current conditions every ten minutes and forecasts hourly.
+    The watchlist is saved locally and survives restarts.
+    
+    Args:
+        name: Name of the location, e.g. "north-field"; adding an existing name replaces it
+        latitude: Latitude in decimal degrees (-90 to 90)
+        longitude: Longitude in decimal degrees (-180 to 180)
+        products: Any of "current", "alerts" and "forecast" (default all three)
+        days: Forecast days served from the watchlist (must match weather_forecast's days)
+    """
+    from watchlist import weather_watchlist
+    try:
+        location = weather_watchlist.add(name, latitude, longitude, products, days)
+        return {"data": location, "scheduler_running": weather_watchlist.running}
+    except Exception as e:
+        return {"error": str(e), "name": name}
+
+
+@tool("watchlist_remove")
+async def watchlist_remove(name: str) -> Dict[str, Any]:
+    """
+    Stop watching a location. Removing a name that is not watched is not an error.
+    
+    Args:
+        name: Name the location was added with
+    """
+    from watchlist import weather_watchlist
+    location = weather_watchlist.remove(name)
+    return {"name": name, "removed": location is not None, "data": location}
+
+
+@tool("watchlist_list")
+async def watchlist_list() -> Dict[str, Any]:
+    """List watched locations with the age and next refresh of each prefetched product."""
+    from watchlist import PRODUCTS, weather_watchlist
+    locations = weather_watchlist.describe()
+    return {
+        "count": len(locations),
+        "products": list(PRODUCTS),
+        "intervals_seconds": weather_watchlist.intervals,
+        "data": locations,
+    }
+
+
 # Plant Variety Tools
-@mcp.tool("plant_variety_search")
+@tool("plant_variety_search")
 async def plant_variety_search(variety_name: str, pedigree_depth: int = 5) -> Dict[str, Any]:
     """
     Search for plant varieties and get pedigree information.
@@ -122,8 +462,9 @@ async def plant_variety_search(variety_name: str, pedigree_depth: int = 5) -> Di
         variety_name: Name of the plant variety to search for
         pedigree_depth: Depth of pedigree information to retrieve (1-10, default 5)
     """
+    from endpoints import plant
     try:
-        result = await plant.search_variety(client, variety_name, pedigree_depth)
+        result = await plant.search_variety(get_client(), variety_name, pedigree_depth)
         return {
             "variety": variety_name,
             "pedigree_depth": pedigree_depth,
@@ -133,17 +474,25 @@ async def plant_variety_search(variety_name: str, pedigree_depth: int = 5) -> Di
         return {"error": str(e), "variety": variety_name}
 
 
-@mcp.tool("coefficient_parentage")
+@tool("coefficient_parentage")
 async def coefficient_parentage(variety_names: List[str], max_depth: int = 10) -> Dict[str, Any]:
     """
     Calculate coefficient of parentage matrix for plant varieties.
     
+    Varieties already returned by plant_variety_search with pedigree_depth of at
+    least max_depth are computed locally from their pedigrees, so names may also
+    be hypothetical crosses of them in Purdy notation (e.g. "VARIETY A/VARIETY B").
+    Other varieties are computed upstream;
+    pairs computed by earlier calls are reused, so extending a panel only sends
+    the varieties involved in new pairs.
+    
     Args:
         variety_names: List of variety names to analyze (minimum 2)
         max_depth: Maximum depth for parentage calculation (1-20, default 10)
     """
+    from endpoints import plant
     try:
-        result = await plant.calculate_cop_matrix(client, variety_names, max_depth)
+        result = await plant.cop_matrix(get_client(), variety_names, max_depth)
         return {
             "varieties": variety_names,
             "max_depth": max_depth,
@@ -154,17 +503,18 @@ async def coefficient_parentage(variety_names: List[str], max_depth: int = 10) -
 
 
 # Dataset Listing Tools
-@mcp.tool("climate_datasets")
+@tool("climate_datasets")
 async def climate_datasets() -> Dict[str, Any]:
     """List available climate datasets."""
+    from endpoints import datasets
     try:
-        result = await datasets.list_climate(client)
+        result = await datasets.list_climate(get_client())
         return {"data": result}
     except Exception as e:
         return {"error": str(e)}
 
 
-@mcp.tool("grid_info")
+@tool("grid_info")
 async def grid_info(grid_id: Optional[int] = None) -> Dict[str, Any]:
     """
     Get information about GEMS grid system resolutions.
@@ -172,91 +522,160 @@ async def grid_info(grid_id: Optional[int] = None) -> Dict[str, Any]:
     Args:
         grid_id: Specific grid ID to get details for (0-6). If not provided, returns all grids.
     """
+    from endpoints import datasets
     try:
-        result = await datasets.get_grid_info(client, grid_id)
+        result = await datasets.get_grid_info(get_client(), grid_id)
         return {"grid_id": grid_id, "data": result} if grid_id else {"data": result}
     except Exception as e:
         return {"error": str(e)}
 
 
-@mcp.tool("soil_datasets")
+@tool("soil_datasets")
 async def soil_datasets() -> Dict[str, Any]:
     """List available soil datasets and properties."""
+    from endpoints import datasets
     try:
-        result = await datasets.list_soil(client)
+        result = await datasets.list_soil(get_client())
         return {"data": result}
     except Exception as e:
         return {"error": str(e)}
 
 
-@mcp.tool("landcover_datasets")
+@tool("landcover_datasets")
 async def landcover_datasets() -> Dict[str, Any]:
     """List available land cover datasets (LCMAP, NLCD, CDL)."""
+    from endpoints import datasets
     try:
-        result = await datasets.list_landcover(client)
+        result = await datasets.list_landcover(get_client())
         return {"data": result}
     except Exception as e:
         return {"error": str(e)}
 
 
-@mcp.tool("elevation_datasets")
+@tool("elevation_datasets")
 async def elevation_datasets() -> Dict[str, Any]:
     """List available elevation datasets (DEM, LIDAR, SRTM)."""
+    from endpoints import datasets
     try:
-        result = await datasets.list_elevation(client)
+        result = await datasets.list_elevation(get_client())
         return {"data": result}
     except Exception as e:
         return {"error": str(e)}
 
 
-@mcp.tool("crop_datasets")
+@tool("crop_datasets")
 async def crop_datasets() -> Dict[str, Any]:
     """List available crop calendar datasets."""
+    from endpoints import datasets
     try:
-        result = await datasets.list_crop(client)
+        result = await datasets.list_crop(get_client())
         return {"data": result}
     except Exception as e:
         return {"error": str(e)}
 
 
-@mcp.tool("hydro_datasets")
+@tool("hydro_datasets")
 async def hydro_datasets() -> Dict[str, Any]:
     """List available water quality and hydrological datasets."""
+    from endpoints import datasets
     try:
-        result = await datasets.list_hydro(client)
+        result = await datasets.list_hydro(get_client())
         return {"data": result}
     except Exception as e:
         return {"error": str(e)}
 
 
-@mcp.tool("market_datasets")
+@tool("market_datasets")
 async def market_datasets() -> Dict[str, Any]:
     """List available market accessibility datasets."""
+    from endpoints import datasets
     try:
-        result = await datasets.list_market(client)
+        result = await datasets.list_market(get_client())
         return {"data": result}
     except Exception as e:
         return {"error": str(e)}
 
 
-@mcp.tool("biotic_risk_datasets")
+@tool("biotic_risk_datasets")
 async def biotic_risk_datasets() -> Dict[str, Any]:
     """List available biotic risk datasets for agricultural pests/pathogens."""
+    from endpoints import datasets
     try:
-        result = await datasets.list_biotic_risk(client)
+        result = await datasets.list_biotic_risk(get_client())
         return {"data": result}
     except Exception as e:
         return {"error": str(e)}
 
 
+@tool("catalog_search")
+async def catalog_search(
+    query: str = "",
+    api_type: Optional[str] = None,
+    grid_level: Optional[int] = None,
+    start: Optional[str] = None,
+    end: Optional[str] = None,
+    discrete: Optional[bool] = None,
+    limit: int = 20
+) -> Dict[str, Any]:
+    """
+    Search the datasets and layers of every GEMS API at once, e.g. "soil organic carbon 100m".
+    
+    Answered from an in-memory catalog that is loaded once and refreshed in the background.
+    Each result names the api_type, dataset and layer_id to pass to the spatial tools, with
+    units, grid levels, time coverage and object count.
+    
+    Args:
+        query: Keywords matched against layer, dataset and unit names and descriptions
+            (prefixes match; resolutions such as "1km" or "100 m" match grid levels)
+        api_type: Only this API (soil, landcover, climate, elevation, crop, hydro, market, biotic-risk)
+        grid_level: Only layers with objects at this GEMS grid level (0-6)
+        start: Only layers with data on or after this date (ISO 8601)
+        end: Only layers with data on or before this date (ISO 8601)
+        discrete: True for classified layers (e.g. land cover), False for continuous values
+        limit: Maximum number of results (default 20)
+    """
+    from endpoints import datasets
+    try:
+        result = await datasets.search_catalog(
+            get_client(), query, limit,
+            api_type=api_type, grid_level=grid_level, start=start, end=end, discrete=discrete
+        )
+        return {"query": query, "count": len(result["data"]), **result}
+    except Exception as e:
+        return {"error": str(e), "query": query}
+
+
+@tool("dataset_layers")
+async def dataset_layers(api_type: str, dataset_name: str, layer_id: Optional[int] = None) -> Dict[str, Any]:
+    """
+    List the layers of a dataset, or get one layer.
+    
+    Args:
+        api_type: API of the dataset (soil, landcover, climate, elevation, crop, hydro, market, biotic-risk)
+        dataset_name: Dataset keyname
+        layer_id: Specific layer to get. If not provided, returns all layers.
+    """
+    from endpoints import datasets
+    try:
+        if layer_id is not None:
+            result = await datasets.get_layer(get_client(), api_type, dataset_name, layer_id)
+        else:
+            result = await datasets.list_layers(get_client(), api_type, dataset_name)
+        return {"api_type": api_type, "dataset": dataset_name, "data": result}
+    except Exception as e:
+        return {"error": str(e), "api_type": api_type, "dataset": dataset_name}
+
+
 # Spatial Data Tools
-@mcp.tool("spatial_data_search")
+@tool("spatial_data_search")
 async def spatial_data_search(
     api_type: str,
     dataset_name: str,
     bbox: Optional[str] = None,
     grid_level: Optional[int] = None,
-    limit: int = 100
+    limit: int = 100,
+    offset: int = 0,
+    max_results: Optional[int] = None
 ) -> Dict[str, Any]:
     """
     Search for spatial data objects in soil, landcover, climate, or biotic risk datasets.
@@ -267,16 +686,25 @@ async def spatial_data_search(
         bbox: Bounding box filter in format 'minx,miny,maxx,maxy'
         grid_level: GEMS grid resolution level (0-6)
         limit: Maximum number of results to return (1-300, default 100)
+        offset: Number of results to skip, for manual paging (default 0)
+        max_results: Fetch pages automatically until this many results (or all results) are
+            collected. Overrides limit and offset when set.
     """
+    from endpoints import spatial
     try:
-        result = await spatial.search_data(client, api_type, dataset_name, bbox, grid_level, limit)
+        if max_results is not None:
+            result = await spatial.search_all(get_client(), api_type, dataset_name, bbox, grid_level, max_results)
+        else:
+            result = await spatial.search_data(get_client(), api_type, dataset_name, bbox, grid_level, limit, offset)
         return {
             "api_type": api_type,
             "dataset": dataset_name,
             "parameters": {
                 "bbox": bbox,
                 "grid_level": grid_level,
-                "limit": limit
+                "limit": limit,
+                "offset": offset,
+                "max_results": max_results
             },
             "data": result
         }
@@ -284,7 +712,7 @@ async def spatial_data_search(
         return {"error": str(e), "api_type": api_type, "dataset": dataset_name}
 
 
-@mcp.tool("spatial_point_data")
+@tool("spatial_point_data")
 async def spatial_point_data(
     api_type: str,
     dataset_name: str,
@@ -302,8 +730,9 @@ async def spatial_point_data(
         latitude: Latitude in decimal degrees (-90 to 90)
         longitude: Longitude in decimal degrees (-180 to 180)
     """
+    from endpoints import spatial
     try:
-        result = await spatial.get_point_data(client, api_type, dataset_name, object_id, latitude, longitude)
+        result = await spatial.get_point_data(get_client(), api_type, dataset_name, object_id, latitude, longitude)
         return {
             "api_type": api_type,
             "dataset": dataset_name,
@@ -320,6 +749,508 @@ async def spatial_point_data(
         }
 
 
+@tool("spatial_point_sample")
+async def spatial_point_sample(
+    api_type: str,
+    dataset_name: str,
+    object_id: int,
+    points: List[List[float]],
+    interpolation: str = "nearest"
+) -> Dict[str, Any]:
+    """
+    Get values from one spatial data object at many locations.
+    
+    Use this instead of repeated spatial_point_data calls. The covering raster is
+    downloaded once and sampled locally; points outside it fall back to point requests.
+    
+    Args:
+        api_type: Type of dataset API (soil, landcover, climate, biotic-risk, elevation, crop, hydro, market)
+        dataset_name: Name of the dataset
+        object_id: Object ID from dataset search
+        points: List of [latitude, longitude] pairs in decimal degrees
+        interpolation: 'nearest' (default) or 'bilinear' (continuous layers only)
+    """
+    from endpoints import spatial
+    try:
+        result = await spatial.sample_points(
+            get_client(), api_type, dataset_name, object_id, [(p[0], p[1]) for p in points], interpolation
+        )
+        return {
+            "api_type": api_type,
+            "dataset": dataset_name,
+            "object_id": object_id,
+            "interpolation": interpolation,
+            "count": len(result),
+            "data": result
+        }
+    except Exception as e:
+        return {"error": str(e), "api_type": api_type, "dataset": dataset_name, "object_id": object_id}
+
+
+@tool("spatial_point_lookup")
+async def spatial_point_lookup(
+    api_type: str,
+    dataset_name: str,
+    points: List[List[float]],
+    layer_id: Optional[int] = None,
+    grid_level: Optional[int] = None,
+    time: Optional[str] = None,
+    interpolation: str = "nearest"
+) -> Dict[str, Any]:
+    """
+    Get values at many locations without searching for object IDs first.
+    
+    The object covering each point is found in a local index of object envelopes,
+    built from the dataset's search results on first use. When several objects
+    cover a point, the finest grid and then the latest time range wins, unless
+    grid_level or time narrows the choice.
+    
+    Args:
+        api_type: Type of dataset API (soil, landcover, climate, biotic-risk, elevation, crop, hydro, market)
+        dataset_name: Name of the dataset
+        points: List of [latitude, longitude] pairs in decimal degrees
+        layer_id: Only consider objects of this layer
+        grid_level: Only consider objects on this GEMS grid level (0-6)
+        time: ISO date or datetime the object's time range must contain
+        interpolation: 'nearest' (default) or 'bilinear' (continuous layers only)
+    """
+    from endpoints import spatial
+    try:
+        result = await spatial.lookup_points(
+            get_client(), api_type, dataset_name, [(p[0], p[1]) for p in points],
+            layer_id, grid_level, time, interpolation
+        )
+        return {
+            "api_type": api_type,
+            "dataset": dataset_name,
+            "parameters": {"layer_id": layer_id, "grid_level": grid_level, "time": time},
+            "count": len(result),
+            "data": result
+        }
+    except Exception as e:
+        return {"error": str(e), "api_type": api_type, "dataset": dataset_name}
+
+
+@tool("spatial_point_table")
+async def spatial_point_table(sites: List[List[float]], layers: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """
+    Get point values for many sites across several datasets in one call.
+    
+    Returns a table with one row per site and one column per layer. Failed cells are
+    None in `values` and described in `errors`; they do not fail the whole call.
+    
+    Args:
+        sites: List of [latitude, longitude] pairs in decimal degrees
+        layers: List of layers, each {"api_type": ..., "dataset": ..., "object_id": ...}
+            with an optional "name" used as the column header
+    """
+    from endpoints import spatial
+    try:
+        for layer in layers:
+            missing = [k for k in ("api_type", "dataset", "object_id") if k not in layer]
+            if missing:
+                raise ValueError(f"Layer {layer} is missing {', '.join(missing)}")
+        result = await spatial.extract_points(get_client(), [(s[0], s[1]) for s in sites], layers)
+        return {"data": result}
+    except Exception as e:
+        return {"error": str(e)}
+
+
+@tool("spatial_raster")
+async def spatial_raster(
+    api_type: str,
+    dataset_name: str,
+    object_id: int,
+    bbox: Optional[str] = None,
+    geometry: Optional[Dict[str, Any]] = None,
+    compress: str = "LZW"
+) -> Dict[str, Any]:
+    """
+    Download raster data (GeoTIFF) for a spatial data object to a local file.
+    
+    The file is streamed to disk and reused for repeated requests; the response
+    gives its path rather than the raster contents.
+    
+    Args:
+        api_type: Type of dataset API (soil, landcover, climate, biotic-risk, elevation, crop, hydro, market)
+        dataset_name: Name of the dataset
+        object_id: Object ID from dataset search
+        bbox: Optional bounding box clip in format 'minx,miny,maxx,maxy'
+        geometry: Optional GeoJSON Polygon/MultiPolygon to clip to (takes precedence over bbox)
+        compress: GeoTIFF compression (DEFLATE9, LZW, NONE; default LZW)
+    """
+    from endpoints import spatial
+    try:
+        result = await spatial.get_raster(get_client(), api_type, dataset_name, object_id, bbox, geometry, compress)
+        return {
+            "api_type": api_type,
+            "dataset": dataset_name,
+            "object_id": object_id,
+            "parameters": {"bbox": bbox, "compress": compress},
+            "data": result
+        }
+    except Exception as e:
+        return {"error": str(e), "api_type": api_type, "dataset": dataset_name, "object_id": object_id}
+
+
+async def _spatial_aggregate(
+    kind: str,
+    api_type: str,
+    dataset_name: str,
+    object_id: int,
+    bbox: Optional[str],
+    geometry: Optional[Dict[str, Any]],
+    tiled: bool,
+    **options: Any
+) -> Dict[str, Any]:
+    """Run one aggregate route directly or in tiled mode and wrap the result."""
+    from endpoints import spatial
+    try:
+        if tiled and geometry is None:
+            if not bbox:
+                raise ValueError("Tiled mode requires a bbox")
+            result = await spatial.aggregate_tiled(
+                get_client(), api_type, dataset_name, object_id, kind, bbox,
+                nbin=options.get("nbin") or 10, quantiles=options.get("quantiles")
+            )
+        else:
+            result = await spatial.get_aggregate(
+                get_client(), api_type, dataset_name, object_id, kind, bbox, geometry, **options
+            )
+        return {
+            "api_type": api_type,
+            "dataset": dataset_name,
+            "object_id": object_id,
+            "parameters": {"bbox": bbox, "tiled": tiled, **options},
+            "data": result
+        }
+    except Exception as e:
+        return {"error": str(e), "api_type": api_type, "dataset": dataset_name, "object_id": object_id}
+
+
+@tool("spatial_stats")
+async def spatial_stats(
+    api_type: str,
+    dataset_name: str,
+    object_id: int,
+    bbox: Optional[str] = None,
+    geometry: Optional[Dict[str, Any]] = None,
+    tiled: bool = False
+) -> Dict[str, Any]:
+    """
+    Get count, sum, mean, standard deviation, min and max of a spatial data object over an area.
+    
+    Use this instead of sampling many points and summarizing them. Tiled results are exact.
+    
+    Args:
+        api_type: Type of dataset API (soil, landcover, climate, biotic-risk, elevation, crop, hydro, market)
+        dataset_name: Name of the dataset
+        object_id: Object ID from dataset search
+        bbox: Bounding box in format 'minx,miny,maxx,maxy' (required unless geometry is given)
+        geometry: Optional GeoJSON Polygon/MultiPolygon to aggregate over (takes precedence over bbox)
+        tiled: Split a large bbox into tiles queried in parallel and merge the results
+    """
+    return await _spatial_aggregate("stats", api_type, dataset_name, object_id, bbox, geometry, tiled)
+
+
+@tool("spatial_histogram")
+async def spatial_histogram(
+    api_type: str,
+    dataset_name: str,
+    object_id: int,
+    bbox: Optional[str] = None,
+    geometry: Optional[Dict[str, Any]] = None,
+    nbin: Optional[int] = None,
+    tiled: bool = False
+) -> Dict[str, Any]:
+    """
+    Get a histogram of a spatial data object's values over an area.
+    
+    Tiled histograms of discrete layers are binned from merged value counts and
+    are exact. For continuous layers (e.g. elevation) they are built from merged
+    tile quantiles instead, with a rank error of at most 1% ("exact": false).
+    
+    Args:
+        api_type: Type of dataset API (soil, landcover, climate, biotic-risk, elevation, crop, hydro, market)
+        dataset_name: Name of the dataset
+        object_id: Object ID from dataset search
+        bbox: Bounding box in format 'minx,miny,maxx,maxy' (required unless geometry is given)
+        geometry: Optional GeoJSON Polygon/MultiPolygon to aggregate over (takes precedence over bbox)
+        tiled: Split a large bbox into tiles queried in parallel and merge the results
+        nbin: Number of bins (tiled mode defaults to 10)
+    """
+    return await _spatial_aggregate(
+        "histogram", api_type, dataset_name, object_id, bbox, geometry, tiled, nbin=nbin
+    )
+
+
+@tool("spatial_quantiles")
+async def spatial_quantiles(
+    api_type: str,
+    dataset_name: str,
+    object_id: int,
+    bbox: Optional[str] = None,
+    geometry: Optional[Dict[str, Any]] = None,
+    quantiles: Optional[List[float]] = None,
+    tiled: bool = False
+) -> Dict[str, Any]:
+    """
+    Get quantiles of a spatial data object's values over an area.
+    
+    Tiled quantiles are approximate: each tile's quantiles are merged, with a rank
+    error of at most 1%. The result reports "exact": false in that case.
+    
+    Args:
+        api_type: Type of dataset API (soil, landcover, climate, biotic-risk, elevation, crop, hydro, market)
+        dataset_name: Name of the dataset
+        object_id: Object ID from dataset search
+        bbox: Bounding box in format 'minx,miny,maxx,maxy' (required unless geometry is given)
+        geometry: Optional GeoJSON Polygon/MultiPolygon to aggregate over (takes precedence over bbox)
+        tiled: Split a large bbox into tiles queried in parallel and merge the results
+        quantiles: Probabilities between 0 and 1 (tiled mode defaults to quartiles)
+    """
+    return await _spatial_aggregate(
+        "quantiles", api_type, dataset_name, object_id, bbox, geometry, tiled, quantiles=quantiles
+    )
+
+
+@tool("spatial_value_counts")
+async def spatial_value_counts(
+    api_type: str,
+    dataset_name: str,
+    object_id: int,
+    bbox: Optional[str] = None,
+    geometry: Optional[Dict[str, Any]] = None,
+    tiled: bool = False
+) -> Dict[str, Any]:
+    """
+    Get the pixel count of each distinct value of a spatial data object over an area.
+    
+    Useful for categorical layers such as land cover classes. Tiled results are exact.
+    On continuous layers (e.g. elevation) every distinct value is its own entry, so
+    the response, and the memory used to merge tiles, grows with the area; use
+    spatial_histogram or spatial_quantiles there instead.
+    
+    Args:
+        api_type: Type of dataset API (soil, landcover, climate, biotic-risk, elevation, crop, hydro, market)
+        dataset_name: Name of the dataset
+        object_id: Object ID from dataset search
+        bbox: Bounding box in format 'minx,miny,maxx,maxy' (required unless geometry is given)
+        geometry: Optional GeoJSON Polygon/MultiPolygon to aggregate over (takes precedence over bbox)
+        tiled: Split a large bbox into tiles queried in parallel and merge the results
+    """
+    return await _spatial_aggregate("valuecount", api_type, dataset_name, object_id, bbox, geometry, tiled)
+
+
+# Hydro Tools
+@tool("hydro_catchment_at_point")
+async def hydro_catchment_at_point(latitude: float, longitude: float, mndnr_level: int = 9) -> Dict[str, Any]:
+    """
+    Find the Minnesota watershed catchment containing a point.
+    
+    Args:
+        latitude: Latitude in decimal degrees
+        longitude: Longitude in decimal degrees
+        mndnr_level: Minnesota DNR HUC level (1, 2, 4, 7, 8 or 9; default 9, the finest catchments)
+    """
+    from endpoints import hydro
+    try:
+        result = await hydro.search_point(get_client(), latitude, longitude, mndnr_level)
+        return {"location": {"latitude": latitude, "longitude": longitude}, "mndnr_level": mndnr_level, "data": result}
+    except Exception as e:
+        return {"error": str(e), "location": {"latitude": latitude, "longitude": longitude}}
+
+
+@tool("hydro_catchment")
+async def hydro_catchment(catchment_id: str) -> Dict[str, Any]:
+    """
+    Get a level-9 catchment, including its downstream catchment (down_cat) and drainage area.
+    
+    Args:
+        catchment_id: Catchment ID from hydro_catchment_at_point or hydro_lake_catchment
+    """
+    from endpoints import hydro
+    try:
+        result = await hydro.get_catchment(get_client(), catchment_id)
+        return {"catchment_id": catchment_id, "data": result}
+    except Exception as e:
+        return {"error": str(e), "catchment_id": catchment_id}
+
+
+@tool("hydro_lake_catchment")
+async def hydro_lake_catchment(lake_id: str) -> Dict[str, Any]:
+    """
+    Get the level-9 catchment that a Minnesota lake drains into.
+    
+    Args:
+        lake_id: Minnesota lake ID
+    """
+    from endpoints import hydro
+    try:
+        result = await hydro.get_lake_catchment(get_client(), lake_id)
+        return {"lake_id": lake_id, "data": result}
+    except Exception as e:
+        return {"error": str(e), "lake_id": lake_id}
+
+
+@tool("hydro_catchment_network")
+async def hydro_catchment_network(
+    catchment_id: str,
+    direction: str = "upstream",
+    limit: Optional[int] = None
+) -> Dict[str, Any]:
+    """
+    Get the catchments upstream or downstream of a catchment.
+    
+    Once a network has been fetched, traversals from any catchment in it are answered
+    locally; "source" in the result says which happened. Upstream catchments are listed
+    nearest first, downstream catchments in flow order.
+    
+    Args:
+        catchment_id: Level-9 catchment ID
+        direction: "upstream" or "downstream"
+        limit: Optional maximum number of catchments to return ("count" gives the total)
+    """
+    from endpoints import hydro
+    try:
+        result = await hydro.get_network(get_client(), catchment_id, direction, limit)
+        return {"catchment_id": catchment_id, "direction": direction, "data": result}
+    except Exception as e:
+        return {"error": str(e), "catchment_id": catchment_id, "direction": direction}
+
+
+@tool("hydro_catchment_geometry")
+async def hydro_catchment_geometry(
+    catchment_id: str,
+    network: Optional[str] = None,
+    union: bool = False
+) -> Dict[str, Any]:
+    """
+    Get GeoJSON geometry for a catchment or its upstream/downstream network.
+    
+    Args:
+        catchment_id: Level-9 catchment ID
+        network: Optional "upstream" or "downstream" to get the whole network's geometry
+        union: Merge the network into a single Polygon/MultiPolygon instead of one feature per catchment
+    """
+    from endpoints import hydro
+    try:
+        if network:
+            result = await hydro.get_network_geometry(get_client(), catchment_id, network, union)
+        else:
+            result = await hydro.get_geometry(get_client(), catchment_id)
+        return {"catchment_id": catchment_id, "network": network, "data": result}
+    except Exception as e:
+        return {"error": str(e), "catchment_id": catchment_id}
+
+
+# Server Tools
+@tool("cache_stats")
+async def cache_stats() -> Dict[str, Any]:
+    """Get hit/miss counters and sizes of the response cache and the other local caches, stores and indexes."""
+    from cache import response_cache
+    from singleflight import request_coalescer
+    from rasters import raster_store
+    from sampling import tile_cache
+    from snapping import cell_snapper
+    from envelopes import envelope_store
+    from catalog import catalog_store
+    from watchlist import weather_watchlist
+    from copstore import cop_store
+    from history import history_store
+    from pedigree import pedigree_graph
+    from catchments import catchment_graph
+    return {
+        "data": {
+            "cache": response_cache.stats(),
+            "coalescing": request_coalescer.stats(),
+            "rasters": raster_store.stats(),
+            "sampling": tile_cache.stats(),
+            "snapping": cell_snapper.stats(),
+            "envelopes": envelope_store.stats(),
+            "catalog": catalog_store.stats(),
+            "watchlist": weather_watchlist.stats(),
+            "history": history_store.stats(),
+            "cop_pairs": cop_store.stats(),
+            "pedigree_graph": pedigree_graph.stats(),
+            "catchments": catchment_graph.stats()
+        }
+    }
+
+
+@tool("upstream_status")
+async def upstream_status() -> Dict[str, Any]:
+    """Get retry counters, circuit breaker states and rate-limit queues for the upstream GEMS Exchange APIs."""
+    from resilience import upstream_guard
+    from ratelimit import rate_limiter
+    return {"data": {**upstream_guard.stats(), "rate_limits": rate_limiter.stats()}}
+
+
+@tool("server_metrics")
+async def server_metrics(format: str = "json") -> Dict[str, Any]:
+    """
+    Get latency, error, byte count and JSON decode/encode metrics for every tool and upstream API.
+    
+    Tool errors are counted by class (4xx, 5xx, timeout, transport, circuit_open, local).
+    
+    Args:
+        format: "json" for a summary with p50/p90/p99 latencies in milliseconds, or
+            "openmetrics" for Prometheus/OpenMetrics text with full histograms
+    """
+    from cache import response_cache
+    from singleflight import request_coalescer
+    from resilience import upstream_guard
+    if format == "openmetrics":
+        return {"data": metrics.openmetrics(metric_gauges())}
+    if format != "json":
+        return {"error": f"Unknown format '{format}', expected json or openmetrics"}
+    return {
+        "data": {
+            **metrics.snapshot(),
+            "cache": response_cache.stats(),
+            "coalescing": request_coalescer.stats(),
+            "retries": upstream_guard.stats(),
+            "json": jsoncodec.stats(),
+            "pool": {
+                "max_connections": Config.MAX_CONNECTIONS,
+                "max_keepalive_connections": Config.MAX_KEEPALIVE_CONNECTIONS,
+                "keepalive_expiry": Config.KEEPALIVE_EXPIRY,
+            },
+            # Metrics are per process; with several HTTP workers each call reports one of them
+            "worker": {"pid": os.getpid(), "transport": Config.TRANSPORT, "workers": Config.WORKERS},
+        }
+    }
+
+
+def main() -> None:
+    """
+    Validate the configuration and serve MCP over stdio, or over HTTP with
+    GEMS_WORKERS processes sharing one port.
+
+    On SIGTERM or SIGINT, HTTP workers stop accepting connections and let
+    requests in flight finish for up to GEMS_DRAIN_TIMEOUT seconds before the
+    background tasks are stopped and the client is closed.
+    """
+    Config.validate()
+    if Config.TRANSPORT == "stdio":
+        mcp.run(transport="stdio")
+        return
+    import uvicorn
+    options = {
+        "host": Config.HTTP_HOST,
+        "port": Config.HTTP_PORT,
+        "timeout_graceful_shutdown": Config.DRAIN_TIMEOUT,
+    }
+    if Config.WORKERS > 1:
+        # Each worker process imports this module and builds its own app
+        uvicorn.run(
+            "server:http_app", factory=True, workers=Config.WORKERS,
+            app_dir=os.path.dirname(os.path.abspath(__file__)), **options
+        )
+    else:
+        uvicorn.run(http_app(), **options)
+
+
 # Main execution
 if __name__ == "__main__":
-    mcp.run(transport="stdio")
\ No newline at end of file
+    main()
@@ -0,0 +1,287 @@
+"""
+Output shaping for tool results: field projection, columnar layout and series reduction
+
+Every tool accepts the same optional arguments:
+
+- fields: JSONPath-like paths to keep, e.g. ["data.data.temp", "data.data.datetime"].
+  Paths start at the tool result ("$." is optional). Arrays are traversed
+  implicitly (a trailing [*] is allowed), and * matches every key at one level.
+- format: "json" (default) or "columnar", which turns every array of records in
+  `data` into {"count": n, "columns": {field: [values...]}}.
+- max_points: numeric arrays in `data` longer than this are reduced to that many
+  bucket means; arrays of records get one record per bucket, with numeric
+  fields averaged.
+- summarize: numeric arrays in `data` are replaced by count/min/max/mean/first/last.
+
+Results are reshaped in one pass over the decoded response. Containers are rebuilt
+only along the selected paths, and untouched values are shared, not copied.
+"""
+import functools
+import inspect
+import math
+from typing import Annotated, Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+from pydantic import Field
+
+FORMATS = ("json", "columnar")
+
+# Keys whose numeric arrays are geometry, not series
+_GEOMETRY_KEYS = frozenset({"coordinates", "bbox"})
+
+# A shorter path already selects everything below it
+_ALL: Dict[str, Any] = {}
+_MISSING = object()
+
+SHAPE_PARAMETERS = (
+    inspect.Parameter(
+        "fields", inspect.Parameter.KEYWORD_ONLY, default=None,
+        annotation=Annotated[Optional[List[str]], Field(
+            description="Only return these paths of the result, e.g. ['data.data.temp']; arrays are traversed implicitly and * matches any key"
+        )],
+    ),
+    inspect.Parameter(
+        "format", inspect.Parameter.KEYWORD_ONLY, default="json",
+        annotation=Annotated[str, Field(
+            description="'json' (default) or 'columnar' to return arrays of records as column arrays"
+        )],
+    ),
+    inspect.Parameter(
+        "max_points", inspect.Parameter.KEYWORD_ONLY, default=None,
+        annotation=Annotated[Optional[int], Field(
+            description="Downsample longer arrays in data to this many points (bucket means)"
+        )],
+    ),
+    inspect.Parameter(
+        "summarize", inspect.Parameter.KEYWORD_ONLY, default=False,
+        annotation=Annotated[bool, Field(
+            description="Replace numeric series in data with count/min/max/mean/first/last"
+        )],
+    ),
+)
+
+
+def shaped(fn: Callable[..., Awaitable[Any]]) -> Callable[..., Awaitable[Any]]:
+    """Add the output shaping arguments to a tool coroutine."""
+    signature = inspect.signature(fn)
+    # A tool with its own format argument (server_metrics) keeps it
+    extra = [p for p in SHAPE_PARAMETERS if p.name not in signature.parameters]
+    names = {p.name for p in extra}
+
+    @functools.wraps(fn)
+    async def wrapper(*args: Any, **kwargs: Any) -> Any:
+        options = {name: kwargs.pop(name) for name in list(kwargs) if name in names}
+        result = await fn(*args, **kwargs)
+        if not isinstance(result, dict) or "error" in result:
+            return result
+        try:
+            return shape(result, **options)
+        except ValueError as e:
+            return {"error": str(e)}
+
+    wrapper.__signature__ = signature.replace(parameters=[*signature.parameters.values(), *extra])
+    return wrapper
+
+
+def shape(
+    result: Dict[str, Any],
+    fields: Optional[List[str]] = None,
+    format: str = "json",
+    max_points: Optional[int] = None,
+    summarize: bool = False
+) -> Dict[str, Any]:
+    """Apply projection, then layout, then series reduction to a tool result."""
+    if format not in FORMATS:
+        raise ValueError(f"Unknown format '{format}', expected one of {', '.join(FORMATS)}")
+    if max_points is not None and max_points < 1:
+        raise ValueError("max_points must be at least 1")
+    if fields:
+        result = project(result, parse_fields(fields))
+        if not isinstance(result, dict):
+            result = {}
+    if "data" not in result or (format == "json" and max_points is None and not summarize):
+        return result
+    data = result["data"]
+    if format == "columnar":
+        data = columnar(data)
+    if summarize or max_points is not None:
+        data = reduce_series(data, max_points, summarize)
+    return {**result, "data": data}
+
+
+def parse_fields(fields: List[str]) -> Dict[str, Any]:
+    """Build a trie of path tokens; an empty node selects the whole subtree."""
+    trie: Dict[str, Any] = {}
+    for path in fields:
+        path = path.strip()
+        if path.startswith("$"):
+            path = path[1:].lstrip(".")
+        tokens = []
+        for token in path.split("."):
+            if token.endswith("[*]"):
+                token = token[:-3]
+            elif token.endswith("[]"):
+                token = token[:-2]
+            if "[" in token or "]" in token:
+                raise ValueError(f"Unsupported field path '{path}': only [*] array steps are allowed")
+            if token:
+                tokens.append(token)
+        if not tokens:
+            return _ALL
+        node = trie
+        for i, token in enumerate(tokens):
+            child = node.get(token)
+            if child is _ALL:
+                break
+            if i == len(tokens) - 1:
+                node[token] = _ALL
+            else:
+                node = node.setdefault(token, {})
+    return trie
+
+
+def project(value: Any, trie: Dict[str, Any]) -> Any:
+    """Keep only the paths in trie, sharing every selected subtree."""
+    if trie is _ALL:
+        return value
+    if isinstance(value, list):
+        items = (project(item, trie) for item in value)
+        return [item for item in items if item is not _MISSING]
+    if not isinstance(value, dict):
+        return _MISSING
+    out: Dict[str, Any] = {}
+    wildcard = trie.get("*")
+    for key, item in value.items():
+        sub = trie.get(key, wildcard)
+        if sub is None:
+            continue
+        if wildcard is not None and sub is not wildcard and sub is not _ALL and wildcard is not _ALL:
+            # An explicit key under a wildcard level merges both selections
+            sub = {**wildcard, **sub}
+        projected = project(item, sub)
+        if projected is not _MISSING:
+            out[key] = projected
+    return out
+
+
+def _is_records(value: Any) -> bool:
+    return isinstance(value, list) and bool(value) and all(isinstance(item, dict) for item in value)
+
+
+def columnar(value: Any) -> Any:
+    """Turn every array of records into {"count": n, "columns": {field: [...]}}."""
+    if _is_records(value):
+        columns: Dict[str, List[Any]] = {}
+        for row, record in enumerate(value):
+            for key, item in record.items():
+                column = columns.get(key)
+                if column is None:
+                    # Rows before this field first appeared get None
+                    column = columns[key] = [None] * row
+                column.append(item)
+            for key, column in columns.items():
+                if len(column) == row:
+                    column.append(None)
+        return {"count": len(value), "columns": columns}
+    if isinstance(value, dict):
+        return {key: columnar(item) for key, item in value.items()}
+    if isinstance(value, list):
+        return [columnar(item) for item in value]
+    return value
+
+
+def _is_number(value: Any) -> bool:
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+
+def _is_series(value: Any) -> bool:
+    return (
+        isinstance(value, list)
+        and len(value) > 1
+        and all(item is None or _is_number(item) for item in value)
+        and any(item is not None for item in value)
+    )
+
+
+def reduce_series(value: Any, max_points: Optional[int], summarize: bool, key: str = "") -> Any:
+    """Summarize or downsample numeric series and arrays of records."""
+    if key in _GEOMETRY_KEYS:
+        return value
+    if _is_series(value):
+        if summarize:
+            return summary(value)
+        if max_points is not None and len(value) > max_points:
+            return [_mean(value[start:stop]) for start, stop in _buckets(len(value), max_points)]
+        return value
+    if _is_records(value) and (summarize or (max_points is not None and len(value) > max_points)):
+        if summarize:
+            return {"count": len(value), "fields": _summarize_records(value)}
+        return [_merge_records(value[start:stop]) for start, stop in _buckets(len(value), max_points)]
+    if isinstance(value, dict):
+        if "columns" in value and "count" in value and isinstance(value["columns"], dict):
+            return {**value, "columns": _reduce_columns(value["columns"], value["count"], max_points, summarize)}
+        return {k: reduce_series(item, max_points, summarize, k) for k, item in value.items()}
+    if isinstance(value, list):
+        return [reduce_series(item, max_points, summarize) for item in value]
+    return value
+
+
+def _reduce_columns(columns: Dict[str, List[Any]], count: int, max_points: Optional[int], summarize: bool) -> Dict[str, Any]:
+    if summarize:
+        return {key: summary(column) if _is_series(column) else _ends(column) for key, column in columns.items()}
+    if max_points is None or count <= max_points:
+        return columns
+    buckets = _buckets(count, max_points)
+    # Numeric columns are averaged; other columns keep each bucket's first value so rows stay aligned
+    return {
+        key: [_mean(column[a:b]) for a, b in buckets] if _is_series(column) else [column[a] for a, _ in buckets]
+        for key, column in columns.items()
+    }
+
+
+def _buckets(length: int, count: int) -> List[Tuple[int, int]]:
+    edges = [length * k // count for k in range(count + 1)]
+    return [(edges[k], edges[k + 1]) for k in range(count) if edges[k] < edges[k + 1]]
+
+
+def _mean(values: List[Any]) -> Optional[float]:
+    numbers = [v for v in values if v is not None]
+    return sum(numbers) / len(numbers) if numbers else None
+
+
+def summary(values: List[Any]) -> Dict[str, Any]:
+    """count/min/max/mean/first/last of a numeric series, ignoring None."""
+    numbers = [v for v in values if v is not None and not (isinstance(v, float) and math.isnan(v))]
+    return {
+        "count": len(numbers),
+        "min": min(numbers) if numbers else None,
+        "max": max(numbers) if numbers else None,
+        "mean": sum(numbers) / len(numbers) if numbers else None,
+        "first": values[0],
+        "last": values[-1],
+    }
+
+
+def _ends(values: List[Any]) -> Dict[str, Any]:
+    return {"count": len(values), "first": values[0] if values else None, "last": values[-1] if values else None}
+
+
+def _summarize_records(records: List[Dict[str, Any]]) -> Dict[str, Any]:
+    keys: Dict[str, None] = {}
+    for record in records:
+        keys.update(dict.fromkeys(record))
+    fields = {}
+    for key in keys:
+        column = [record.get(key) for record in records]
+        fields[key] = summary(column) if _is_series(column) else _ends(column)
+    return fields
+
+
+def _merge_records(records: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """One record for a bucket: numeric fields averaged, others from the first record."""
+    merged = dict(records[0])
+    for key, item in records[0].items():
+        if _is_number(item) or item is None:
+            column = [record.get(key) for record in records]
+            if all(v is None or _is_number(v) for v in column):
+                merged[key] = _mean(column)
+    return merged
@@ -0,0 +1,51 @@
+"""
+Request coalescing for identical in-flight upstream calls
+
+Concurrent callers that ask for the same request key share a single upstream
+call and receive the same decoded result (or the same exception).
+"""
+import asyncio
+from typing import Any, Awaitable, Callable, Dict
+
+
+class SingleFlight:
+    """Table of in-flight calls keyed by normalized request."""
+
+    def __init__(self):
+        self.executed = 0
+        self.deduplicated = 0
+        self._inflight: Dict[str, "asyncio.Future[Any]"] = {}
+
+    async def do(self, key: str, fn: Callable[[], Awaitable[Any]]) -> Any:
+        """Run fn for key, or wait on the call already running for it."""
+        task = self._inflight.get(key)
+        if task is None:
+            task = asyncio.ensure_future(fn())
+            self._inflight[key] = task
+            task.add_done_callback(lambda t: self._finish(key, t))
+            self.executed += 1
+        else:
+            self.deduplicated += 1
+        # Shield so one cancelled caller does not cancel the call for the others
+        return await asyncio.shield(task)
+
+    def _finish(self, key: str, task: "asyncio.Future[Any]") -> None:
+        if self._inflight.get(key) is task:
+            del self._inflight[key]
+        if not task.cancelled():
+            # Mark the exception as retrieved even if every waiter went away
+            task.exception()
+
+    def stats(self) -> Dict[str, Any]:
+        """Get counters for executed and deduplicated calls."""
+        total = self.executed + self.deduplicated
+        return {
+            "in_flight": len(self._inflight),
+            "executed": self.executed,
+            "deduplicated": self.deduplicated,
+            "dedup_rate": round(self.deduplicated / total, 4) if total else 0.0,
+        }
+
+
+# Shared coalescer used by all endpoint modules
+request_coalescer = SingleFlight()
@@ -0,0 +1,147 @@
+"""
+Grid cell snapping for point queries
+
+Point and weather values come from grid cells, so every location in a cell
+gets the same answer. Locations are snapped to the center of their cell before
+they reach the response cache and the request coalescer, so nearby points share
+one upstream lookup. Results are then fanned back out to the original points.
+
+Cell grids are built from /grid metadata (grid.CellGrid) and kept per data
+object, plus one for weather. Snapping needs NumPy; without it, or before a
+grid is known, points pass through unchanged.
+"""
+import asyncio
+import logging
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Hashable, List, Optional, Sequence, Tuple
+
+from config import Config
+import grid
+
+logger = logging.getLogger(__name__)
+
+# Snapped coordinates are rounded so equal cells always give equal cache keys (~0.1 m)
+SNAP_DECIMALS = 6
+
+
+class CellSnapper:
+    """Cell grids per data object and the snapping of points onto them."""
+
+    def __init__(self, enabled: bool = True, max_grids: int = 4096):
+        self.enabled = enabled
+        self.max_grids = max_grids
+        self.grids: "OrderedDict[Hashable, grid.CellGrid]" = OrderedDict()
+        self._pending: Dict[Hashable, "asyncio.Task[Optional[grid.CellGrid]]"] = {}
+        self.points = 0
+        self.cells = 0
+        self.outside = 0
+        self.load_failures = 0
+
+    @classmethod
+    def from_config(cls) -> "CellSnapper":
+        """Create a snapper using the settings in Config."""
+        return cls(Config.SNAP_POINTS, Config.SNAP_MAX_GRIDS)
+
+    def available(self) -> bool:
+        """True when snapping is enabled and NumPy is installed."""
+        if not self.enabled:
+            return False
+        try:
+            grid.require_numpy()
+        except RuntimeError:
+            return False
+        return True
+
+    async def resolve(self, key: Hashable, load: Callable[[], Awaitable[Dict[str, Any]]]) -> Optional[grid.CellGrid]:
+        """
+        Get the cell grid for key, loading its /grid metadata with load() on first use.
+
+        Every caller waits for the grid, so a location is snapped the same way from
+        its first query on; concurrent callers share one load.
+        """
+        if not self.available():
+            return None
+        cell_grid = self.grids.get(key)
+        if cell_grid is not None:
+            self.grids.move_to_end(key)
+            return cell_grid
+        task = self._pending.get(key)
+        if task is None:
+            task = self._pending[key] = asyncio.create_task(self._load(key, load))
+        return await asyncio.shield(task)
+
+    async def _load(self, key: Hashable, load: Callable[[], Awaitable[Dict[str, Any]]]) -> Optional[grid.CellGrid]:
+        try:
+            cell_grid = grid.CellGrid.from_details(await load())
+        except Exception as e:
+            # Not remembered, so the next query tries again
+            self.load_failures += 1
+            logger.info("Could not load the cell grid for %s: %s", key, e)
+            return None
+        finally:
+            self._pending.pop(key, None)
+        self.grids[key] = cell_grid
+        while len(self.grids) > self.max_grids:
+            self.grids.popitem(last=False)
+        return cell_grid
+
+    def snap(
+        self,
+        cell_grid: grid.CellGrid,
+        points: Sequence[Tuple[float, float]]
+    ) -> Tuple[List[Tuple[float, float]], List[int]]:
+        """
+        Snap (lat, lon) points to their cell centers.
+
+        Returns the distinct snapped points and, for each input point, the index of
+        its snapped point. Points outside the grid keep their own coordinates.
+        """
+        if not points:
+            return [], []
+        np = grid.np
+        lats = np.array([p[0] for p in points], dtype=np.float64)
+        lons = np.array([p[1] for p in points], dtype=np.float64)
+        ids = cell_grid.cell_ids(lons, lats)
+        inside = ids >= 0
+        cells, inverse = np.unique(ids[inside], return_inverse=True)
+        center_lons, center_lats = cell_grid.centers(cells)
+        lats[inside] = np.round(center_lats, SNAP_DECIMALS)[inverse]
+        lons[inside] = np.round(center_lons, SNAP_DECIMALS)[inverse]
+
+        distinct: Dict[Tuple[float, float], int] = {}
+        index = [distinct.setdefault(point, len(distinct)) for point in zip(lats.tolist(), lons.tolist())]
+        self.points += len(points)
+        self.cells += len(distinct)
+        self.outside += int(len(points) - inside.sum())
+        return list(distinct), index
+
+    def snap_point(self, cell_grid: grid.CellGrid, lat: float, lon: float) -> Tuple[float, float]:
+        """Snap one (lat, lon) point to its cell center."""
+        snapped, _ = self.snap(cell_grid, [(lat, lon)])
+        return snapped[0]
+
+    def stats(self) -> Dict[str, Any]:
+        """Get grid and snapping counters."""
+        return {
+            "enabled": self.enabled,
+            "available": self.available(),
+            "grids": len(self.grids),
+            "loading": len(self._pending),
+            "load_failures": self.load_failures,
+            "points": self.points,
+            "cells": self.cells,
+            "outside": self.outside,
+            # Points answered by a lookup already made for another point in the same batch and cell
+            "shared": self.points - self.cells,
+        }
+
+
+def distinct_points(points: Sequence[Tuple[float, float]]) -> Tuple[List[Tuple[float, float]], List[int]]:
+    """Deduplicate exact (lat, lon) points, in the same form as CellSnapper.snap."""
+    distinct: Dict[Tuple[float, float], int] = {}
+    index = [distinct.setdefault((float(lat), float(lon)), len(distinct)) for lat, lon in points]
+    return list(distinct), index
+
+
+# Shared snapper
+cell_snapper = CellSnapper.from_config()
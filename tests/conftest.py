@@ -0,0 +1,43 @@
+"""
+Shared setup for the unit tests
+
+The server modules are flat top-level modules and read Config at import time,
+so the repository root goes on sys.path and the environment is fixed before any
+of them is imported: no disk cache or watchlist file, no rate limit and no
+weather snapping grid.
+"""
+import os
+import sys
+from pathlib import Path
+
+import pytest
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+os.environ.update({
+    "GEMS_EXCHANGE_API_KEY": "test-key",
+    "GEMS_CACHE_DIR": "",
+    "GEMS_WATCHLIST_FILE": "",
+    "GEMS_RATE_LIMIT": "0",
+    "GEMS_RATE_LIMITS": "",
+    "GEMS_WEATHER_SNAP_GRID": "-1",
+})
+
+
+class Clock:
+    """A settable stand-in for time.time and time.monotonic."""
+
+    def __init__(self, now: float = 1_000_000.0):
+        self.now = now
+
+    def __call__(self) -> float:
+        return self.now
+
+    def advance(self, seconds: float) -> None:
+        self.now += seconds
+
+
+@pytest.fixture
+def clock() -> Clock:
+    return Clock()
@@ -0,0 +1,103 @@
+import math
+
+import pytest
+
+from aggregation import (
+    histogram_from_counts,
+    histogram_from_quantiles,
+    merge_quantiles,
+    merge_stats,
+    merge_value_counts,
+    parse_bbox,
+    quantile_probabilities,
+    split_bbox,
+)
+
+pytest.importorskip("numpy")
+
+# A 1-degree lon/lat grid anchored at (-180, 90)
+DEGREE_GRID = {"ul_x": -180.0, "ul_y": 90.0, "scale": 1.0, "srid": 4326}
+
+
+def test_parse_bbox_rejects_bad_input():
+    assert parse_bbox("1,2,3,4") == (1.0, 2.0, 3.0, 4.0)
+    with pytest.raises(ValueError):
+        parse_bbox("1,2,3")
+    with pytest.raises(ValueError):
+        parse_bbox("3,2,1,4")
+
+
+def test_split_bbox_keeps_small_areas_whole():
+    assert split_bbox("0,0,10,4", DEGREE_GRID, max_pixels=40) == ["0.00000000,0.00000000,10.00000000,4.00000000"]
+
+
+def test_split_bbox_tiles_every_pixel_exactly_once():
+    tiles = [parse_bbox(t) for t in split_bbox("0,0,10,4", DEGREE_GRID, max_pixels=10)]
+    assert len(tiles) == 6
+    # Outer edges keep the caller's bbox
+    assert min(t[0] for t in tiles) == 0.0 and max(t[2] for t in tiles) == 10.0
+    assert min(t[1] for t in tiles) == 0.0 and max(t[3] for t in tiles) == 4.0
+    for x in range(10):
+        for y in range(4):
+            cx, cy = x + 0.5, y + 0.5
+            assert sum(t[0] <= cx <= t[2] and t[1] <= cy <= t[3] for t in tiles) == 1
+    for minx, miny, maxx, maxy in tiles:
+        assert math.ceil(maxx - minx) * math.ceil(maxy - miny) <= 10
+
+
+def test_split_bbox_insets_inner_edges_off_pixel_boundaries():
+    for minx, _, maxx, _ in (parse_bbox(t) for t in split_bbox("0,0,10,1", DEGREE_GRID, max_pixels=5)):
+        for edge in (minx, maxx):
+            if edge not in (0.0, 10.0):
+                assert edge != round(edge)
+
+
+def test_merge_stats_pools_mean_and_stddev():
+    # Tiles [1, 3] and [5, 7, 9]
+    merged = merge_stats([
+        {"count": 2, "sum": 4.0, "mean": 2.0, "stddev": 1.0, "min": 1.0, "max": 3.0},
+        {"count": 3, "sum": 21.0, "mean": 7.0, "stddev": math.sqrt(8 / 3), "min": 5.0, "max": 9.0},
+        None,
+        {"count": 0},
+    ])
+    values = [1, 3, 5, 7, 9]
+    assert merged["count"] == 5
+    assert merged["mean"] == pytest.approx(5.0)
+    assert merged["stddev"] == pytest.approx(math.sqrt(sum((v - 5) ** 2 for v in values) / 5))
+    assert (merged["min"], merged["max"]) == (1.0, 9.0)
+    assert merge_stats([None, {"count": 0}]) is None
+
+
+def test_merge_value_counts_sums_and_sorts():
+    merged = merge_value_counts([
+        [{"value": 3, "count": 1}, {"value": 1, "count": 2}],
+        None,
+        [{"value": 1, "count": 5}],
+    ])
+    assert merged == [{"value": 1, "count": 7}, {"value": 3, "count": 1}]
+
+
+def test_histogram_from_counts():
+    bins = histogram_from_counts([{"value": 0, "count": 1}, {"value": 5, "count": 2}, {"value": 10, "count": 1}], 2)
+    assert [(b["min"], b["max"], b["count"]) for b in bins] == [(0, 5, 1), (5, 10, 3)]
+    assert sum(b["percent"] for b in bins) == pytest.approx(100.0)
+
+
+def uniform_quantiles(lo: float, hi: float):
+    return [{"quantile": p, "value": lo + p * (hi - lo)} for p in quantile_probabilities()]
+
+
+def test_merge_quantiles_weights_tiles_by_pixel_count():
+    # 100 pixels uniform on [0, 10] and 300 on [10, 20]: the median is at 13.33
+    parts = [(100, uniform_quantiles(0, 10)), (300, uniform_quantiles(10, 20)), (0, None)]
+    result = merge_quantiles(parts, [0.0, 0.25, 0.5, 1.0])
+    values = [r["value"] for r in result]
+    assert values == pytest.approx([0.0, 10.0, 10 + 10 / 3, 20.0], abs=1e-6)
+
+
+def test_histogram_from_quantiles_matches_uniform_tiles():
+    parts = [(100, uniform_quantiles(0, 10)), (300, uniform_quantiles(10, 20))]
+    bins = histogram_from_quantiles(parts, 4)
+    assert [b["count"] for b in bins] == [50, 50, 150, 150]
+    assert (bins[0]["min"], bins[-1]["max"]) == (0, 20)
+    assert histogram_from_quantiles([(0, None)], 4) == []
@@ -0,0 +1,80 @@
+import asyncio
+
+import httpx
+import pytest
+
+from cache import response_cache
+from endpoints.base import get_json
+from singleflight import request_coalescer
+
+
+class Upstream:
+    """Counts requests and answers every path with the same JSON body."""
+
+    def __init__(self):
+        self.requests = 0
+        self.status = 200
+
+    async def handle(self, request: httpx.Request) -> httpx.Response:
+        self.requests += 1
+        await asyncio.sleep(0.01)
+        return httpx.Response(self.status, json={"path": request.url.path})
+
+
+@pytest.fixture
+def upstream():
+    asyncio.run(response_cache.clear())
+    return Upstream()
+
+
+def run(upstream, scenario):
+    async def main():
+        transport = httpx.MockTransport(upstream.handle)
+        async with httpx.AsyncClient(base_url="https://exchange.test", transport=transport) as client:
+            return await scenario(client)
+
+    return asyncio.run(main())
+
+
+def test_identical_concurrent_requests_are_coalesced(upstream):
+    deduplicated = request_coalescer.deduplicated
+
+    async def scenario(client):
+        return await asyncio.gather(*(get_json(client, "/soil/v2/datasets") for _ in range(5)))
+
+    results = run(upstream, scenario)
+    assert upstream.requests == 1
+    assert request_coalescer.deduplicated - deduplicated == 4
+    assert all(result == results[0] for result in results)
+
+
+def test_cached_responses_skip_the_upstream(upstream):
+    async def scenario(client):
+        first = await get_json(client, "/soil/v2/datasets")
+        second = await get_json(client, "/soil/v2/datasets")
+        other = await get_json(client, "/soil/v2/datasets", {"page": 2})
+        return first, second, other
+
+    first, second, other = run(upstream, scenario)
+    assert first == second == other
+    assert upstream.requests == 2
+
+
+def test_refresh_bypasses_but_updates_the_cache(upstream):
+    async def scenario(client):
+        await get_json(client, "/soil/v2/datasets")
+        await get_json(client, "/soil/v2/datasets", refresh=True)
+        await get_json(client, "/soil/v2/datasets")
+
+    run(upstream, scenario)
+    assert upstream.requests == 2
+
+
+def test_upstream_errors_raise(upstream):
+    upstream.status = 404
+
+    async def scenario(client):
+        await get_json(client, "/soil/v2/datasets")
+
+    with pytest.raises(httpx.HTTPStatusError):
+        run(upstream, scenario)
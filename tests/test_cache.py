@@ -0,0 +1,123 @@
+import asyncio
+
+import cache
+from cache import CacheEntry, DiskStore, MemoryLRU, ResponseCache
+
+
+def entry(size: int = 10, expires_at: float = 100.0) -> CacheEntry:
+    return CacheEntry({"size": size}, size, expires_at)
+
+
+def test_memory_lru_expires_entries():
+    lru = MemoryLRU(max_entries=10, max_bytes=1000)
+    lru.set("a", entry(expires_at=100.0))
+    assert lru.get("a", now=99.0) is not None
+    assert lru.get("a", now=100.0) is None
+    assert len(lru) == 0
+    assert lru.total_bytes == 0
+
+
+def test_memory_lru_serves_stale_within_grace():
+    lru = MemoryLRU(max_entries=10, max_bytes=1000, stale_grace=50.0)
+    lru.set("a", entry(expires_at=100.0))
+    assert lru.get("a", now=120.0) is None
+    assert lru.get("a", now=120.0, allow_stale=True) is not None
+    assert lru.get("a", now=150.0, allow_stale=True) is None
+    assert len(lru) == 0
+
+
+def test_memory_lru_evicts_least_recently_used_by_count():
+    lru = MemoryLRU(max_entries=2, max_bytes=1000)
+    lru.set("a", entry())
+    lru.set("b", entry())
+    assert lru.get("a", now=0.0) is not None
+    lru.set("c", entry())
+    assert lru.get("b", now=0.0) is None
+    assert lru.get("a", now=0.0) is not None
+    assert lru.get("c", now=0.0) is not None
+    assert lru.evictions == 1
+
+
+def test_memory_lru_evicts_by_bytes_and_skips_oversized():
+    lru = MemoryLRU(max_entries=10, max_bytes=25)
+    lru.set("a", entry(size=10))
+    lru.set("b", entry(size=10))
+    lru.set("c", entry(size=10))
+    assert lru.get("a", now=0.0) is None
+    assert lru.total_bytes == 20
+    lru.set("huge", entry(size=26))
+    assert lru.get("huge", now=0.0) is None
+    assert len(lru) == 2
+
+
+def test_memory_lru_replacing_a_key_keeps_the_size_right():
+    lru = MemoryLRU(max_entries=10, max_bytes=1000)
+    lru.set("a", entry(size=10))
+    lru.set("a", entry(size=30))
+    assert len(lru) == 1
+    assert lru.total_bytes == 30
+
+
+def test_memory_lru_purge_expired():
+    lru = MemoryLRU(max_entries=10, max_bytes=1000, stale_grace=5.0)
+    lru.set("a", entry(expires_at=10.0))
+    lru.set("b", entry(expires_at=20.0))
+    assert lru.purge_expired(now=16.0) == 1
+    assert lru.get("b", now=16.0) is not None
+
+
+def test_disk_store_expiry_and_eviction(tmp_path):
+    store = DiskStore(str(tmp_path), max_bytes=10)
+    store.set("a", b"12345", expires_at=100.0, now=1.0)
+    store.set("b", b"12345", expires_at=100.0, now=2.0)
+    assert store.get("a", now=50.0) == (b"12345", 100.0)
+    assert store.get("a", now=100.0) is None
+    store.set("c", b"12345", expires_at=200.0, now=3.0)
+    assert store.get("b", now=50.0) is not None
+    assert store.get("c", now=50.0) is not None
+    assert store.total_bytes() == 10
+
+
+def test_disk_store_evicts_oldest_writes_first(tmp_path):
+    store = DiskStore(str(tmp_path), max_bytes=10)
+    store.set("a", b"12345", expires_at=100.0, now=1.0)
+    store.set("b", b"12345", expires_at=100.0, now=2.0)
+    store.set("c", b"12345", expires_at=100.0, now=3.0)
+    assert store.get("a", now=5.0) is None
+    assert store.evictions == 1
+
+
+def test_response_cache_ttl_and_counters(monkeypatch, clock):
+    monkeypatch.setattr(cache.time, "time", clock)
+    response_cache = ResponseCache(max_entries=10, max_bytes=1000)
+
+    async def scenario():
+        assert await response_cache.get("k") is None
+        await response_cache.set("k", {"v": 1}, b'{"v":1}', ttl=60)
+        assert (await response_cache.get("k")).value == {"v": 1}
+        clock.advance(61)
+        assert await response_cache.get("k") is None
+
+    asyncio.run(scenario())
+    assert (response_cache.hits, response_cache.misses) == (1, 2)
+
+
+def test_response_cache_reads_through_to_disk(monkeypatch, clock, tmp_path):
+    monkeypatch.setattr(cache.time, "time", clock)
+    writer = ResponseCache(10, 1000, str(tmp_path), disk_max_bytes=1000)
+    reader = ResponseCache(10, 1000, str(tmp_path), disk_max_bytes=1000)
+
+    async def scenario():
+        await writer.set("k", {"v": 1}, b'{"v":1}', ttl=60)
+        assert (await reader.get("k")).value == {"v": 1}
+        # Now in the reader's memory tier as well
+        assert (await reader.get("k")).value == {"v": 1}
+
+    asyncio.run(scenario())
+    assert reader.disk_hits == 1
+    assert reader.hits == 2
+
+
+def test_request_key_ignores_parameter_order():
+    assert cache.request_key("get", "/a", {"x": 1, "y": 2}) == cache.request_key("GET", "/a", {"y": 2, "x": 1})
+    assert cache.request_key("GET", "/a", {"x": 1}) != cache.request_key("GET", "/a", {"x": 2})
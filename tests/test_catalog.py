@@ -0,0 +1,132 @@
+import asyncio
+
+import pytest
+
+from catalog import Catalog, CatalogStore, build_records, tokenize
+
+CLIMATE = {"keyname": "era5", "name": "ERA5 Reanalysis", "id": 1, "description": "Hourly climate reanalysis"}
+SOIL = {"keyname": "soilgrids", "name": "SoilGrids", "id": 2, "description": "Global soil properties"}
+
+
+def records():
+    climate_layers = [
+        {"id": 10, "name": "precipitation", "units": "mm", "description": "Total precipitation", "discrete": False},
+        {"id": 11, "name": "temperature", "units": "K", "description": "Air temperature at 2 m", "discrete": False},
+    ]
+    climate_objects = [
+        {"layer_id": 10, "grid_id": 1, "t_ranges": [{"begin": "2000-01-01", "end": "2009-12-31"}]},
+        {"layer_id": 10, "grid_id": 1, "t_ranges": [{"begin": "2015-01-01", "end": "2020-12-31"}]},
+        {"layer_id": 11, "grid_id": 0, "t_ranges": [{"begin": "2000-01-01", "end": "2020-12-31"}]},
+    ]
+    soil_layers = [
+        {"id": 20, "name": "soil texture class", "units": None, "description": "USDA texture", "discrete": True},
+        {"id": 21, "name": "organic carbon", "units": "g/kg", "description": "Soil organic carbon", "discrete": False},
+    ]
+    soil_objects = [{"layer_id": 20, "grid_id": 4}, {"layer_id": 21, "grid_id": 4}]
+    return build_records("climate", CLIMATE, climate_layers, climate_objects) + build_records(
+        "soil", SOIL, soil_layers, soil_objects
+    )
+
+
+@pytest.fixture
+def catalog():
+    return Catalog(records())
+
+
+def layers(result):
+    return [r["layer"] for r in result["data"]]
+
+
+def test_tokenize_folds_plurals_and_distances():
+    assert tokenize("Soil Layers at 100 m") == ["soil", "layer", "at", "100m"]
+    assert tokenize("grass") == ["grass"]
+
+
+def test_build_records_facets():
+    precipitation = records()[0]
+    assert precipitation["grid_levels"] == [1]
+    assert precipitation["resolutions"] == ["9km"]
+    assert (precipitation["time_begin"], precipitation["time_end"]) == ("2000-01-01", "2020-12-31")
+    assert precipitation["objects"] == 2
+    assert len(precipitation["_ranges"]) == 2
+
+
+def test_layer_name_outranks_description(catalog):
+    # "carbon" is in the layer name of organic carbon only; "soil" everywhere in the soil dataset
+    assert layers(catalog.search("soil carbon")) == ["organic carbon"]
+    assert layers(catalog.search("temperature"))[0] == "temperature"
+
+
+def test_ranking_prefers_more_keywords_then_heavier_fields(catalog):
+    result = catalog.search("precipitation temperature")
+    assert result["match"] == "partial"
+    assert set(layers(result)) == {"precipitation", "temperature"}
+    result = catalog.search("soil")
+    # Layer name (4) beats api_type (2); a field's weight counts once per keyword
+    assert layers(result) == ["soil texture class", "organic carbon"]
+    assert [r["score"] for r in result["data"]] == [4, 2]
+
+
+def test_prefix_matches_score_one_less(catalog):
+    exact = catalog.search("temperature")["data"][0]["score"]
+    assert catalog.search("temper")["data"][0]["score"] == exact - 1
+    # Short tokens only match whole words
+    assert catalog.search("te")["total"] == 0
+
+
+def test_filters(catalog):
+    assert layers(catalog.search(api_type="soil")) == ["soil texture class", "organic carbon"]
+    assert layers(catalog.search(grid_level=0)) == ["temperature"]
+    assert layers(catalog.search(discrete=True)) == ["soil texture class"]
+    assert catalog.search("precipitation", api_type="soil")["total"] == 0
+
+
+def test_time_filter_uses_merged_ranges(catalog):
+    # Precipitation has a gap in 2010-2014; soil layers have no time ranges and always match
+    assert layers(catalog.search(api_type="climate", start="2011-01-01", end="2012-01-01")) == ["temperature"]
+    assert len(catalog.search(start="2011-01-01", end="2012-01-01")["data"]) == 3
+    assert "precipitation" in layers(catalog.search(start="2016-01-01", end="2016-02-01"))
+    with pytest.raises(ValueError):
+        catalog.search(start="not a date")
+
+
+def test_limit_and_total(catalog):
+    result = catalog.search(limit=2)
+    assert result["total"] == 4
+    assert len(result["data"]) == 2
+
+
+def test_store_keeps_records_of_apis_that_failed_to_list():
+    store = CatalogStore()
+    loads = iter([(records(), set()), ([r for r in records() if r["api_type"] == "soil"], {"climate"})])
+
+    async def load():
+        return next(loads)
+
+    async def scenario():
+        first = await store.refresh(load)
+        second = await store.refresh(load)
+        return first, second
+
+    first, second = asyncio.run(scenario())
+    assert len(first.records) == len(second.records) == 4
+    assert store.failed_apis == {"climate"}
+    assert store.builds == 2
+
+
+def test_store_shares_one_load():
+    store = CatalogStore()
+    calls = 0
+
+    async def load():
+        nonlocal calls
+        calls += 1
+        await asyncio.sleep(0.01)
+        return records(), set()
+
+    async def scenario():
+        return await asyncio.gather(store.get(load), store.get(load), store.refresh(load))
+
+    results = asyncio.run(scenario())
+    assert calls == 1
+    assert results[0] is results[1] is results[2]
@@ -0,0 +1,92 @@
+from catchments import DOWNSTREAM, UPSTREAM, CatchmentGraph
+
+
+def record(node, down):
+    return {"id": node, "down_cat": down}
+
+
+def ids(records):
+    return [r["id"] for r in records]
+
+
+def test_records_need_down_cat_and_ids_are_normalized():
+    graph = CatchmentGraph(max_geometries=10)
+    assert graph.add([record(12.0, "13.0"), {"id": 14}, "junk", record(None, 1)]) == ["12"]
+    assert graph.down == {"12": "13"}
+    assert graph.up == {"13": {"12"}}
+
+
+def test_downstream_chain_to_an_outlet_is_complete():
+    graph = CatchmentGraph(10)
+    graph.add([record("a", "b"), record("b", "c"), record("c", "0")])
+    assert ids(graph.walk("a", DOWNSTREAM)) == ["b", "c"]
+    assert graph.walk("c", DOWNSTREAM) == []
+    assert graph.local_walks == 2
+
+
+def test_terminal_and_self_loop_down_cats_end_the_path():
+    graph = CatchmentGraph(10)
+    graph.add([record("a", ""), record("b", "-1"), record("c", None), record("d", "NULL"), record("e", "e")])
+    for node in "abcde":
+        assert graph.walk(node, DOWNSTREAM) == []
+    assert "e" not in graph.up
+
+
+def test_downstream_chain_ending_at_an_unknown_record_is_not_local():
+    graph = CatchmentGraph(10)
+    graph.add([record("a", "b"), record("b", "x")])
+    assert graph.walk("a", DOWNSTREAM) is None
+    assert graph.walk("unknown", DOWNSTREAM) is None
+
+
+def test_fetched_downstream_path_may_end_at_an_unknown_record():
+    graph = CatchmentGraph(10)
+    graph.add([record("a", "b")])
+    # The API has no record for x, the last id on the path
+    graph.add_network("a", DOWNSTREAM, [record("b", "c"), record("c", "x")])
+    assert ids(graph.walk("a", DOWNSTREAM)) == ["b", "c"]
+    # Members are complete too: their paths are suffixes of a's
+    assert ids(graph.walk("b", DOWNSTREAM)) == ["c"]
+    assert graph.fetched_walks == 1
+
+
+def test_fetched_downstream_path_without_the_start_record_is_not_complete_for_start():
+    graph = CatchmentGraph(10)
+    graph.add_network("a", DOWNSTREAM, [record("b", "x")])
+    assert "a" not in graph.complete[DOWNSTREAM]
+    assert graph.walk("a", DOWNSTREAM) is None
+    assert graph.walk("b", DOWNSTREAM) == []
+
+
+def test_downstream_cycle_terminates():
+    graph = CatchmentGraph(10)
+    graph.add([record("a", "b"), record("b", "a")])
+    assert ids(graph.walk("a", DOWNSTREAM)) == ["b"]
+
+
+def test_upstream_needs_a_fetched_set():
+    graph = CatchmentGraph(10)
+    graph.add([record("a", "d"), record("d", "0")])
+    assert graph.walk("d", UPSTREAM) is None
+
+
+def test_upstream_set_is_closed_for_every_member():
+    graph = CatchmentGraph(10)
+    # a -> b -> d and c -> d
+    graph.add_network("d", UPSTREAM, [record("a", "b"), record("b", "d"), record("c", "d")])
+    assert ids(graph.walk("d", UPSTREAM)) == ["b", "c", "a"]
+    assert ids(graph.walk("b", UPSTREAM)) == ["a"]
+    assert graph.walk("a", UPSTREAM) == []
+    # A catchment outside the fetched set is still unknown
+    assert graph.walk("e", UPSTREAM) is None
+
+
+def test_geometry_lru():
+    graph = CatchmentGraph(max_geometries=2)
+    graph.set_geometry("a", {"type": "Polygon"})
+    graph.set_geometry("b", {"type": "Polygon"})
+    assert graph.get_geometry("a") is not None
+    graph.set_geometry("c", {"type": "Polygon"})
+    assert graph.get_geometry("b") is None
+    assert graph.get_geometry("a") is not None
+    assert (graph.geometry_hits, graph.geometry_misses) == (2, 1)
@@ -0,0 +1,65 @@
+import pytest
+
+np = pytest.importorskip("numpy")
+
+from envelopes import EnvelopeIndex, STRTree, envelope_edges, points_in_edges  # noqa: E402
+
+
+def square(x0: float, y0: float, size: float = 1.0):
+    return {"type": "Polygon", "coordinates": [[[x0, y0], [x0 + size, y0], [x0 + size, y0 + size], [x0, y0 + size], [x0, y0]]]}
+
+
+def brute_force(boxes, xs, ys):
+    return sorted(
+        (p, b) for p, (x, y) in enumerate(zip(xs, ys))
+        for b, (x0, y0, x1, y1) in enumerate(boxes) if x0 <= x <= x1 and y0 <= y <= y1
+    )
+
+
+@pytest.mark.parametrize("count", [0, 1, 16, 17, 300])
+def test_query_points_matches_brute_force(count):
+    rng = np.random.default_rng(count)
+    corners = rng.uniform(0, 100, size=(count, 2))
+    sizes = rng.uniform(0.5, 10, size=(count, 2))
+    boxes = np.hstack([corners, corners + sizes])
+    xs, ys = rng.uniform(0, 110, size=200), rng.uniform(0, 110, size=200)
+    tree = STRTree(boxes, capacity=4)
+    points, items = tree.query_points(xs, ys)
+    assert sorted(zip(points.tolist(), items.tolist())) == brute_force(boxes.tolist(), xs, ys)
+
+
+def test_points_in_edges_even_odd_with_hole():
+    polygon = {
+        "type": "Polygon",
+        "coordinates": [
+            [[0, 0], [4, 0], [4, 4], [0, 4], [0, 0]],
+            [[1, 1], [3, 1], [3, 3], [1, 3], [1, 1]],
+        ],
+    }
+    edges = envelope_edges(polygon)
+    inside = points_in_edges(edges, np.array([0.5, 2.0, 3.5, 5.0]), np.array([0.5, 2.0, 2.0, 2.0]))
+    assert inside.tolist() == [True, False, True, False]
+
+
+def test_envelope_edges_accepts_features_and_multipolygons():
+    multi = {"type": "MultiPolygon", "coordinates": [square(0, 0)["coordinates"], square(5, 5)["coordinates"]]}
+    assert envelope_edges({"type": "Feature", "geometry": square(0, 0)}).shape == (5, 4)
+    assert envelope_edges(multi).shape == (10, 4)
+    assert envelope_edges({"type": "Point", "coordinates": [0, 0]}) is None
+
+
+def test_covering_checks_polygons_not_just_boxes():
+    # A triangle whose bounding box also contains (0.9, 0.9)
+    triangle = {"type": "Polygon", "coordinates": [[[0, 0], [1, 0], [0, 1], [0, 0]]]}
+    index = EnvelopeIndex()
+    index.update([{"id": 1}, {"id": 2}, {"id": 3}], {1: triangle, 2: square(0, 0, 2), 3: square(10, 10)})
+    assert index.covering([0.2, 0.9, 10.5, 50.0], [0.2, 0.9, 10.5, 50.0]) == [[1, 2], [2], [3], []]
+
+
+def test_update_only_keeps_listed_objects():
+    index = EnvelopeIndex()
+    index.update([{"id": 1}, {"id": 2}], {1: square(0, 0), 2: square(5, 5)})
+    assert index.missing_envelopes([{"id": 1}, {"id": 3}]) == [3]
+    index.update([{"id": 1}, {"id": 3}], {3: square(5, 5)})
+    assert sorted(index.edges) == [1, 3]
+    assert index.covering([5.5], [5.5]) == [[3]]
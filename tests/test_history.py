@@ -0,0 +1,67 @@
+import asyncio
+
+import history
+from history import ChunkDiskStore, HistoryStore, chunk_key
+
+
+def chunk(days, expires_at=2_000_000.0, meta=None):
+    return {"meta": meta or {}, "days": {day: [expires_at, [{"day": day}]] for day in days}}
+
+
+def test_add_merges_days_into_the_stored_chunk(monkeypatch, clock):
+    monkeypatch.setattr(history.time, "time", clock)
+    store = HistoryStore(max_bytes=1 << 20)
+    key = chunk_key("daily", 44.98, -93.26, 100)
+
+    async def scenario():
+        await store.add({key: chunk(["2020-01-01"], meta={"city_name": "Minneapolis"})})
+        await store.add({key: chunk(["2020-01-02"])})
+        return await store.get_chunks([key, "missing"])
+
+    found = asyncio.run(scenario())
+    assert sorted(found[key]["days"]) == ["2020-01-01", "2020-01-02"]
+    assert found[key]["meta"] == {"city_name": "Minneapolis"}
+    assert (store.hits, store.misses) == (1, 1)
+
+
+def test_chunks_expire_with_their_last_day(monkeypatch, clock):
+    monkeypatch.setattr(history.time, "time", clock)
+    store = HistoryStore(max_bytes=1 << 20)
+    asyncio.run(store.add({"k": {"meta": {}, "days": {"a": [clock.now + 10, []], "b": [clock.now + 20, []]}}}))
+    clock.advance(15)
+    assert "k" in asyncio.run(store.get_chunks(["k"]))
+    clock.advance(10)
+    assert asyncio.run(store.get_chunks(["k"])) == {}
+
+
+def test_memory_tier_is_bounded_by_bytes(monkeypatch, clock):
+    monkeypatch.setattr(history.time, "time", clock)
+    size = len(history.jsoncodec.dumps(chunk(["2020-01-01"])))
+    store = HistoryStore(max_bytes=2 * size)
+    asyncio.run(store.add({f"k{i}": chunk(["2020-01-01"]) for i in range(3)}))
+    assert list(store._chunks) == ["k1", "k2"]
+    assert store.total_bytes == 2 * size
+    assert store.evictions == 1
+
+
+def test_disk_tier_is_shared_and_batched(monkeypatch, clock, tmp_path):
+    monkeypatch.setattr(history.time, "time", clock)
+    monkeypatch.setattr(history, "QUERY_BATCH", 2)
+    writer = HistoryStore(1 << 20, str(tmp_path), disk_max_bytes=1 << 20)
+    reader = HistoryStore(1 << 20, str(tmp_path), disk_max_bytes=1 << 20)
+    keys = [f"k{i}" for i in range(5)]
+    asyncio.run(writer.add({key: chunk(["2020-01-01"]) for key in keys}))
+    found = asyncio.run(reader.get_chunks(keys + ["missing"]))
+    assert sorted(found) == keys
+    assert reader.disk_hits == 5
+    assert reader.stats()["chunks"] == 5
+
+
+def test_disk_store_evicts_oldest_writes(tmp_path):
+    store = ChunkDiskStore(str(tmp_path), max_bytes=10)
+    store.set_chunks({"a": (b"12345", 100.0)}, now=1.0)
+    store.set_chunks({"b": (b"12345", 100.0)}, now=2.0)
+    store.set_chunks({"c": (b"12345", 100.0)}, now=3.0)
+    assert sorted(store.get_chunks(["a", "b", "c"], now=4.0)) == ["b", "c"]
+    assert store.evictions == 1
+    assert store.get_chunks(["c"], now=100.0) == {}
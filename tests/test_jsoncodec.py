@@ -0,0 +1,95 @@
+import asyncio
+import json
+
+import httpx
+import pytest
+
+import jsoncodec
+from cache import response_cache
+from config import Config
+from endpoints.base import get_json
+from shaping import shaped
+
+# Spacing a re-encoded value would not have, so reused bytes are recognizable
+BODY = b'{ "temp" : 1.50, "city" : "Saint Paul" }'
+
+
+@pytest.fixture
+def upstream(monkeypatch):
+    monkeypatch.setattr(Config, "JSON_PASSTHROUGH", True)
+    asyncio.run(response_cache.clear())
+    requests = []
+
+    def handle(request: httpx.Request) -> httpx.Response:
+        requests.append(request)
+        return httpx.Response(200, content=BODY, headers={"content-type": "application/json"})
+
+    return httpx.MockTransport(handle), requests
+
+
+def call(transport, tool, **kwargs):
+    async def main():
+        async with httpx.AsyncClient(base_url="https://exchange.test", transport=transport) as client:
+            return await jsoncodec.encoded("test", lambda **kw: tool(client, **kw))(**kwargs)
+
+    return asyncio.run(main())
+
+
+async def current(client):
+    return {"data": await get_json(client, "/weather/v2/current", {"lat": 1, "lon": 2}, ttl=60)}
+
+
+def test_upstream_bytes_are_reused_on_a_miss_and_a_cache_hit(upstream):
+    transport, requests = upstream
+    for _ in range(2):
+        assert call(transport, current) == '{"data":' + BODY.decode() + "}"
+    assert len(requests) == 1
+
+
+def test_shaped_results_are_encoded_again(upstream):
+    transport, _ = upstream
+    text = call(transport, shaped(current), fields=["data.temp"])
+    assert text == '{"data":{"temp":1.5}}'
+
+
+def test_equal_but_different_values_are_encoded_again(upstream):
+    transport, _ = upstream
+
+    async def copied(client):
+        return {"data": dict(await get_json(client, "/weather/v2/current", {"lat": 1, "lon": 2}, ttl=60))}
+
+    assert call(transport, copied) == '{"data":{"temp":1.5,"city":"Saint Paul"}}'
+
+
+def test_passthrough_off_keeps_no_bodies(upstream, monkeypatch):
+    transport, _ = upstream
+    monkeypatch.setattr(Config, "JSON_PASSTHROUGH", False)
+    assert call(transport, current) == '{"data":{"temp":1.5,"city":"Saint Paul"}}'
+
+
+def test_encode_result_falls_back_for_non_utf8_bodies():
+    value = {"name": "café"}
+    bodies = {id(value): (value, '{"name":"café"}'.encode("latin-1"))}
+    assert jsoncodec.encode_result({"data": value}, bodies) == ('{"data":{"name":"café"}}', False)
+    assert jsoncodec.encode_result("already text") == ("already text", False)
+
+
+def test_remember_outside_a_tool_call_is_a_no_op():
+    jsoncodec.remember({"a": 1}, b'{"a":1}')
+    assert jsoncodec._raw_bodies.get() is None
+
+
+def test_stdlib_backend(monkeypatch):
+    monkeypatch.setattr(Config, "JSON_BACKEND", "json")
+    monkeypatch.setattr(jsoncodec, "_backend", None)
+    assert jsoncodec.get_backend().name == "json"
+    assert jsoncodec.dumps({"a": (1, 2), "b": "é", "c": {3}}) == '{"a":[1,2],"b":"é","c":[3]}'.encode()
+    assert jsoncodec.loads(b'{"a": [1, 2.5]}') == {"a": [1, 2.5]}
+    assert json.loads(jsoncodec.encode_result({"x": None})[0]) == {"x": None}
+
+
+def test_unknown_backend_is_rejected(monkeypatch):
+    monkeypatch.setattr(Config, "JSON_BACKEND", "yaml")
+    monkeypatch.setattr(jsoncodec, "_backend", None)
+    with pytest.raises(ValueError):
+        jsoncodec.get_backend()
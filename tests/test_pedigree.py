@@ -0,0 +1,93 @@
+import pytest
+
+from pedigree import COMPLETE, PedigreeGraph
+
+
+def variety(name, pedigree=None, mother=None, father=None):
+    result = {"preferred_name": name, "pedigree": pedigree}
+    if mother:
+        result["mother"] = {"preferred_name": mother}
+    if father:
+        result["father"] = {"preferred_name": father}
+    return result
+
+
+@pytest.fixture
+def graph():
+    """C = A/B and D = A/E, with founders A, B and E."""
+    graph = PedigreeGraph()
+    graph.add_varieties([variety(name) for name in "ABE"], pedigree_depth=3)
+    graph.add_varieties([variety("C", "A/B"), variety("D", "A/E")], pedigree_depth=3)
+    return graph
+
+
+def cop(graph, a, b, max_depth=3, crosses=None):
+    return graph.cop_matrix([a, b], max_depth, crosses)[0][1]
+
+
+def test_founders_are_complete_and_crosses_record_depth(graph):
+    assert graph.depth[graph.find("A")] == COMPLETE
+    assert graph.depth[graph.find("C")] == 3
+
+
+def test_cop_of_half_siblings(graph):
+    # cop(C, D) = (cop(A, D) + cop(B, D)) / 2 = (1/2 + 0) / 2
+    assert cop(graph, graph.find("C"), graph.find("D")) == pytest.approx(0.25)
+    assert cop(graph, graph.find("A"), graph.find("C")) == pytest.approx(0.5)
+    assert cop(graph, graph.find("B"), graph.find("E")) == 0.0
+
+
+def test_cop_matrix_is_symmetric_with_unit_diagonal(graph):
+    nodes = [graph.find(n) for n in "ABCDE"]
+    matrix = graph.cop_matrix(nodes, 3)
+    for i in range(5):
+        assert matrix[i][i] == 1.0
+        for j in range(5):
+            assert matrix[i][j] == pytest.approx(matrix[j][i])
+
+
+def test_hypothetical_cross_uses_temporary_nodes(graph):
+    size = len(graph)
+    crosses = {}
+    x = graph.resolve("C/D", 3, crosses)
+    assert x is not None and x < 0
+    assert len(graph) == size
+    # cop(X, C) = (1 + cop(D, C)) / 2 = (1 + 1/4) / 2
+    assert cop(graph, x, graph.find("C"), crosses=crosses) == pytest.approx(0.625)
+
+
+def test_resolve_requires_loaded_ancestry(graph):
+    graph.add_varieties([variety("F", "C/D")], pedigree_depth=1)
+    assert graph.resolve("F", 1, {}) == graph.find("F")
+    assert graph.resolve("F", 2, {}) is None
+    assert graph.resolve("unknown", 1, {}) is None
+    assert graph.resolve("C/unknown", 1, {}) is None
+
+
+def test_max_depth_truncates_ancestry(graph):
+    graph.add_varieties([variety("G", "C/D")], pedigree_depth=3)
+    g, c, d = graph.find("G"), graph.find("C"), graph.find("D")
+    # Without their parents C and D are unrelated; one generation finds A
+    assert cop(graph, c, d, max_depth=0) == 0.0
+    assert cop(graph, c, d, max_depth=1) == pytest.approx(0.25)
+    # G's grandparents are cut at one generation, so cop(D, C) counts as 0 there
+    assert cop(graph, g, c, max_depth=1) == pytest.approx(0.5)
+    assert cop(graph, g, c, max_depth=2) == pytest.approx(0.625)
+
+
+def test_named_parents_and_aliases():
+    graph = PedigreeGraph()
+    graph.add_varieties([{**variety("Child", mother="Mom", father="Dad"), "aliases": [{"name": "Kid"}]}], 2)
+    child = graph.find("kid")
+    assert child == graph.find("Child")
+    assert graph.names[graph.mother[child]] == "Mom"
+    assert graph.names[graph.father[child]] == "Dad"
+
+
+def test_backcross_parsing():
+    graph = PedigreeGraph()
+    graph.add_varieties([variety("A"), variety("B")], 3)
+    # A*2/B is A/(A/B): three quarters A
+    graph.add_varieties([variety("BC", "A*2/B")], 3)
+    bc = graph.find("BC")
+    assert cop(graph, bc, graph.find("A")) == pytest.approx(0.75)
@@ -0,0 +1,137 @@
+import asyncio
+import sqlite3
+from types import SimpleNamespace
+
+import pytest
+
+import ratelimit
+from config import Config
+from ratelimit import RateLimiter, SharedBucketStore, SharedTokenBucket, TokenBucket
+
+
+@pytest.fixture
+def sleeps(monkeypatch, clock):
+    """Run the limiter on the test clock; sleeping advances it instead of waiting."""
+    slept = []
+
+    async def sleep(delay):
+        slept.append(delay)
+        clock.advance(delay)
+        await asyncio.sleep(0)
+
+    monkeypatch.setattr(ratelimit, "time", SimpleNamespace(monotonic=clock, time=clock))
+    monkeypatch.setattr(ratelimit, "asyncio", SimpleNamespace(sleep=sleep, Lock=asyncio.Lock, to_thread=asyncio.to_thread))
+    return slept
+
+
+def test_parse_rate():
+    assert Config.parse_rate("20:40") == (20.0, 40.0)
+    assert Config.parse_rate("5") == (5.0, 5.0)
+    assert Config.parse_rate("0") is None
+    assert Config.parse_rate("") is None
+
+
+def test_burst_then_steady_rate(sleeps):
+    bucket = TokenBucket("b", rate=2.0, burst=2.0)
+
+    async def scenario():
+        return [await bucket.acquire() for _ in range(4)]
+
+    assert asyncio.run(scenario()) == pytest.approx([0.0, 0.0, 0.5, 0.5])
+    assert bucket.delayed == 2
+
+
+def test_refill_is_capped_at_burst(sleeps, clock):
+    bucket = TokenBucket("b", rate=1.0, burst=2.0)
+
+    async def scenario():
+        await bucket.acquire()
+        await bucket.acquire()
+        clock.advance(100)
+        return [await bucket.acquire() for _ in range(3)]
+
+    assert asyncio.run(scenario()) == pytest.approx([0.0, 0.0, 1.0])
+
+
+def test_waiters_are_served_first_in_first_out(sleeps, clock):
+    bucket = TokenBucket("b", rate=1.0, burst=1.0)
+    start = clock.now
+    order = []
+
+    async def caller(i):
+        await bucket.acquire()
+        order.append((i, clock.now - start))
+
+    async def scenario():
+        await asyncio.gather(*(caller(i) for i in range(5)))
+
+    asyncio.run(scenario())
+    assert [i for i, _ in order] == [0, 1, 2, 3, 4]
+    assert [w for _, w in order] == pytest.approx([0.0, 1.0, 2.0, 3.0, 4.0])
+    assert bucket.waiting == 0
+
+
+def test_longest_service_prefix_wins(sleeps):
+    limiter = RateLimiter(None, {"/weather": (1.0, 1.0), "/weather/v2/history": (1.0, 1.0)})
+    buckets = dict(limiter.service_buckets)
+
+    async def scenario():
+        await limiter.acquire("/weather/v2/history/daily")
+        await limiter.acquire("/weather/v2/current")
+        await limiter.acquire("/soil/v2/datasets")
+
+    asyncio.run(scenario())
+    assert buckets["/weather/v2/history"].acquired == 1
+    assert buckets["/weather"].acquired == 1
+    assert sleeps == []
+
+
+def test_key_wide_bucket_covers_every_service(sleeps):
+    limiter = RateLimiter((1.0, 1.0), {"/weather": (10.0, 10.0)})
+
+    async def scenario():
+        return [await limiter.acquire(path) for path in ("/weather/v2/current", "/soil/v2/datasets")]
+
+    assert asyncio.run(scenario()) == pytest.approx([0.0, 1.0])
+    assert set(limiter.stats()) == {"apikey", "/weather"}
+
+
+def test_no_limits_never_wait(sleeps):
+    limiter = RateLimiter(None, {})
+    assert asyncio.run(limiter.acquire("/weather/v2/current")) == 0.0
+    assert limiter.stats() == {}
+
+
+def test_shared_store_levels_are_seen_by_every_process(sleeps, clock, tmp_path):
+    # Two stores on one file stand in for two worker processes
+    first, second = SharedBucketStore(str(tmp_path)), SharedBucketStore(str(tmp_path))
+    delays = [store.reserve("apikey", 1.0, 2.0) for store in (first, second, first, second)]
+    assert delays == pytest.approx([0.0, 0.0, 1.0, 2.0])
+    clock.advance(10)
+    # Refill is capped at the burst, counting the tokens already reserved
+    assert second.reserve("apikey", 1.0, 2.0) == 0.0
+    assert first.reserve("other", 1.0, 1.0) == 0.0
+
+
+def test_shared_bucket_waits_for_its_reservation(sleeps, tmp_path):
+    limiter = RateLimiter((1.0, 1.0), {}, SharedBucketStore(str(tmp_path)))
+
+    async def scenario():
+        return [await limiter.acquire("/weather/v2/current") for _ in range(3)]
+
+    assert asyncio.run(scenario()) == pytest.approx([0.0, 1.0, 1.0])
+    assert sleeps == pytest.approx([1.0, 1.0])
+
+
+def test_shared_bucket_falls_back_to_a_local_bucket(sleeps):
+    class BrokenStore:
+        def reserve(self, name, rate, burst):
+            raise sqlite3.OperationalError("database is locked")
+
+    bucket = SharedTokenBucket("apikey", 1.0, 1.0, BrokenStore())
+
+    async def scenario():
+        return [await bucket.acquire() for _ in range(2)]
+
+    assert asyncio.run(scenario()) == pytest.approx([0.0, 1.0])
+    assert bucket.stats()["store_errors"] == 2
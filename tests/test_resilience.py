@@ -0,0 +1,178 @@
+import asyncio
+
+import httpx
+import pytest
+
+import resilience
+from resilience import CLOSED, HALF_OPEN, OPEN, CircuitBreaker, CircuitOpenError, UpstreamGuard
+
+
+@pytest.fixture
+def breaker(monkeypatch, clock):
+    monkeypatch.setattr(resilience.time, "monotonic", clock)
+    return CircuitBreaker("weather", failure_threshold=3, reset_timeout=30.0)
+
+
+def guard(max_attempts: int = 3, failure_threshold: int = 2) -> UpstreamGuard:
+    return UpstreamGuard(
+        max_attempts, base_delay=0.0, max_delay=0.0, max_retry_after=0.0,
+        failure_threshold=failure_threshold, reset_timeout=30.0
+    )
+
+
+def response(status: int) -> httpx.Response:
+    return httpx.Response(status, request=httpx.Request("GET", "https://example.test/weather/v2/current"))
+
+
+def test_breaker_opens_after_consecutive_failures(breaker):
+    for _ in range(2):
+        breaker.before_call()
+        breaker.record_failure()
+    assert breaker.state == CLOSED
+    breaker.before_call()
+    breaker.record_failure()
+    assert breaker.state == OPEN
+    assert breaker.is_open
+    with pytest.raises(CircuitOpenError) as error:
+        breaker.before_call()
+    assert error.value.retry_in == pytest.approx(30.0)
+    assert breaker.rejected == 1
+    assert breaker.times_opened == 1
+
+
+def test_success_resets_the_failure_count(breaker):
+    breaker.record_failure()
+    breaker.record_failure()
+    breaker.record_success()
+    breaker.record_failure()
+    assert breaker.state == CLOSED
+    assert breaker.failures == 1
+
+
+def test_half_open_allows_one_trial(breaker, clock):
+    for _ in range(3):
+        breaker.record_failure()
+    clock.advance(30.0)
+    breaker.before_call()
+    assert breaker.state == HALF_OPEN
+    with pytest.raises(CircuitOpenError):
+        breaker.before_call()
+    breaker.record_success()
+    assert breaker.state == CLOSED
+    breaker.before_call()
+
+
+def test_failed_trial_reopens(breaker, clock):
+    for _ in range(3):
+        breaker.record_failure()
+    clock.advance(30.0)
+    breaker.before_call()
+    breaker.record_failure()
+    assert breaker.state == OPEN
+    assert breaker.times_opened == 2
+    with pytest.raises(CircuitOpenError):
+        breaker.before_call()
+    clock.advance(30.0)
+    breaker.before_call()
+    assert breaker.state == HALF_OPEN
+
+
+def test_released_trial_can_be_claimed_again(breaker, clock):
+    for _ in range(3):
+        breaker.record_failure()
+    clock.advance(30.0)
+    breaker.before_call()
+    breaker.release_trial()
+    assert breaker.state == HALF_OPEN
+    breaker.before_call()
+
+
+def test_guard_retries_server_errors_then_succeeds():
+    upstream = guard(failure_threshold=3)
+    statuses = iter([503, 502, 200])
+
+    async def send():
+        return response(next(statuses))
+
+    result = asyncio.run(upstream.send("/weather/v2/current", send))
+    assert result.status_code == 200
+    assert upstream.retries == 2
+    assert upstream.breaker("weather").state == CLOSED
+
+
+def test_guard_returns_the_last_error_response():
+    upstream = guard(max_attempts=2)
+
+    async def send():
+        return response(503)
+
+    result = asyncio.run(upstream.send("/weather/v2/current", send))
+    assert result.status_code == 503
+    assert upstream.breaker("weather").state == OPEN
+
+
+def test_guard_does_not_retry_client_errors():
+    upstream = guard()
+    calls = 0
+
+    async def send():
+        nonlocal calls
+        calls += 1
+        return response(404)
+
+    assert asyncio.run(upstream.send("/weather/v2/current", send)).status_code == 404
+    assert calls == 1
+    assert upstream.breaker("weather").failures == 0
+
+
+def test_guard_raises_transport_errors_after_the_last_attempt():
+    upstream = guard(max_attempts=2)
+
+    async def send():
+        raise httpx.ConnectError("refused")
+
+    with pytest.raises(httpx.ConnectError):
+        asyncio.run(upstream.send("/soil/v2/x", send))
+    assert upstream.retries == 1
+    assert upstream.breaker("soil").state == OPEN
+
+
+def test_guard_releases_the_trial_when_a_call_fails_without_a_verdict(monkeypatch, clock):
+    monkeypatch.setattr(resilience.time, "monotonic", clock)
+    upstream = guard()
+    breaker = upstream.breaker("weather")
+    breaker.record_failure()
+    breaker.record_failure()
+    clock.advance(30.0)
+
+    async def send():
+        raise httpx.DecodingError("bad body")
+
+    with pytest.raises(httpx.DecodingError):
+        asyncio.run(upstream.send("/weather/v2/current", send))
+    assert breaker.state == HALF_OPEN
+    # The trial slot is free again
+    breaker.before_call()
+
+
+def test_guard_fails_fast_while_open():
+    upstream = guard()
+    upstream.breaker("weather").record_failure()
+    upstream.breaker("weather").record_failure()
+
+    async def send():
+        raise AssertionError("must not be called")
+
+    with pytest.raises(CircuitOpenError):
+        asyncio.run(upstream.send("/weather/v2/current", send))
+
+
+def test_guard_stops_retrying_once_the_circuit_opens():
+    upstream = guard(max_attempts=3, failure_threshold=2)
+
+    async def send():
+        return response(503)
+
+    with pytest.raises(CircuitOpenError):
+        asyncio.run(upstream.send("/weather/v2/current", send))
+    assert upstream.retries == 2
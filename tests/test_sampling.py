@@ -0,0 +1,86 @@
+import math
+
+import pytest
+
+np = pytest.importorskip("numpy")
+tifffile = pytest.importorskip("tifffile")
+
+from sampling import RasterTile, TileCache, _geo_keys  # noqa: E402
+
+NODATA = -9999.0
+
+
+def write_tiff(path, array, x0=10.0, y0=20.0, scale=1.0, pixel_is_point=False, nodata=None):
+    """Write a WGS84 GeoTIFF with its tie point at the upper-left pixel."""
+    keys = [1, 1, 0, 2, 2048, 0, 1, 4326, 1025, 0, 1, 2 if pixel_is_point else 1]
+    tags = [
+        (33550, 12, 3, (scale, scale, 0.0)),
+        (33922, 12, 6, (0.0, 0.0, 0.0, x0, y0, 0.0)),
+        (34735, 3, len(keys), keys),
+    ]
+    if nodata is not None:
+        tags.append((42113, 2, 0, str(nodata)))
+    tifffile.imwrite(str(path), np.asarray(array, dtype=np.float32), extratags=tags)
+    return str(path)
+
+
+@pytest.fixture
+def tile(tmp_path):
+    return RasterTile.open(write_tiff(tmp_path / "tile.tif", [[1, 2], [3, 4]]))
+
+
+def sample(tile, points, interpolation="nearest"):
+    x, y = np.array(points, dtype=np.float64).T
+    return tile.sample(x, y, interpolation)
+
+
+def test_geo_keys():
+    assert _geo_keys([1, 1, 0, 2, 2048, 0, 1, 4326, 3073, 34737, 5, 0]) == {2048: 4326}
+
+
+def test_georeferencing(tile):
+    assert (tile.x0, tile.y0, tile.sx, tile.sy, tile.epsg) == (10.0, 20.0, 1.0, 1.0, 4326)
+    assert (tile.height, tile.width) == (2, 2)
+    assert tile.nodata is None
+
+
+def test_nearest(tile):
+    values, covered = sample(tile, [(10.2, 19.8), (11.9, 18.1), (11.5, 19.5), (9.9, 19.0), (12.0, 19.0)])
+    assert covered.tolist() == [True, True, True, False, False]
+    assert values[:3].tolist() == [1.0, 4.0, 2.0]
+    assert np.isnan(values[3:]).all()
+
+
+def test_bilinear(tile):
+    values, _ = sample(tile, [(10.5, 19.5), (11.0, 19.0), (10.75, 19.5), (10.1, 19.9)], "bilinear")
+    # Pixel centers return their value; the shared corner averages all four
+    assert values.tolist() == pytest.approx([1.0, 2.5, 1.25, 1.0])
+
+
+def test_nodata_is_nan_and_bilinear_renormalizes(tmp_path):
+    tile = RasterTile.open(write_tiff(tmp_path / "nodata.tif", [[1, NODATA], [3, 4]], nodata=NODATA))
+    assert tile.nodata == NODATA
+    nearest, _ = sample(tile, [(11.5, 19.5), (10.5, 18.5)])
+    assert math.isnan(nearest[0]) and nearest[1] == 3.0
+    bilinear, _ = sample(tile, [(11.0, 19.0), (11.5, 19.5)], "bilinear")
+    assert bilinear[0] == pytest.approx(8 / 3)
+    assert math.isnan(bilinear[1])
+
+
+def test_pixel_is_point_shifts_the_origin_half_a_pixel(tmp_path):
+    tile = RasterTile.open(write_tiff(tmp_path / "point.tif", [[1, 2], [3, 4]], pixel_is_point=True))
+    assert (tile.x0, tile.y0) == (9.5, 20.5)
+    values, _ = sample(tile, [(10.0, 20.0), (10.6, 20.0), (10.0, 19.4)])
+    assert values.tolist() == [1.0, 2.0, 3.0]
+
+
+def test_tile_cache_samples_each_point_from_the_first_covering_tile(tmp_path):
+    cache = TileCache(max_tiles=2)
+    cache.add("obj", RasterTile.open(write_tiff(tmp_path / "a.tif", [[1, 2], [3, 4]])))
+    cache.add("obj", RasterTile.open(write_tiff(tmp_path / "b.tif", [[5, 6], [7, 8]], x0=12.0)))
+    values, covered = cache.sample("obj", np.array([10.5, 12.5, 20.0]), np.array([19.5, 19.5, 19.5]))
+    assert covered.tolist() == [True, True, False]
+    assert values[:2].tolist() == [1.0, 5.0]
+    assert cache.local_points == 2
+    cache.add("other", RasterTile.open(write_tiff(tmp_path / "c.tif", [[0]])))
+    assert len(cache.tiles_for("obj")) == 1
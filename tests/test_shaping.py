@@ -0,0 +1,106 @@
+import asyncio
+import inspect
+
+import pytest
+
+from shaping import columnar, parse_fields, project, reduce_series, shape, shaped, summary
+
+RESULT = {
+    "city": "Minneapolis",
+    "data": {
+        "station": "KMSP",
+        "data": [
+            {"datetime": "2024-01-01", "temp": 1.0, "wind": {"speed": 3, "dir": 90}},
+            {"datetime": "2024-01-02", "temp": 3.0, "wind": {"speed": 5, "dir": 180}},
+        ],
+    },
+}
+
+
+def test_parse_fields_builds_a_trie():
+    assert parse_fields(["$.data.data[*].temp", "data.station"]) == {"data": {"data": {"temp": {}}, "station": {}}}
+    # A shorter path selects everything below it
+    assert parse_fields(["data", "data.station"]) == {"data": {}}
+    with pytest.raises(ValueError):
+        parse_fields(["data.data[0].temp"])
+
+
+def test_project_traverses_arrays_implicitly():
+    projected = project(RESULT, parse_fields(["data.data.temp", "data.data.wind.speed"]))
+    assert projected == {"data": {"data": [{"temp": 1.0, "wind": {"speed": 3}}, {"temp": 3.0, "wind": {"speed": 5}}]}}
+
+
+def test_project_wildcard_and_explicit_keys_merge():
+    projected = project(RESULT, parse_fields(["data.data.*.speed", "data.data.datetime"]))
+    assert projected["data"]["data"][0] == {"datetime": "2024-01-01", "wind": {"speed": 3}}
+    assert project(RESULT, parse_fields(["*"])) == RESULT
+
+
+def test_project_shares_untouched_subtrees():
+    projected = project(RESULT, parse_fields(["data.data.wind"]))
+    assert projected["data"]["data"][0]["wind"] is RESULT["data"]["data"][0]["wind"]
+
+
+def test_project_drops_missing_paths():
+    assert project(RESULT, parse_fields(["data.nothing"])) == {"data": {}}
+
+
+def test_columnar_fills_missing_fields_with_none():
+    rows = [{"a": 1}, {"a": 2, "b": "x"}, {"b": "y"}]
+    assert columnar({"data": rows}) == {"data": {"count": 3, "columns": {"a": [1, 2, None], "b": [None, "x", "y"]}}}
+    assert columnar([1, 2]) == [1, 2]
+
+
+def test_max_points_averages_buckets():
+    assert reduce_series([1, 2, 3, 4, 5, 6], 3, False) == [1.5, 3.5, 5.5]
+    assert reduce_series([1, None, 3], 1, False) == [2.0]
+    # Short series and geometry are left alone
+    assert reduce_series([1, 2], 3, False) == [1, 2]
+    assert reduce_series({"coordinates": [1, 2, 3]}, 1, False) == {"coordinates": [1, 2, 3]}
+
+
+def test_max_points_merges_records():
+    rows = [{"t": "a", "v": 1}, {"t": "b", "v": 3}, {"t": "c", "v": 5}, {"t": "d", "v": None}]
+    assert reduce_series(rows, 2, False) == [{"t": "a", "v": 2.0}, {"t": "c", "v": 5.0}]
+
+
+def test_max_points_keeps_columns_aligned():
+    columns = {"count": 4, "columns": {"t": ["a", "b", "c", "d"], "v": [1, 3, 5, 7]}}
+    assert reduce_series(columns, 2, False) == {"count": 4, "columns": {"t": ["a", "c"], "v": [2.0, 6.0]}}
+
+
+def test_summarize():
+    assert summary([3, None, 1, float("nan"), 2]) == {"count": 3, "min": 1, "max": 3, "mean": 2.0, "first": 3, "last": 2}
+    fields = reduce_series([{"t": "a", "v": 1}, {"t": "b", "v": 3}], None, True)["fields"]
+    assert fields["v"]["mean"] == 2.0
+    assert fields["t"] == {"count": 2, "first": "a", "last": "b"}
+
+
+def test_shape_applies_projection_layout_then_reduction():
+    shaped_result = shape(RESULT, fields=["data.data.temp"], format="columnar", max_points=1)
+    assert shaped_result == {"data": {"data": {"count": 2, "columns": {"temp": [2.0]}}}}
+    with pytest.raises(ValueError):
+        shape(RESULT, format="csv")
+    with pytest.raises(ValueError):
+        shape(RESULT, max_points=0)
+
+
+def test_shaped_adds_parameters_and_passes_errors_through():
+    async def tool(lat: float, fail: bool = False):
+        return {"error": "upstream down", "data": [1, 2, 3]} if fail else {"data": [1, 2, 3, 4]}
+
+    wrapped = shaped(tool)
+    assert list(inspect.signature(wrapped).parameters) == ["lat", "fail", "fields", "format", "max_points", "summarize"]
+    assert asyncio.run(wrapped(1.0, max_points=2)) == {"data": [1.5, 3.5]}
+    error = asyncio.run(wrapped(1.0, fail=True, max_points=1, fields=["nothing"]))
+    assert error == {"error": "upstream down", "data": [1, 2, 3]}
+    assert asyncio.run(wrapped(1.0, format="csv")) == {"error": "Unknown format 'csv', expected one of json, columnar"}
+
+
+def test_shaped_keeps_a_tools_own_format_argument():
+    async def tool(format: str = "json"):
+        return {"format": format}
+
+    wrapped = shaped(tool)
+    assert [p for p in inspect.signature(wrapped).parameters].count("format") == 1
+    assert asyncio.run(wrapped(format="openmetrics")) == {"format": "openmetrics"}
@@ -0,0 +1,74 @@
+import asyncio
+
+import pytest
+
+from singleflight import SingleFlight
+
+
+def test_concurrent_callers_share_one_call():
+    flight = SingleFlight()
+    calls = 0
+
+    async def fetch():
+        nonlocal calls
+        calls += 1
+        await asyncio.sleep(0.01)
+        return {"calls": calls}
+
+    async def scenario():
+        return await asyncio.gather(*(flight.do("k", fetch) for _ in range(5)))
+
+    results = asyncio.run(scenario())
+    assert calls == 1
+    assert all(r is results[0] for r in results)
+    assert flight.stats() == {"in_flight": 0, "executed": 1, "deduplicated": 4, "dedup_rate": 0.8}
+
+
+def test_different_keys_and_later_calls_run_separately():
+    flight = SingleFlight()
+
+    async def fetch():
+        await asyncio.sleep(0)
+        return 1
+
+    async def scenario():
+        await asyncio.gather(flight.do("a", fetch), flight.do("b", fetch))
+        await flight.do("a", fetch)
+
+    asyncio.run(scenario())
+    assert flight.executed == 3
+    assert flight.deduplicated == 0
+
+
+def test_every_waiter_gets_the_exception():
+    flight = SingleFlight()
+
+    async def fetch():
+        await asyncio.sleep(0.01)
+        raise ValueError("upstream")
+
+    async def scenario():
+        return await asyncio.gather(*(flight.do("k", fetch) for _ in range(3)), return_exceptions=True)
+
+    results = asyncio.run(scenario())
+    assert [type(r) for r in results] == [ValueError] * 3
+    assert flight.executed == 1
+
+
+def test_cancelled_caller_does_not_cancel_the_call_for_others():
+    flight = SingleFlight()
+
+    async def fetch():
+        await asyncio.sleep(0.02)
+        return "done"
+
+    async def scenario():
+        first = asyncio.ensure_future(flight.do("k", fetch))
+        second = asyncio.ensure_future(flight.do("k", fetch))
+        await asyncio.sleep(0.005)
+        first.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await first
+        return await second
+
+    assert asyncio.run(scenario()) == "done"
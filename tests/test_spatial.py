@@ -0,0 +1,84 @@
+import asyncio
+
+import httpx
+import pytest
+
+from cache import response_cache
+from endpoints import spatial
+
+
+@pytest.fixture(autouse=True)
+def empty_cache():
+    asyncio.run(response_cache.clear())
+
+
+class SearchUpstream:
+    """An object search over `total` objects, recording the offsets requested."""
+
+    def __init__(self, total: int):
+        self.total = total
+        self.offsets = []
+
+    def handle(self, request: httpx.Request) -> httpx.Response:
+        limit = int(request.url.params["limit"])
+        offset = int(request.url.params.get("offset", 0))
+        self.offsets.append(offset)
+        ids = range(offset, min(offset + limit, self.total))
+        return httpx.Response(200, json=[{"id": i} for i in ids])
+
+
+def search(upstream, **options):
+    async def scenario():
+        transport = httpx.MockTransport(upstream.handle)
+        async with httpx.AsyncClient(base_url="https://exchange.test", transport=transport) as client:
+            return await spatial.search_all(client, "climate", "era5", **options)
+
+    return asyncio.run(scenario())
+
+
+def pages(upstream, page_size, **options):
+    async def scenario():
+        transport = httpx.MockTransport(upstream.handle)
+        async with httpx.AsyncClient(base_url="https://exchange.test", transport=transport) as client:
+            return [
+                [o["id"] for o in page]
+                async for page in spatial.iter_search_pages(
+                    client, "climate", "era5", page_size=page_size, **options
+                )
+            ]
+
+    return asyncio.run(scenario())
+
+
+def test_small_result_takes_one_request():
+    upstream = SearchUpstream(total=5)
+    assert [o["id"] for o in search(upstream, concurrency=4)] == list(range(5))
+    assert upstream.offsets == [0]
+
+
+def test_pages_come_back_in_order():
+    upstream = SearchUpstream(total=25)
+    assert pages(upstream, page_size=10, concurrency=3) == [list(range(10)), list(range(10, 20)), list(range(20, 25))]
+    assert sorted(upstream.offsets)[:3] == [0, 10, 20]
+
+
+@pytest.mark.parametrize("concurrency", [1, 2, 4])
+def test_read_ahead_is_bounded_by_concurrency(concurrency):
+    upstream = SearchUpstream(total=25)
+    pages(upstream, page_size=10, concurrency=concurrency)
+    # Past the short page only the pages already in flight were requested
+    assert len(upstream.offsets) <= 3 + concurrency - 1
+
+
+def test_max_results_limits_the_last_page():
+    upstream = SearchUpstream(total=100)
+    assert pages(upstream, page_size=10, max_results=25, concurrency=8) == [
+        list(range(10)), list(range(10, 20)), list(range(20, 25))
+    ]
+    assert sorted(upstream.offsets) == [0, 10, 20]
+
+
+def test_exact_multiple_of_the_page_size():
+    upstream = SearchUpstream(total=20)
+    assert pages(upstream, page_size=10, concurrency=1) == [list(range(10)), list(range(10, 20))]
+    assert upstream.offsets == [0, 10, 20]
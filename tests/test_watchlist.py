@@ -0,0 +1,100 @@
+import asyncio
+
+import pytest
+
+import watchlist
+from watchlist import Watchlist
+
+INTERVALS = {"current": 100.0, "alerts": 100.0, "forecast": 100.0}
+
+
+@pytest.fixture
+def watched(monkeypatch, clock):
+    monkeypatch.setattr(watchlist.time, "time", clock)
+    return Watchlist(intervals=INTERVALS, jitter=0.1)
+
+
+def test_take_due_groups_by_product_and_removes_taken(watched, clock):
+    watched.due = {
+        ("current", "a"): clock.now - 1,
+        ("alerts", "a"): clock.now,
+        ("forecast", "a"): clock.now + 50,
+    }
+    assert watched._take_due(clock.now) == {"current": ["a"], "alerts": ["a"]}
+    assert watched.due == {("forecast", "a"): clock.now + 50}
+
+
+def test_take_due_lets_soon_due_locations_join_a_batched_request(watched, clock):
+    watched.due = {
+        ("current", "a"): clock.now,
+        # Within the jitter window (10 s) of a batched product
+        ("current", "b"): clock.now + 5,
+        ("current", "c"): clock.now + 20,
+        # Not batched, so it waits its turn
+        ("alerts", "b"): clock.now + 5,
+    }
+    assert watched._take_due(clock.now) == {"current": ["a", "b"]}
+    assert set(watched.due) == {("current", "c"), ("alerts", "b")}
+
+
+def test_take_due_does_not_batch_when_nothing_is_due(watched, clock):
+    watched.due = {("current", "a"): clock.now + 5}
+    assert watched._take_due(clock.now) == {}
+    assert watched.due == {("current", "a"): clock.now + 5}
+
+
+def test_add_validates_and_schedules_now(watched, clock):
+    location = watched.add("farm", 44.98, -93.26, ["current", "forecast"])
+    assert location["products"] == ["current", "forecast"]
+    assert watched.due == {("current", "farm"): clock.now, ("forecast", "farm"): clock.now}
+    with pytest.raises(ValueError):
+        watched.add("bad", 44.98, -93.26, ["radar"])
+    with pytest.raises(ValueError):
+        watched.add("bad", 91, 0)
+    assert watched.remove("farm") == location
+    assert watched.due == {}
+    assert watched.remove("farm") is None
+
+
+def test_refresh_stores_results_and_reschedules(watched, clock):
+    watched.add("farm", 44.98, -93.26, ["current"])
+    watched.add("field", 45.0, -93.0, ["current"])
+
+    async def fetch(product, locations):
+        return [{"temp": 20} if loc["name"] == "farm" else {"error": "down"} for loc in locations]
+
+    asyncio.run(watched._refresh("current", watched._take_due(clock.now)["current"], fetch))
+    assert watched.results[("current", "farm")] == (clock.now, {"temp": 20})
+    assert watched.errors[("current", "field")] == "down"
+    assert (watched.fetches, watched.failures, watched.requests) == (2, 1, 1)
+    assert clock.now + 90 <= watched.due[("current", "farm")] <= clock.now + 110
+
+
+def test_lookup_serves_fresh_results_only(watched, clock):
+    watched.add("farm", 44.98, -93.26, ["current", "forecast"], days=5)
+    watched.results[("current", "farm")] = (clock.now, {"temp": 20})
+    watched.results[("forecast", "farm")] = (clock.now, {"days": 5})
+    assert watched.lookup("current", 44.98, -93.26)["data"] == {"temp": 20}
+    assert watched.lookup("current", 44.99, -93.26) is None
+    assert watched.lookup("forecast", 44.98, -93.26, days=3) is None
+    clock.advance(201)
+    assert watched.lookup("current", 44.98, -93.26) is None
+    assert watched.served == 1
+
+
+def test_sync_picks_up_other_processes_changes(tmp_path, monkeypatch, clock):
+    monkeypatch.setattr(watchlist.time, "time", clock)
+    path = tmp_path / "watchlist.json"
+    writer = Watchlist(str(path), INTERVALS)
+    writer.add("farm", 44.98, -93.26, ["alerts"])
+    # Refreshes of locations found at startup are spread over the jitter window
+    reader = Watchlist(str(path), INTERVALS, jitter=0.1)
+    assert clock.now <= reader.due[("alerts", "farm")] <= clock.now + 10
+    # Later additions are due right away, and removals are dropped
+    writer.add("field", 45.0, -93.0, ["current"])
+    writer.remove("farm")
+    # Both writes can land within the file system's timestamp resolution
+    reader._mtime -= 1
+    reader.sync()
+    assert list(reader.locations) == ["field"]
+    assert reader.due == {("current", "field"): clock.now}
@@ -0,0 +1,131 @@
+import asyncio
+from datetime import date, timedelta
+
+import httpx
+import pytest
+
+from cache import ResponseCache
+from endpoints import base, weather
+from history import HistoryStore
+
+
+def days(start: str, count: int):
+    first = date.fromisoformat(start)
+    return [first + timedelta(days=i) for i in range(count)]
+
+
+def test_history_chunks_never_cross_a_boundary():
+    # Chunks start on day ordinals that are multiples of chunk_days
+    boundary = date.fromordinal(date(2020, 1, 1).toordinal() // 7 * 7)
+    start, end = boundary - timedelta(days=3), boundary + timedelta(days=9)
+    chunks = weather._history_chunks(days(start.isoformat(), 12), 7)
+    assert chunks == [(start, boundary), (boundary, boundary + timedelta(days=7)), (boundary + timedelta(days=7), end)]
+
+
+def test_history_chunks_split_at_gaps():
+    missing = days("2020-01-01", 2) + days("2020-01-05", 1)
+    assert weather._history_chunks(missing, 31) == [
+        (date(2020, 1, 1), date(2020, 1, 3)),
+        (date(2020, 1, 5), date(2020, 1, 6)),
+    ]
+    assert weather._history_chunks([], 31) == []
+
+
+class HistoryUpstream:
+    """Daily history with one record per day, counting the days it was asked for."""
+
+    def __init__(self):
+        self.requests = []
+
+    def handle(self, request: httpx.Request) -> httpx.Response:
+        start = date.fromisoformat(request.url.params["start_date"])
+        end = date.fromisoformat(request.url.params["end_date"])
+        self.requests.append((start, end))
+        data = [{"datetime": d.isoformat(), "temp": d.day} for d in days(start.isoformat(), (end - start).days)]
+        return httpx.Response(200, json={"city_name": "Minneapolis", "lat": 44.98, "lon": -93.26, "data": data})
+
+
+@pytest.fixture
+def upstream(monkeypatch):
+    monkeypatch.setattr(weather, "history_store", HistoryStore(max_bytes=1 << 20))
+    return HistoryUpstream()
+
+
+def history(upstream, start, end):
+    async def scenario():
+        transport = httpx.MockTransport(upstream.handle)
+        async with httpx.AsyncClient(base_url="https://exchange.test", transport=transport) as client:
+            return await weather.get_history_range(client, 44.98, -93.26, start, end)
+
+    return asyncio.run(scenario())
+
+
+def test_history_range_fetches_only_the_gap(upstream):
+    first = history(upstream, "2020-01-10", "2020-01-20")
+    assert first["count"] == 10
+    assert first["days_cached"] == 0
+    assert first["city_name"] == "Minneapolis"
+    upstream.requests.clear()
+
+    # Both sides of the cached days, across the 31-day chunk boundary on 2020-02-04
+    second = history(upstream, "2020-01-05", "2020-02-05")
+    assert [r["datetime"] for r in second["data"]] == [d.isoformat() for d in days("2020-01-05", 31)]
+    assert second["days_cached"] == 10
+    fetched = sorted(d for start, end in upstream.requests for d in days(start.isoformat(), (end - start).days))
+    assert fetched == days("2020-01-05", 5) + days("2020-01-20", 16)
+    for start, end in upstream.requests:
+        assert (start.toordinal() // 31) == ((end.toordinal() - 1) // 31)
+
+
+def test_history_range_rejects_bad_input(upstream):
+    with pytest.raises(ValueError):
+        history(upstream, "2020-01-10", "2020-01-10")
+    with pytest.raises(ValueError):
+        asyncio.run(weather.get_history_range(None, 0, 0, "2020-01-01", "2020-01-02", product="weekly"))
+
+
+def test_match_points_by_position_when_counts_agree():
+    observations = [{"id": 1}, {"id": 2}]
+    assert weather._match_points([(0, 0), (1, 1)], observations) == observations
+
+
+def test_match_points_pairs_closest_first_and_uses_each_observation_once():
+    points = [(44.98, -93.26), (44.99, -93.25), (10.0, 10.0)]
+    # One observation close to both Minneapolis points, one far from everything
+    near = {"lat": 44.99, "lon": -93.25}
+    far = {"lat": -30.0, "lon": 150.0}
+    assert weather._match_points(points, [near, far]) == [None, near, None]
+
+
+def test_match_points_ignores_observations_without_coordinates():
+    assert weather._match_points([(0, 0), (1, 1)], [{"lat": None}]) == [None, None]
+
+
+def test_distance_km():
+    # One degree of latitude is about 111.2 km
+    assert weather._distance_km(0, 0, 1, 0) == pytest.approx(111.19, abs=0.01)
+    assert weather._distance_km(10, 20, 10, 20) == 0.0
+
+
+def test_prefetched_current_conditions_answer_single_point_lookups(monkeypatch, tmp_path):
+    # Two response caches on one directory stand in for the leader and another worker
+    leader = ResponseCache(10, 1 << 20, str(tmp_path), disk_max_bytes=1 << 20)
+    worker = ResponseCache(10, 1 << 20, str(tmp_path), disk_max_bytes=1 << 20)
+    requests = []
+
+    def handle(request: httpx.Request) -> httpx.Response:
+        requests.append(dict(request.url.params))
+        return httpx.Response(200, json={"count": 2, "data": [{"lat": 44.98, "temp": 1}, {"lat": 45.5, "temp": 2}]})
+
+    async def scenario(cache, call):
+        monkeypatch.setattr(base, "response_cache", cache)
+        async with httpx.AsyncClient(base_url="https://exchange.test", transport=httpx.MockTransport(handle)) as client:
+            return await call(client)
+
+    locations = [{"latitude": 44.98, "longitude": -93.26}, {"latitude": 45.5, "longitude": -94.0}]
+    prefetched = asyncio.run(scenario(leader, lambda client: weather.prefetch(client, "current", locations)))
+    assert requests == [{"points": "(44.98, -93.26),(45.5, -94.0)"}]
+
+    current = asyncio.run(scenario(worker, lambda client: weather.get_current(client, 45.5, -94.0)))
+    assert current == prefetched[1] == {"count": 1, "data": [{"lat": 45.5, "temp": 2}]}
+    assert len(requests) == 1
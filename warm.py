@@ -0,0 +1,223 @@
+#!/usr/bin/env python3
+"""
+Warm-start mode for the stdio MCP server
+
+`python warm.py serve` starts a long-lived parent process that imports the
+heavy dependencies (mcp, pydantic, httpx, NumPy) once and listens on a Unix
+socket. MCP hosts then launch `python warm.py attach` instead of the server.
+The attach launcher uses only the standard library, so it starts quickly. It
+hands its stdin/stdout/stderr and environment to the parent over the socket.
+The parent forks a child that adopts them and runs the server, so the host
+talks to the child directly with no proxying. The launcher waits for the child
+and exits with its status. When no warm parent is listening, attach runs the
+server in-process.
+
+The launcher must stay fast, so this module does not import config.py and
+reads its socket path straight from the environment (GEMS_WARM_SOCKET).
+Unix only.
+"""
+import json
+import os
+import signal
+import socket
+import struct
+import sys
+import traceback
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+DEFAULT_SOCKET = str(Path.home() / ".cache" / "gems-exchange" / "warm.sock")
+
+# Imported by the warm parent before any child is forked. config.py and server.py are
+# left to the children, which must see the environment of the host that launched them.
+PRELOAD_MODULES = (
+    "mcp.server.fastmcp",
+    "mcp.server.stdio",
+    "pydantic",
+    "httpx",
+    "httpcore",
+    "anyio",
+    "dotenv",
+    "sqlite3",
+    "orjson",
+    "numpy",
+    "tifffile",
+)
+
+# Header sent with the file descriptors: payload length
+_HEADER = struct.Struct("!I")
+
+
+def socket_path() -> str:
+    return os.getenv("GEMS_WARM_SOCKET", DEFAULT_SOCKET)
+
+
+def preload() -> List[str]:
+    """Import the shared dependencies. Returns the modules that are not installed."""
+    missing = []
+    for name in PRELOAD_MODULES:
+        try:
+            __import__(name)
+        except ImportError:
+            missing.append(name)
+    return missing
+
+
+def serve(path: str) -> None:
+    """Accept launcher connections and fork a server child for each."""
+    missing = preload()
+    Path(path).parent.mkdir(parents=True, exist_ok=True)
+    if os.path.exists(path):
+        os.unlink(path)
+    listener = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    listener.bind(path)
+    os.chmod(path, 0o600)
+    listener.listen(64)
+    # Children are never waited on; let the kernel reap them
+    signal.signal(signal.SIGCHLD, signal.SIG_IGN)
+    print(f"Warm server listening on {path}" + (f" (not installed: {', '.join(missing)})" if missing else ""), file=sys.stderr)
+    try:
+        while True:
+            conn, _ = listener.accept()
+            try:
+                request = _receive(conn)
+            except (OSError, ValueError) as e:
+                print(f"Rejected launcher connection: {e}", file=sys.stderr)
+                conn.close()
+                continue
+            if os.fork() == 0:
+                listener.close()
+                signal.signal(signal.SIGCHLD, signal.SIG_DFL)
+                _run_child(conn, request)
+            conn.close()
+            for fd in request["fds"]:
+                os.close(fd)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        listener.close()
+        if os.path.exists(path):
+            os.unlink(path)
+
+
+def _receive(conn: socket.socket) -> Dict[str, Any]:
+    header, fds, _, _ = socket.recv_fds(conn, _HEADER.size, 3)
+    if len(header) != _HEADER.size or len(fds) != 3:
+        for fd in fds:
+            os.close(fd)
+        raise ValueError("expected a header and three file descriptors")
+    (length,) = _HEADER.unpack(header)
+    payload = b""
+    while len(payload) < length:
+        chunk = conn.recv(length - len(payload))
+        if not chunk:
+            raise ValueError("launcher closed the connection early")
+        payload += chunk
+    request = json.loads(payload)
+    request["fds"] = fds
+    return request
+
+
+def _run_child(conn: socket.socket, request: Dict[str, Any]) -> None:
+    """Adopt the launcher's stdio, environment and working directory, then run the server."""
+    status = 1
+    try:
+        for target, fd in enumerate(request["fds"]):
+            os.dup2(fd, target)
+            os.close(fd)
+        # The parent's own stdio may have been closed or redirected when it started
+        sys.stdin = open(0, "r", closefd=False)
+        sys.stdout = open(1, "w", closefd=False)
+        sys.stderr = open(2, "w", buffering=1, closefd=False)
+        os.environ.clear()
+        os.environ.update(request["env"])
+        os.chdir(request["cwd"])
+        sys.path.insert(0, str(Path(__file__).resolve().parent))
+        conn.sendall(_HEADER.pack(os.getpid()))
+        import server
+        server.main()
+        status = 0
+    except SystemExit as e:
+        status = e.code if isinstance(e.code, int) else 1
+    except BaseException:
+        traceback.print_exc()
+    finally:
+        # Never return into the parent's accept loop
+        try:
+            for stream in (sys.stdout, sys.stderr):
+                try:
+                    stream.flush()
+                except (OSError, ValueError):
+                    pass
+            conn.sendall(bytes([status & 0xFF]))
+        except OSError:
+            pass
+        finally:
+            os._exit(status)
+
+
+def attach(path: str) -> int:
+    """Hand this process's stdio to a warm server child and wait for it to exit."""
+    conn = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        conn.connect(path)
+    except OSError:
+        conn.close()
+        return _run_in_process()
+
+    payload = json.dumps({"env": dict(os.environ), "cwd": os.getcwd()}).encode()
+    socket.send_fds(conn, [_HEADER.pack(len(payload))], [0, 1, 2])
+    conn.sendall(payload)
+    # The child has the host's pipes now; this process only relays signals and the exit status
+    pid_bytes = _recv_exact(conn, _HEADER.size)
+    if pid_bytes is None:
+        return 1
+    (child,) = _HEADER.unpack(pid_bytes)
+
+    def forward(signum: int, frame: Any) -> None:
+        try:
+            os.kill(child, signum)
+        except ProcessLookupError:
+            pass
+
+    for signum in (signal.SIGTERM, signal.SIGINT, signal.SIGHUP):
+        signal.signal(signum, forward)
+    status = _recv_exact(conn, 1)
+    return status[0] if status else 1
+
+
+def _recv_exact(conn: socket.socket, size: int) -> Optional[bytes]:
+    data = b""
+    while len(data) < size:
+        try:
+            chunk = conn.recv(size - len(data))
+        except InterruptedError:
+            continue
+        if not chunk:
+            return None
+        data += chunk
+    return data
+
+
+def _run_in_process() -> int:
+    sys.path.insert(0, str(Path(__file__).resolve().parent))
+    import server
+    server.main()
+    return 0
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    argv = sys.argv[1:] if argv is None else argv
+    command = argv[0] if argv else "attach"
+    path = argv[1] if len(argv) > 1 else socket_path()
+    if command == "serve":
+        serve(path)
+        return 0
+    if command == "attach":
+        return attach(path)
+    print("usage: warm.py [serve|attach] [socket path]", file=sys.stderr)
+    return 2
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,333 @@
+"""
+Watched locations with prefetched weather
+
+A Watchlist holds named locations that are refreshed in the background, so
+weather tools can answer for them from memory. Each location lists the products
+to keep warm: "current", "alerts" and "forecast". Each product has its own
+refresh interval (GEMS_WATCH_INTERVAL_*).
+
+The scheduler keeps a due time per (product, location). Intervals are jittered
+by +/- GEMS_WATCH_JITTER, and the first refresh after startup is spread over
+that fraction of the interval, so locations drift apart instead of all
+refreshing together. When one location is due for a batched product (current
+conditions, which have a multi-point route), every location due within the
+jitter window is fetched in the same request.
+
+Locations are persisted as JSON in GEMS_WATCHLIST_FILE, and changes made by
+other worker processes are picked up from it. Results are served from memory
+while they are at most two intervals old. Only one HTTP worker runs the
+scheduler; the others answer watched locations from the shared response cache.
+"""
+import asyncio
+import json
+import logging
+import os
+import random
+import time
+from datetime import datetime, timezone
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Sequence, Set, Tuple
+
+from config import Config
+
+logger = logging.getLogger(__name__)
+
+PRODUCTS = ("current", "alerts", "forecast")
+# Products fetched for many locations in one upstream request
+BATCHED = frozenset({"current"})
+# Coordinates are matched after rounding (~0.1 m)
+COORDINATE_DECIMALS = 6
+# Seconds between checks of the watchlist file when other processes may change it
+SYNC_INTERVAL = 5.0
+
+Fetch = Callable[[str, List[Dict[str, Any]]], Awaitable[Sequence[Any]]]
+
+
+def _iso(timestamp: float) -> str:
+    return datetime.fromtimestamp(timestamp, timezone.utc).isoformat(timespec="seconds")
+
+
+def _point(lat: float, lon: float) -> Tuple[float, float]:
+    return round(float(lat), COORDINATE_DECIMALS), round(float(lon), COORDINATE_DECIMALS)
+
+
+class Watchlist:
+    """Watched locations, their refresh schedule and their latest results."""
+
+    def __init__(
+        self,
+        path: str = "",
+        intervals: Optional[Dict[str, float]] = None,
+        jitter: float = 0.1,
+        max_locations: int = 500
+    ):
+        self.path = path
+        self.intervals = intervals or {"current": 600.0, "alerts": 120.0, "forecast": 3600.0}
+        self.jitter = min(max(jitter, 0.0), 0.9)
+        self.max_locations = max_locations
+        self.locations: Dict[str, Dict[str, Any]] = {}
+        self._by_point: Dict[Tuple[float, float], Set[str]] = {}
+        # (product, name) -> (fetched_at, value) and the last error
+        self.results: Dict[Tuple[str, str], Tuple[float, Any]] = {}
+        self.errors: Dict[Tuple[str, str], str] = {}
+        self.due: Dict[Tuple[str, str], float] = {}
+        self._tasks: Set["asyncio.Task[None]"] = set()
+        self._wake: Optional[asyncio.Event] = None
+        self.running = False
+        self.fetches = 0
+        self.requests = 0
+        self.failures = 0
+        self.served = 0
+        self._mtime: Optional[int] = None
+        self.sync()
+
+    @classmethod
+    def from_config(cls) -> "Watchlist":
+        """Create a watchlist using the settings in Config."""
+        return cls(Config.WATCHLIST_FILE, Config.WATCH_INTERVALS, Config.WATCH_JITTER, Config.WATCH_MAX_LOCATIONS)
+
+    def sync(self) -> None:
+        """
+        Pick up changes other worker processes made to the watchlist file.
+
+        Locations seen for the first time after startup are refreshed right away.
+        At startup, the first refreshes are spread over the jitter window instead.
+        """
+        if not self.path:
+            return
+        try:
+            mtime = os.stat(self.path).st_mtime_ns
+        except OSError:
+            return
+        if mtime == self._mtime:
+            return
+        try:
+            with open(self.path) as f:
+                saved = json.load(f)
+        except (OSError, ValueError) as e:
+            logger.info("Could not read watchlist %s: %s", self.path, e)
+            return
+        startup = self._mtime is None
+        self._mtime = mtime
+        locations = {}
+        for location in saved.get("locations", []):
+            location["products"] = [p for p in location.get("products", PRODUCTS) if p in PRODUCTS]
+            locations[location["name"]] = location
+        for name in list(self.locations):
+            if name not in locations:
+                self._drop(name)
+        now = time.time()
+        for name, location in locations.items():
+            if self.locations.get(name) == location:
+                continue
+            self._drop(name)
+            self._put(location)
+            for product in location["products"]:
+                spread = random.uniform(0, self.jitter * self.intervals[product]) if startup else 0.0
+                self.due[(product, name)] = now + spread
+        if not startup and self._wake is not None:
+            self._wake.set()
+
+    def _save(self) -> None:
+        if not self.path:
+            return
+        tmp_path = f"{self.path}.{os.getpid()}.tmp"
+        try:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            with open(tmp_path, "w") as f:
+                json.dump({"locations": list(self.locations.values())}, f, indent=1)
+            os.replace(tmp_path, self.path)
+            self._mtime = os.stat(self.path).st_mtime_ns
+        except OSError as e:
+            logger.info("Could not write watchlist %s: %s", self.path, e)
+
+    def _put(self, location: Dict[str, Any]) -> None:
+        self.locations[location["name"]] = location
+        self._by_point.setdefault(_point(location["latitude"], location["longitude"]), set()).add(location["name"])
+
+    def _drop(self, name: str) -> Optional[Dict[str, Any]]:
+        location = self.locations.pop(name, None)
+        if location is None:
+            return None
+        point = _point(location["latitude"], location["longitude"])
+        names = self._by_point.get(point, set())
+        names.discard(name)
+        if not names:
+            self._by_point.pop(point, None)
+        for product in PRODUCTS:
+            self.results.pop((product, name), None)
+            self.errors.pop((product, name), None)
+            self.due.pop((product, name), None)
+        return location
+
+    def add(
+        self,
+        name: str,
+        lat: float,
+        lon: float,
+        products: Optional[Sequence[str]] = None,
+        days: int = 5
+    ) -> Dict[str, Any]:
+        """Watch a location (replacing one of the same name) and refresh it right away."""
+        self.sync()
+        products = list(dict.fromkeys(products or PRODUCTS))
+        unknown = [p for p in products if p not in PRODUCTS]
+        if unknown:
+            raise ValueError(f"Unknown products {unknown}, expected some of {', '.join(PRODUCTS)}")
+        if not (-90 <= lat <= 90 and -180 <= lon <= 180):
+            raise ValueError("latitude must be within -90..90 and longitude within -180..180")
+        if name not in self.locations and len(self.locations) >= self.max_locations:
+            raise ValueError(f"The watchlist is full ({self.max_locations} locations)")
+        self._drop(name)
+        location = {"name": name, "latitude": lat, "longitude": lon, "products": products, "days": days}
+        self._put(location)
+        now = time.time()
+        for product in products:
+            self.due[(product, name)] = now
+        self._save()
+        if self._wake is not None:
+            self._wake.set()
+        return location
+
+    def remove(self, name: str) -> Optional[Dict[str, Any]]:
+        """Stop watching a location. Returns it, or None when it was not watched."""
+        self.sync()
+        location = self._drop(name)
+        if location is not None:
+            self._save()
+        return location
+
+    def lookup(self, product: str, lat: float, lon: float, days: Optional[int] = None) -> Optional[Dict[str, Any]]:
+        """
+        Get the prefetched result of a watched location, with its freshness, or
+        None when the location is not watched or its result is too old.
+        """
+        names = self._by_point.get(_point(lat, lon))
+        if not names:
+            return None
+        max_age = 2 * self.intervals[product]
+        now = time.time()
+        for name in names:
+            if product == "forecast" and self.locations[name]["days"] != days:
+                continue
+            entry = self.results.get((product, name))
+            if entry is not None and now - entry[0] <= max_age:
+                self.served += 1
+                return {"data": entry[1], "fetched_at": _iso(entry[0]), "age_seconds": round(now - entry[0], 1)}
+        return None
+
+    def _schedule(self, product: str, name: str, start: float) -> None:
+        interval = self.intervals[product]
+        self.due[(product, name)] = start + interval * random.uniform(1 - self.jitter, 1 + self.jitter)
+
+    def _take_due(self, now: float) -> Dict[str, List[str]]:
+        """Remove and return the (product, location) pairs to refresh now, grouped by product."""
+        ready: Dict[str, List[str]] = {}
+        for (product, name), due in self.due.items():
+            if due <= now:
+                ready.setdefault(product, []).append(name)
+        for product in BATCHED & ready.keys():
+            # Locations due soon ride along in the same multi-point request
+            window = now + self.jitter * self.intervals[product]
+            taken = set(ready[product])
+            ready[product].extend(
+                name for (p, name), due in self.due.items() if p == product and now < due <= window and name not in taken
+            )
+        for product, names in ready.items():
+            for name in names:
+                del self.due[(product, name)]
+        return ready
+
+    async def _refresh(self, product: str, names: List[str], fetch: Fetch) -> None:
+        locations = [self.locations[name] for name in names if name in self.locations]
+        if not locations:
+            return
+        self.requests += 1
+        try:
+            values: Sequence[Any] = await fetch(product, locations)
+        except Exception as e:
+            values = [e] * len(locations)
+        fetched_at = time.time()
+        for location, value in zip(locations, values):
+            name = location["name"]
+            if self.locations.get(name) is not location:
+                # Removed or replaced while the request ran
+                continue
+            self.fetches += 1
+            if isinstance(value, Exception) or (isinstance(value, dict) and "error" in value):
+                # The previous result is kept until it is too old to serve
+                self.failures += 1
+                self.errors[(product, name)] = str(value["error"] if isinstance(value, dict) else value)
+            else:
+                self.results[(product, name)] = (fetched_at, value)
+                self.errors.pop((product, name), None)
+            self._schedule(product, name, fetched_at)
+        if self._wake is not None:
+            # The loop may be sleeping past the new due times
+            self._wake.set()
+
+    async def run(self, fetch: Fetch, sync_interval: Optional[float] = None) -> None:
+        """
+        Refresh watched locations as they come due, until cancelled. With
+        sync_interval, the watchlist file is checked at least that often for
+        changes made by other processes.
+        """
+        self._wake = asyncio.Event()
+        self.running = True
+        try:
+            while True:
+                if sync_interval:
+                    self.sync()
+                now = time.time()
+                for product, names in self._take_due(now).items():
+                    task = asyncio.create_task(self._refresh(product, names, fetch))
+                    self._tasks.add(task)
+                    task.add_done_callback(self._tasks.discard)
+                self._wake.clear()
+                delay = min(self.due.values(), default=now + 3600) - now
+                if sync_interval:
+                    delay = min(delay, sync_interval)
+                try:
+                    await asyncio.wait_for(self._wake.wait(), timeout=max(0.0, delay))
+                except asyncio.TimeoutError:
+                    pass
+        finally:
+            self.running = False
+            self._wake = None
+            for task in list(self._tasks):
+                task.cancel()
+
+    def describe(self) -> List[Dict[str, Any]]:
+        """Watched locations with the freshness and next refresh of each product."""
+        self.sync()
+        now = time.time()
+        described = []
+        for name, location in self.locations.items():
+            products = {}
+            for product in location["products"]:
+                entry = self.results.get((product, name))
+                due = self.due.get((product, name))
+                products[product] = {
+                    "fetched_at": _iso(entry[0]) if entry else None,
+                    "age_seconds": round(now - entry[0], 1) if entry else None,
+                    "next_refresh_seconds": round(max(0.0, due - now), 1) if due is not None else None,
+                    "error": self.errors.get((product, name)),
+                }
+            described.append({**location, "status": products})
+        return described
+
+    def stats(self) -> Dict[str, Any]:
+        """Get watchlist size and refresh counters."""
+        return {
+            "locations": len(self.locations),
+            "results": len(self.results),
+            "running": self.running,
+            "in_flight": len(self._tasks),
+            "requests": self.requests,
+            "fetches": self.fetches,
+            "failures": self.failures,
+            "served": self.served,
+        }
+
+
+# Shared watchlist
+weather_watchlist = Watchlist.from_config()
@@ -0,0 +1,81 @@
+"""
+Coordination between HTTP worker processes
+
+With GEMS_WORKERS > 1, several processes serve one port. Each has its own HTTP
+client, memory cache and metrics. They share the disk cache and the rate-limit
+buckets through files in GEMS_CACHE_DIR and GEMS_SHARED_STATE_DIR.
+
+Background jobs that should run once per deployment (watchlist prefetch, the
+catalog schedule, the metrics file) run in whichever worker holds an exclusive
+lock on a file in GEMS_SHARED_STATE_DIR. The lock is released when that worker
+exits, and another worker takes it over.
+"""
+import asyncio
+import fcntl
+import logging
+import os
+from pathlib import Path
+from typing import Callable, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# Seconds between attempts to take over the lock
+RETRY_INTERVAL = 5.0
+
+
+class LeaderLock:
+    """An exclusive, non-blocking lock on a file, held until release() or process exit."""
+
+    def __init__(self, directory: str):
+        path = Path(directory).expanduser()
+        path.mkdir(parents=True, exist_ok=True)
+        self.path = path / "leader.lock"
+        self._fd: Optional[int] = None
+
+    @property
+    def held(self) -> bool:
+        return self._fd is not None
+
+    def try_acquire(self) -> bool:
+        """Take the lock if no other process holds it."""
+        if self._fd is not None:
+            return True
+        fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            os.close(fd)
+            return False
+        # The holder's pid, for operators
+        os.ftruncate(fd, 0)
+        os.write(fd, f"{os.getpid()}\n".encode())
+        self._fd = fd
+        return True
+
+    def release(self) -> None:
+        """Release the lock if held."""
+        if self._fd is not None:
+            fcntl.flock(self._fd, fcntl.LOCK_UN)
+            os.close(self._fd)
+            self._fd = None
+
+
+async def lead(lock: Optional[LeaderLock], start: Callable[[], List["asyncio.Task[None]"]]) -> None:
+    """
+    Wait until this process holds lock (immediately when lock is None), then run
+    the tasks made by start() until cancelled.
+    """
+    while lock is not None and not lock.try_acquire():
+        await asyncio.sleep(RETRY_INTERVAL)
+    if lock is not None:
+        logger.info("Worker %d runs the background jobs", os.getpid())
+    tasks = start()
+    try:
+        await asyncio.gather(*tasks)
+    finally:
+        for task in tasks:
+            task.cancel()
+        # Let the tasks finish their cleanup before another worker takes over
+        await asyncio.gather(*tasks, return_exceptions=True)
+        if lock is not None:
+            lock.release()